@@ -1,16 +1,83 @@
-from fastapi import APIRouter, Response, HTTPException
-from fastapi.responses import JSONResponse
+import asyncio
+import hashlib
+import logging
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
 
+import numpy as np
+from fastapi import APIRouter, Header, Query, Request, Response, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+
+from app.config import (
+    DEFAULT_PRODUCT,
+    QUERY_MAX_POINTS,
+    REGISTRY_POLL_INTERVAL,
+    STATS_MAX_BBOXES,
+    TILE_CACHE_MAX_BYTES,
+    TILE_RENDER_WORKERS,
+    TILE_MAX_PENDING,
+    TILE_RETRY_AFTER,
+)
+from app.services import metrics
+from app.services.colormap import BAND_OPEN_BOUND
+from app.services.metrics import (
+    TILE_BYTES_SERVED,
+    TILE_REQUEST_SECONDS,
+    TILE_RESPONSES,
+    CallbackMetric,
+)
+from app.services.products import ENABLED_PRODUCTS
+from app.services.render_queue import RenderQueue, RenderQueueFull
 from app.services.tile_renderer import TileRenderer
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter()
 
-# Shared tile renderer instance
-tile_renderer = TileRenderer()
+# Shared tile renderer per product, splitting the tile cache budget; routes
+# without a product name serve the default product's
+tile_renderers = {
+    name: TileRenderer(
+        product=product,
+        cache_bytes=TILE_CACHE_MAX_BYTES // len(ENABLED_PRODUCTS),
+    )
+    for name, product in ENABLED_PRODUCTS.items()
+}
+tile_renderer = tile_renderers[DEFAULT_PRODUCT]
+
+
+async def watch_generations():
+    """
+    Background task: follow every product's manifest off the event loop.
+
+    Refreshing reads the manifest and opens the new generation's pool on a
+    worker thread, so a generation switch never stalls requests; handlers
+    only read the references it swaps in.
+    """
+    while True:
+        for renderer in tile_renderers.values():
+            try:
+                await asyncio.to_thread(renderer.refresh)
+            except Exception as e:
+                logger.warning(f"Refresh of {renderer.product.name} failed: {e}")
+        await asyncio.sleep(REGISTRY_POLL_INTERVAL)
+
+
+# Renders run off the event loop; identical concurrent requests share one render
+render_queue = RenderQueue(
+    max_workers=TILE_RENDER_WORKERS,
+    max_pending=TILE_MAX_PENDING,
+)
+
+# Cache lifetimes for tiles on the unversioned and versioned routes
+TILE_MAX_AGE = 60
+VERSIONED_TILE_MAX_AGE = 31536000
 
-# Will be set by main.py
-current_timestamp = None
-data_bounds = {
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+
+# Reported until the first generation is published
+DEFAULT_BOUNDS = {
     "west": -130.0,
     "south": 20.0,
     "east": -60.0,
@@ -19,63 +86,608 @@ data_bounds = {
 
 
 @router.get("/tiles/{z}/{x}/{y}.png")
-async def get_tile(z: int, x: int, y: int) -> Response:
+async def get_tile(
+    z: int, x: int, y: int, if_none_match: Optional[str] = Header(None)
+) -> Response:
     """
-    XYZ tile endpoint for radar data.
+    XYZ tile endpoint for radar data of the default product.
 
     Returns a 256x256 PNG tile with radar reflectivity data.
     Supports zoom levels 0-12 (weather data doesn't need more detail).
+    Always serves the latest data, so it is only cached briefly.
+    """
+    return await get_product_tile(DEFAULT_PRODUCT, z, x, y, if_none_match)
+
+
+@router.get("/tiles/{timestamp:int}/{z}/{x}/{y}.png")
+async def get_versioned_tile(
+    timestamp: int,
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """XYZ tile of one animation frame of the default product."""
+    return await get_versioned_product_tile(
+        DEFAULT_PRODUCT, timestamp, z, x, y, if_none_match
+    )
+
+
+@router.get("/tiles/{product}/{z}/{x}/{y}.png")
+async def get_product_tile(
+    product: str,
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    XYZ tile of one product (a name from /api/products), colored with the
+    product's ramp. Always serves the latest data, so it is only cached
+    briefly.
+    """
+    start = time.perf_counter()
+    content = await _render_tile(_tile_renderer(product), z, x, y)
+    return _tile_response(
+        content, f"public, max-age={TILE_MAX_AGE}", if_none_match, start
+    )
+
+
+@router.get("/tiles/{product}/{timestamp:int}/{z}/{x}/{y}.png")
+async def get_versioned_product_tile(
+    product: str,
+    timestamp: int,
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    XYZ tile of one animation frame (a timestamp_unix from /api/metadata).
+
+    A frame's data never changes, so its tiles are served as immutable.
+    Timestamps that are not (or no longer) in the loop get the latest data
+    with the short lifetime of the unversioned route.
+    """
+    start = time.perf_counter()
+    renderer = _tile_renderer(product)
+    frame = renderer.registry.frame(timestamp)
+
+    if frame is None:
+        content = await _render_tile(renderer, z, x, y)
+        cache_control = f"public, max-age={TILE_MAX_AGE}"
+    else:
+        content = await _render_tile(renderer, z, x, y, frame.id)
+        cache_control = f"public, max-age={VERSIONED_TILE_MAX_AGE}, immutable"
+    return _tile_response(content, cache_control, if_none_match, start)
+
+
+async def _render_tile(
+    renderer: TileRenderer, z: int, x: int, y: int, frame: Optional[float] = None
+) -> bytes:
+    """
+    Validate tile coordinates and return the tile, rendering on a miss.
+
+    frame is a past frame's generation id; None renders the current data.
     """
-    # Validate zoom level
+    _validate_tile(z, x, y)
+    generation = renderer.generation
+    content = renderer.get_cached_tile(z, x, y, frame)
+    if content is not None:
+        return content
+
+    try:
+        return await render_queue.run(
+            (renderer.product.name, frame or generation, z, x, y),
+            renderer.get_tile, z, x, y, frame,
+        )
+    except RenderQueueFull:
+        TILE_RESPONSES.inc(label_value="503")
+        raise HTTPException(
+            status_code=503,
+            detail="Tile renderer busy, retry shortly",
+            headers={"Retry-After": str(TILE_RETRY_AFTER)},
+        )
+
+
+@router.get("/vtiles/{z}/{x}/{y}.mvt")
+async def get_vector_tile(
+    z: int, x: int, y: int, if_none_match: Optional[str] = Header(None)
+) -> Response:
+    """XYZ vector tile of the default product's band contours."""
+    return await get_product_vector_tile(DEFAULT_PRODUCT, z, x, y, if_none_match)
+
+
+@router.get("/vtiles/{product}/{z}/{x}/{y}.mvt")
+async def get_product_vector_tile(
+    product: str,
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+) -> Response:
+    """
+    XYZ vector tile of a product's band contours (Mapbox Vector Tile).
+
+    One layer named after the product with a polygon feature per visible
+    color band, carrying band, min_{value_key}, max_{value_key} (e.g.
+    min_dbz; no max on the open-ended top band) and color. Tiles without
+    echoes have an empty body. Always serves the latest data, so it is only
+    cached briefly.
+    """
+    start = time.perf_counter()
+    renderer = _tile_renderer(product)
+    _validate_tile(z, x, y)
+    generation = renderer.generation
+    content = renderer.get_cached_vector_tile(z, x, y)
+    if content is None:
+        try:
+            content = await render_queue.run(
+                ("mvt", product, generation, z, x, y),
+                renderer.get_vector_tile, z, x, y,
+            )
+        except RenderQueueFull:
+            TILE_RESPONSES.inc(label_value="503")
+            raise HTTPException(
+                status_code=503,
+                detail="Tile renderer busy, retry shortly",
+                headers={"Retry-After": str(TILE_RETRY_AFTER)},
+            )
+    if content is None:
+        TILE_RESPONSES.inc(label_value="404")
+        raise HTTPException(
+            status_code=404, detail="No vector tiles for the current data"
+        )
+    return _tile_response(
+        content, f"public, max-age={TILE_MAX_AGE}", if_none_match, start,
+        media_type=MVT_MEDIA_TYPE,
+    )
+
+
+def _renderer(product: Optional[str]) -> TileRenderer:
+    """The product's renderer (the default one for None); 404 if unknown."""
+    if product is None:
+        return tile_renderer
+    renderer = tile_renderers.get(product)
+    if renderer is None:
+        raise HTTPException(status_code=404, detail=f"Unknown product {product}")
+    return renderer
+
+
+def _tile_renderer(product: str) -> TileRenderer:
+    """_renderer for the tile routes, which count their 404s."""
+    try:
+        return _renderer(product)
+    except HTTPException:
+        TILE_RESPONSES.inc(label_value="404")
+        raise
+
+
+def _validate_tile(z: int, x: int, y: int):
+    """Reject zooms outside 0-14 and coordinates outside the zoom's grid."""
     if z < 0 or z > 14:
+        TILE_RESPONSES.inc(label_value="400")
         raise HTTPException(status_code=400, detail="Invalid zoom level (0-14)")
 
-    # Validate tile coordinates
     max_tile = 2**z
     if x < 0 or x >= max_tile or y < 0 or y >= max_tile:
+        TILE_RESPONSES.inc(label_value="400")
         raise HTTPException(status_code=400, detail="Invalid tile coordinates")
 
-    content = tile_renderer.get_tile(z, x, y)
 
-    return Response(
-        content=content,
-        media_type="image/png",
-        headers={
-            "Cache-Control": "public, max-age=60",
-            "Access-Control-Allow-Origin": "*",
-        },
+def _tile_response(
+    content: bytes,
+    cache_control: str,
+    if_none_match: Optional[str],
+    start: float,
+    media_type: str = "image/png",
+) -> Response:
+    """
+    Build a tile response with a strong ETag derived from the tile bytes.
+
+    Identical tiles share an ETag across generations, so a revalidation of
+    an unchanged tile (e.g. an empty one) costs a 304 instead of a body.
+    start is the request's perf_counter start, for the latency histogram.
+    """
+    etag = f'"{hashlib.blake2b(content, digest_size=12).hexdigest()}"'
+    headers = {
+        "Cache-Control": cache_control,
+        "ETag": etag,
+        "Access-Control-Allow-Origin": "*",
+    }
+
+    if if_none_match is not None and _etag_matches(etag, if_none_match):
+        TILE_RESPONSES.inc(label_value="304")
+        TILE_REQUEST_SECONDS.observe(time.perf_counter() - start)
+        return Response(status_code=304, headers=headers)
+
+    TILE_RESPONSES.inc(label_value="200")
+    TILE_BYTES_SERVED.inc(len(content))
+    TILE_REQUEST_SECONDS.observe(time.perf_counter() - start)
+    return Response(content=content, media_type=media_type, headers=headers)
+
+
+def _etag_matches(etag: str, if_none_match: str) -> bool:
+    """If-None-Match uses weak comparison, so a W/ prefix is ignored."""
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@router.get("/api/products")
+async def get_products() -> JSONResponse:
+    """
+    The products served, default first, each with its units and legend: the
+    value range and color of every visible band. /api/value(s) return raw
+    values, so values below the first legend entry (drawn transparent) are
+    still numbers.
+    """
+    return JSONResponse(
+        {
+            "default": DEFAULT_PRODUCT,
+            "products": [
+                {
+                    "name": product.name,
+                    "title": product.title,
+                    "units": product.units,
+                    "value_key": product.value_key,
+                    "tiles": f"/tiles/{product.name}/{{z}}/{{x}}/{{y}}.png",
+                    "legend": [
+                        {
+                            "min": low,
+                            "max": None if high >= BAND_OPEN_BOUND else high,
+                            "color": f"#{r:02x}{g:02x}{b:02x}",
+                        }
+                        for (low, high, (r, g, b, _)), visible in zip(
+                            product.ramp.bands, product.ramp.visible
+                        )
+                        if visible
+                    ],
+                }
+                for product in ENABLED_PRODUCTS.values()
+            ],
+        }
     )
 
 
 @router.get("/api/metadata")
-async def get_metadata() -> JSONResponse:
+async def get_metadata(product: Optional[str] = None) -> JSONResponse:
     """
-    Return current data timestamp for cache busting.
+    Return current data timestamp for cache busting, of the given product
+    or the default one.
 
     Frontend polls this endpoint to detect new data.
     """
-    if current_timestamp is None:
+    renderer = _renderer(product)
+    registry = renderer.registry
+    published = registry.published
+    if published is None:
         return JSONResponse(
             {
+                "product": renderer.product.name,
                 "timestamp": None,
                 "timestamp_unix": None,
                 "status": "no_data",
                 "message": "No radar data available yet. Data is being fetched...",
-                "bounds": data_bounds,
+                "bounds": DEFAULT_BOUNDS,
+                "frames": [],
             }
         )
 
     return JSONResponse(
         {
-            "timestamp": current_timestamp.isoformat(),
-            "timestamp_unix": int(current_timestamp.timestamp()),
+            "product": renderer.product.name,
+            "timestamp": published.timestamp,
+            "timestamp_unix": published.timestamp_unix,
             "status": "ok",
-            "bounds": data_bounds,
+            "bounds": published.bounds,
+            # Oldest first; each is served on /tiles/[{product}/]{timestamp_unix}/...
+            "frames": [
+                {"timestamp": f.timestamp, "timestamp_unix": f.timestamp_unix}
+                for f in registry.frames
+            ],
+        }
+    )
+
+
+@router.get("/api/value")
+async def get_value(
+    lat: float, lon: float, product: Optional[str] = None
+) -> JSONResponse:
+    """
+    Value at one point of the latest data of the product (default:
+    reflectivity in dBZ), keyed by the product's value_key (e.g. dbz).
+
+    The value is the raw value, including clear-air and negative values
+    that are drawn transparent (e.g. -9.4 dBZ). It is null where there is
+    no data or the point is outside the grid; with COLOR_INDEX_ENABLED only
+    band lower bounds are stored, and the transparent band is null too.
+    """
+    renderer = _renderer(product)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise HTTPException(status_code=400, detail="lat/lon out of range")
+
+    values = await asyncio.to_thread(
+        renderer.sample_points, np.array([lon]), np.array([lat])
+    )
+    if values is None:
+        return _no_data_response()
+    return JSONResponse(
+        {
+            "lat": lat,
+            "lon": lon,
+            renderer.product.value_key: _value_list(values)[0],
+            "units": renderer.product.units,
+            "timestamp": renderer.registry.current.timestamp,
+        }
+    )
+
+
+@router.post("/api/values")
+async def post_values(
+    request: Request, product: Optional[str] = None
+) -> JSONResponse:
+    """
+    Values at many points, or along a route, of the latest data of the
+    product (default: reflectivity in dBZ).
+
+    The body is {"points": [[lon, lat], ...]} for a batch of points, or
+    {"polyline": [[lon, lat], ...]} for a route, which is sampled once per
+    grid pixel it crosses and answered with each sample's position and
+    distance along the route. Coordinates are in GeoJSON (lon, lat) order.
+    Raw values are listed under the product's value_key (e.g. dbz), null
+    where there is no data or outside the grid, as for GET /api/value.
+    """
+    renderer = _renderer(product)
+    value_key = renderer.product.value_key
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    if not isinstance(body, dict) or ("points" in body) == ("polyline" in body):
+        raise HTTPException(
+            status_code=400, detail='Body needs one of "points" or "polyline"'
+        )
+
+    key = "points" if "points" in body else "polyline"
+    coordinates = _parse_coordinates(body[key], key)
+
+    if key == "points":
+        values = await asyncio.to_thread(
+            renderer.sample_points, coordinates[:, 0], coordinates[:, 1]
+        )
+        if values is None:
+            return _no_data_response()
+        result = {value_key: _value_list(values)}
+    else:
+        try:
+            route = await asyncio.to_thread(
+                renderer.sample_route, coordinates, QUERY_MAX_POINTS
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if route is None:
+            return _no_data_response()
+        points, distances, values = route
+        result = {
+            "points": points.round(5).tolist(),
+            "distance_km": distances.round(3).tolist(),
+            value_key: _value_list(values),
+        }
+
+    return JSONResponse(
+        {
+            "count": len(result[value_key]),
+            "units": renderer.product.units,
+            "timestamp": renderer.registry.current.timestamp,
+            **result,
         }
     )
 
 
+def _parse_coordinates(value, key: str) -> np.ndarray:
+    """Validate a [[lon, lat], ...] list into an (n, 2) float array."""
+    malformed = f"{key} must be [[lon, lat], ...]"
+    try:
+        coordinates = np.asarray(value, dtype=np.float64)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail=malformed)
+    if coordinates.ndim != 2 or coordinates.shape[1] != 2 or not len(coordinates):
+        raise HTTPException(status_code=400, detail=malformed)
+    if len(coordinates) > QUERY_MAX_POINTS:
+        raise HTTPException(
+            status_code=400, detail=f"At most {QUERY_MAX_POINTS} {key} per request"
+        )
+    lons, lats = coordinates[:, 0], coordinates[:, 1]
+    if not ((np.abs(lons) <= 180).all() and (np.abs(lats) <= 90).all()):
+        raise HTTPException(status_code=400, detail="lat/lon out of range")
+    return coordinates
+
+
+def _value_list(values: np.ndarray) -> List[Optional[float]]:
+    """Values rounded to 0.1 for JSON, with NaN as null."""
+    return [
+        None if v != v else v for v in values.astype(np.float64).round(1).tolist()
+    ]
+
+
+@router.get("/api/stats")
+async def get_stats(
+    bbox: List[str] = Query(...), product: Optional[str] = None
+) -> JSONResponse:
+    """
+    Aggregates of the latest data of the product over one or more bounding
+    boxes.
+
+    Each bbox parameter is "west,south,east,north"; repeat it for several.
+    Per bbox: pixel count, pixels with data, the max value (max_dbz for
+    reflectivity), and the count and fraction of pixels at or above every
+    color band threshold of the product.
+    """
+    renderer = _renderer(product)
+    bboxes = []
+    for value in bbox:
+        try:
+            bboxes.append([float(v) for v in value.split(",")])
+        except ValueError:
+            raise HTTPException(
+                status_code=400, detail="bbox must be west,south,east,north"
+            )
+    return await _region_stats(renderer, bboxes)
+
+
+@router.post("/api/stats")
+async def post_stats(
+    request: Request, product: Optional[str] = None
+) -> JSONResponse:
+    """
+    Aggregates over many bounding boxes at once.
+
+    The body is {"bboxes": [[west, south, east, north], ...]}; the answer
+    lists the same aggregates as GET /api/stats, in order.
+    """
+    renderer = _renderer(product)
+    try:
+        body = await request.json()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    if not isinstance(body, dict) or not isinstance(body.get("bboxes"), list):
+        raise HTTPException(status_code=400, detail='Body needs "bboxes"')
+    return await _region_stats(renderer, body["bboxes"])
+
+
+async def _region_stats(renderer: TileRenderer, bboxes: list) -> JSONResponse:
+    parsed = [_parse_bbox(bbox) for bbox in bboxes]
+    if not parsed or len(parsed) > STATS_MAX_BBOXES:
+        raise HTTPException(
+            status_code=400, detail=f"Give 1 to {STATS_MAX_BBOXES} bboxes"
+        )
+
+    results = await asyncio.to_thread(renderer.region_stats, parsed)
+    if results is None:
+        return _no_data_response()
+    return JSONResponse(
+        {
+            "units": renderer.product.units,
+            "timestamp": renderer.registry.current.timestamp,
+            "regions": results,
+        }
+    )
+
+
+def _parse_bbox(value) -> Tuple[float, float, float, float]:
+    """Validate [west, south, east, north] in degrees."""
+    try:
+        west, south, east, north = (float(v) for v in value)
+    except (TypeError, ValueError):
+        raise HTTPException(
+            status_code=400, detail="bbox must be [west, south, east, north]"
+        )
+    if not (-180 <= west <= east <= 180 and -90 <= south <= north <= 90):
+        raise HTTPException(status_code=400, detail=f"Invalid bbox {value}")
+    return west, south, east, north
+
+
+def _no_data_response() -> JSONResponse:
+    return JSONResponse(
+        {"status": "no_data", "message": "No radar data available yet."},
+        status_code=503,
+    )
+
+
 @router.get("/api/health")
 async def health_check() -> JSONResponse:
-    """Health check endpoint."""
-    return JSONResponse({"status": "healthy"})
+    """Health check endpoint, with tile cache counters per product."""
+    return JSONResponse(
+        {
+            "status": "healthy",
+            "tile_cache": {
+                name: renderer.cache_stats()
+                for name, renderer in tile_renderers.items()
+            },
+        }
+    )
+
+
+def _data_age() -> Dict[str, float]:
+    """Seconds since each product's published frame's timestamp."""
+    ages = {}
+    for name, renderer in tile_renderers.items():
+        published = renderer.registry.published
+        if published is None or published.timestamp is None:
+            continue
+        timestamp = datetime.fromisoformat(published.timestamp)
+        ages[name] = time.time() - timestamp.timestamp()
+    return ages
+
+
+def _cache_counter(name: str):
+    return lambda: {
+        product: renderer.cache_stats()[name]
+        for product, renderer in tile_renderers.items()
+    }
+
+
+# Read at scrape time, so serving tiles pays nothing for them
+for _name, _doc in (
+    ("hits", "Tile cache hits."),
+    ("misses", "Tile cache misses."),
+    ("evictions", "Tiles evicted from the cache for space."),
+    ("expirations", "Tiles dropped with their generation."),
+):
+    metrics.REGISTRY.register(
+        CallbackMetric(
+            f"radar_tile_cache_{_name}_total",
+            _doc,
+            _cache_counter(_name),
+            "counter",
+            label="product",
+        )
+    )
+metrics.REGISTRY.register(
+    CallbackMetric(
+        "radar_tile_cache_bytes",
+        "Tile cache memory use.",
+        _cache_counter("bytes"),
+        label="product",
+    )
+)
+metrics.REGISTRY.register(
+    CallbackMetric(
+        "radar_tile_cache_entries",
+        "Tiles in the cache.",
+        _cache_counter("entries"),
+        label="product",
+    )
+)
+metrics.REGISTRY.register(
+    CallbackMetric(
+        "radar_render_queue_pending",
+        "Distinct tile renders queued or running.",
+        lambda: render_queue.pending,
+    )
+)
+metrics.REGISTRY.register(
+    CallbackMetric(
+        "radar_data_age_seconds",
+        "Seconds between now and the published data's timestamp.",
+        _data_age,
+        label="product",
+    )
+)
+
+
+@router.get("/metrics")
+async def get_metrics() -> PlainTextResponse:
+    """
+    Prometheus metrics: ingest and tile stage timings, tile cache counters,
+    bytes served and data age.
+
+    Counters are per process; with several server workers, scrape each one.
+    """
+    return PlainTextResponse(
+        metrics.REGISTRY.render(),
+        media_type="text/plain; version=0.0.4; charset=utf-8",
+    )
@@ -20,19 +20,154 @@ DATA_DIR = Path(os.getenv("DATA_DIR", BASE_DIR / "data"))
 DATA_DIR.mkdir(parents=True, exist_ok=True)
 
 # NOAA MRMS settings
-# Note: URL redirects from /data/2D/ to /2D/
-NOAA_BASE_URL = "https://mrms.ncep.noaa.gov/2D/ReflectivityAtLowestAltitude/"
-NOAA_LATEST_FILE = "MRMS_ReflectivityAtLowestAltitude.latest.grib2.gz"
+# Note: URL redirects from /data/2D/ to /2D/; each product is a directory below
+NOAA_MRMS_URL = os.getenv("NOAA_MRMS_URL", "https://mrms.ncep.noaa.gov/2D/")
+
+# Products fetched, ingested and served (see app/services/products.py), e.g.
+# "reflectivity,composite,precip_rate,echo_tops"; each adds its own fetch,
+# ingest, warm-up and disk use. The first is the default product, served on
+# the routes without a product name
+PRODUCTS = [
+    name.strip()
+    for name in os.getenv("PRODUCTS", "reflectivity").split(",")
+    if name.strip()
+]
+DEFAULT_PRODUCT = PRODUCTS[0]
 
 # Polling interval in seconds (2 minutes)
 POLL_INTERVAL = int(os.getenv("POLL_INTERVAL", 10))
 
-# File paths
-LATEST_GEOTIFF = DATA_DIR / "latest_radar.tif"
+# Fetch frames missed between polls from the product directory listing
+FETCH_BACKFILL_ENABLED = os.getenv("FETCH_BACKFILL_ENABLED", "false").lower() == "true"
+FETCH_BACKFILL_CONCURRENCY = int(os.getenv("FETCH_BACKFILL_CONCURRENCY", 4))
+
+# GRIB2 decoder: "eccodes" reads the single message directly, "cfgrib" goes
+# through xarray; eccodes falls back to cfgrib on files it cannot handle
+GRIB_DECODER = os.getenv("GRIB_DECODER", "eccodes").lower()
+
+# GeoTIFF output profile. GEOTIFF_LAYOUT "gtiff" writes the original striped
+# file with overviews appended, "cog" tiled Cloud-Optimized GeoTIFFs in one
+# pass. COG overviews are sized by successive halving rather than per level,
+# so low-zoom (z1-z2) tiles differ slightly from gtiff output.
+# GEOTIFF_COMPRESS: deflate, zstd, lzw (with a predictor) or none.
+# GEOTIFF_DBZ_STEP > 0 stores dBZ rounded to that step (MRMS native is 0.5);
+# products in other units are stored unrounded
+GEOTIFF_LAYOUT = os.getenv("GEOTIFF_LAYOUT", "gtiff").lower()
+GEOTIFF_COMPRESS = os.getenv("GEOTIFF_COMPRESS", "deflate").lower()
+GEOTIFF_BLOCKSIZE = int(os.getenv("GEOTIFF_BLOCKSIZE", 512))
+GEOTIFF_DBZ_STEP = float(os.getenv("GEOTIFF_DBZ_STEP", 0))
+
+# Every ingest writes its artifacts into a new directory under its product's
+# PRODUCTS_DIR/<name>/generations; the product's manifest.json names the
+# generation being served and is replaced atomically. Serving processes
+# re-check it at most every REGISTRY_POLL_INTERVAL seconds. The newest
+# KEEP_GENERATIONS directories per product are kept so workers that have not
+# switched yet still read valid files
+PRODUCTS_DIR = DATA_DIR / "products"
+REGISTRY_POLL_INTERVAL = float(os.getenv("REGISTRY_POLL_INTERVAL", 0.5))
+KEEP_GENERATIONS = int(os.getenv("KEEP_GENERATIONS", 3))
+
+# Animation loop: the last FRAME_COUNT published generations of each product
+# stay available on /tiles/[{product}/]{timestamp}/..., as long as their
+# artifacts fit FRAME_DISK_BUDGET_MB (per product). Each process keeps handles
+# open for at most FRAME_OPEN_MAX past frames per product; their tiles share
+# the tile cache budget, evicted before current tiles
+FRAME_COUNT = int(os.getenv("FRAME_COUNT", 12))
+FRAME_DISK_BUDGET = int(os.getenv("FRAME_DISK_BUDGET_MB", 2048)) * 1024 * 1024
+FRAME_OPEN_MAX = int(os.getenv("FRAME_OPEN_MAX", 4))
+
+# Artifact file names inside a generation directory
+GEOTIFF_NAME = "radar.tif"
+MERCATOR_GEOTIFF_NAME = "radar_3857.tif"
+COVERAGE_INDEX_NAME = "coverage.npz"
+REGION_STATS_NAME = "stats.npz"
+CONTOURS_NAME = "contours.npz"
+SHARED_GRID_HEADER_NAME = "grid.json"
+
+# Publish each generation's grid and overviews as memory-mapped .npy arrays
+# that every serving worker maps read-only; tiles are then cut from the shared
+# arrays with no GDAL reads
+SHARED_GRID_ENABLED = os.getenv("SHARED_GRID_ENABLED", "false").lower() == "true"
+
+# Pre-warp each ingest to Web Mercator so most tiles are served by slicing
+# in-memory arrays instead of warping per tile
+WEB_MERCATOR_ENABLED = os.getenv("WEB_MERCATOR_ENABLED", "false").lower() == "true"
+
+# Store uint8 color-band indices at ingest instead of float dBZ; tiles are then
+# encoded as 8-bit palette PNGs with no colormap pass
+COLOR_INDEX_ENABLED = os.getenv("COLOR_INDEX_ENABLED", "false").lower() == "true"
+
+# Index of tiles with visible echoes, so empty tiles skip the raster entirely
+COVERAGE_INDEX_ENABLED = os.getenv("COVERAGE_INDEX_ENABLED", "true").lower() == "true"
+
+# Summed-area tables and a max pyramid per generation, for /api/stats
+REGION_STATS_ENABLED = os.getenv("REGION_STATS_ENABLED", "true").lower() == "true"
+
+# Band contour polygons per generation, served as vector tiles on /vtiles;
+# zooms up to VECTOR_TILE_MAX_ZOOM get their own simplification level and
+# cached tiles, deeper zooms are clipped from the finest level
+VECTOR_TILES_ENABLED = os.getenv("VECTOR_TILES_ENABLED", "true").lower() == "true"
+VECTOR_TILE_MAX_ZOOM = int(os.getenv("VECTOR_TILE_MAX_ZOOM", 6))
 
-# Keep last N GRIB2 files for debugging
+# Deepest zoom with its own coverage bitmap; deeper tiles use their ancestor
+COVERAGE_MAX_ZOOM = int(os.getenv("COVERAGE_MAX_ZOOM", 12))
+
+# Highest zoom served from the pre-warped raster; deeper zooms warp from source
+WEB_MERCATOR_MAX_ZOOM = int(os.getenv("WEB_MERCATOR_MAX_ZOOM", 8))
+
+# In-memory tile cache budget (MB), split evenly between products, and deepest
+# zoom whose tiles are never evicted
+TILE_CACHE_MAX_BYTES = int(os.getenv("TILE_CACHE_MAX_MB", 256)) * 1024 * 1024
+TILE_CACHE_PIN_MAX_ZOOM = int(os.getenv("TILE_CACHE_PIN_MAX_ZOOM", 6))
+
+# On a miss at METATILE_MIN_ZOOM or deeper, render a METATILE_SIZE x
+# METATILE_SIZE block (power of two) from one read and cache every tile in it
+METATILE_SIZE = int(os.getenv("METATILE_SIZE", 4))
+METATILE_MIN_ZOOM = int(os.getenv("METATILE_MIN_ZOOM", 6))
+
+# Pre-render this zoom range after each ingest, before publishing the new
+# timestamp; warming gives up after TILE_WARM_TIME_BUDGET seconds
+TILE_WARM_ENABLED = os.getenv("TILE_WARM_ENABLED", "true").lower() == "true"
+TILE_WARM_MIN_ZOOM = int(os.getenv("TILE_WARM_MIN_ZOOM", 3))
+TILE_WARM_MAX_ZOOM = int(os.getenv("TILE_WARM_MAX_ZOOM", 7))
+TILE_WARM_WORKERS = int(os.getenv("TILE_WARM_WORKERS", 2))
+TILE_WARM_TIME_BUDGET = float(os.getenv("TILE_WARM_TIME_BUDGET", 30))
+
+# Second-tier tile cache shared by all local workers: "none" or "sqlite".
+# Warm-up renders in the ingest process, and only the shared store carries
+# its tiles to the other workers, so it defaults to sqlite while warm-up is on
+TILE_STORE = os.getenv("TILE_STORE", "sqlite" if TILE_WARM_ENABLED else "none").lower()
+TILE_STORE_PATH = DATA_DIR / "tiles.sqlite"
+
+# Keep last N GRIB2 files per product for debugging
 MAX_GRIB_FILES = 5
 
+# Only one process per DATA_DIR fetches and ingests, elected by a lock on
+# INGEST_LOCK_PATH; the other uvicorn workers just serve the manifest.
+# INGEST_ENABLED=false keeps a process out of the election entirely.
+INGEST_ENABLED = os.getenv("INGEST_ENABLED", "true").lower() == "true"
+INGEST_LOCK_PATH = DATA_DIR / "ingest.lock"
+
+# Ingest worker processes; products convert in parallel up to this many
+INGEST_WORKERS = int(
+    os.getenv("INGEST_WORKERS", min(len(PRODUCTS), os.cpu_count() or 1))
+)
+
+# Tile rendering runs on a thread pool so GDAL work never blocks the event loop
+TILE_RENDER_WORKERS = int(os.getenv("TILE_RENDER_WORKERS", os.cpu_count() or 4))
+
+# Max distinct tiles waiting to render before new requests are shed with a 503
+TILE_MAX_PENDING = int(os.getenv("TILE_MAX_PENDING", 256))
+
+# Retry-After (seconds) sent with shed tile requests
+TILE_RETRY_AFTER = int(os.getenv("TILE_RETRY_AFTER", 1))
+
+# Most points (or route samples) answered by one /api/values request
+QUERY_MAX_POINTS = int(os.getenv("QUERY_MAX_POINTS", 100000))
+
+# Most bounding boxes aggregated by one /api/stats request
+STATS_MAX_BBOXES = int(os.getenv("STATS_MAX_BBOXES", 5000))
+
 # CORS settings - comma-separated list of allowed origins
 DEFAULT_ORIGINS = "http://localhost:5173,http://localhost:3000,http://127.0.0.1:5173,http://127.0.0.1:3000"
 ALLOWED_ORIGINS = [
@@ -5,17 +5,36 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
+from typing import Dict
+
+import aiohttp
+
 from app.api import routes
-from app.services.fetcher import MRMSFetcher
-from app.services.grib_processor import GRIBProcessor
-from app.config import POLL_INTERVAL, ALLOWED_ORIGINS
+from app.services.fetcher import MRMSFetcher, create_session
+from app.services.ingest import IngestLock, IngestPipeline
+from app.services.products import ENABLED_PRODUCTS, Product
+from app.services.registry import Generation
+from app.services.tile_warmer import TileWarmer
+from app.config import (
+    POLL_INTERVAL,
+    INGEST_ENABLED,
+    INGEST_LOCK_PATH,
+    ALLOWED_ORIGINS,
+    TILE_STORE,
+    TILE_WARM_ENABLED,
+    TILE_WARM_MIN_ZOOM,
+    TILE_WARM_MAX_ZOOM,
+    TILE_WARM_WORKERS,
+    TILE_WARM_TIME_BUDGET,
+)
 
 
 # Filter to suppress tile request logs
 class TileRequestFilter(logging.Filter):
     def filter(self, record: logging.LogRecord) -> bool:
-        # Filter out GET requests to /tiles/
-        return "/tiles/" not in record.getMessage()
+        # Filter out GET requests to /tiles/ and /vtiles/
+        message = record.getMessage()
+        return "/tiles/" not in message and "/vtiles/" not in message
 
 
 # Configure logging
@@ -29,71 +48,138 @@ logger = logging.getLogger(__name__)
 logging.getLogger("uvicorn.access").addFilter(TileRequestFilter())
 
 # Global service instances
-fetcher: MRMSFetcher = None
-processor: GRIBProcessor = None
-
-
-async def process_new_data():
-    """Background task that watches for new GRIB2 files and processes them."""
-    global fetcher, processor
-
-    last_processed = None
-
+fetchers: Dict[str, MRMSFetcher] = {}
+session: aiohttp.ClientSession = None
+pipeline: IngestPipeline = None
+warmer: TileWarmer = None
+
+
+async def publish_new_data(product: Product, generation: Generation):
+    """Called by the ingest pipeline once a file has been converted."""
+    renderer = routes.tile_renderers[product.name]
+    registry = renderer.registry
+
+    if await asyncio.to_thread(registry.is_past, generation):
+        # A backfilled or skipped frame only fills its slot in the animation
+        # loop; nothing to stage or warm
+        await asyncio.to_thread(registry.publish, generation)
+        logger.info(f"Frame added: {product.name} {generation.timestamp}")
+        return
+
+    # Every worker starts rendering the new generation, but clients only
+    # learn about it once low zooms are warm
+    await asyncio.to_thread(registry.stage, generation)
+    if warmer:
+        await warmer.warm(renderer, generation.bounds)
+
+    await asyncio.to_thread(registry.publish, generation)
+    logger.info(f"Data updated: {product.name} {generation.timestamp}")
+
+
+async def run_ingest(lock: IngestLock):
+    """
+    Background task: fetch, convert, warm and publish while holding the
+    ingest lock. Until then (another worker holds it) wait and retry, so a
+    worker takes over if the ingesting one exits. If ingest fails, its
+    services are torn down, the lock released and the election re-entered.
+    """
     while True:
-        try:
-            # Check if there's a new file to process
-            if fetcher.current_file and fetcher.current_file != last_processed:
-                result = processor.process_grib(fetcher.current_file)
-
-                if result:
-                    # Update the timestamp in routes module
-                    routes.current_timestamp = fetcher.current_timestamp
-                    last_processed = fetcher.current_file
-                    logger.info(
-                        f"Data updated: {fetcher.current_timestamp.isoformat()}"
-                    )
+        while not lock.acquire():
+            await asyncio.sleep(POLL_INTERVAL)
+        logger.info("Holding the ingest lock; this process fetches and publishes")
 
+        try:
+            await _ingest()
         except Exception as e:
-            logger.error(f"Processing error: {e}")
+            logger.error(f"Ingest failed, restarting: {e}")
+        finally:
+            lock.release()
+        await asyncio.sleep(POLL_INTERVAL)
+
+
+async def _ingest():
+    """Run the fetchers, ingest pipeline and warmer until one of them fails."""
+    global session, pipeline, warmer
+
+    # One fetcher per product, all polling over one pooled session and
+    # feeding one ingest pipeline
+    pipeline = IngestPipeline(publish_new_data)
+    session = create_session(len(ENABLED_PRODUCTS))
+    fetchers.clear()
+    for name, product in ENABLED_PRODUCTS.items():
+        fetchers[name] = MRMSFetcher(
+            pipeline.queues[name],
+            product,
+            session,
+            backfill_queue=pipeline.backfill_queues[name],
+        )
+    warmer = None
+    if TILE_WARM_ENABLED:
+        warmer = TileWarmer(
+            min_zoom=TILE_WARM_MIN_ZOOM,
+            max_zoom=TILE_WARM_MAX_ZOOM,
+            workers=TILE_WARM_WORKERS,
+            time_budget=TILE_WARM_TIME_BUDGET,
+        )
+
+    tasks = [
+        asyncio.create_task(fetcher.start_polling()) for fetcher in fetchers.values()
+    ]
+    tasks.append(asyncio.create_task(pipeline.run()))
+    logger.info(f"Background tasks started (polling every {POLL_INTERVAL}s)")
 
-        await asyncio.sleep(5)  # Check every 5 seconds
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for fetcher in fetchers.values():
+            fetcher.stop()
+        for task in tasks:
+            task.cancel()
+        # Collects the failure that ended gather() too, without re-raising
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+        await session.close()
+        pipeline.shutdown()
+        if warmer:
+            warmer.shutdown()
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan manager for startup/shutdown."""
-    global fetcher, processor
-
     logger.info("Starting Weather Radar Tile Server...")
     logger.info(f"CORS allowed origins: {ALLOWED_ORIGINS}")
-
-    # Initialize services
-    fetcher = MRMSFetcher()
-    processor = GRIBProcessor()
-
-    # Start background tasks
-    polling_task = asyncio.create_task(fetcher.start_polling())
-    processing_task = asyncio.create_task(process_new_data())
-
-    logger.info(f"Background tasks started (polling every {POLL_INTERVAL}s)")
+    logger.info(f"Products: {', '.join(ENABLED_PRODUCTS)}")
+
+    # Every worker serves, following the manifests off the event loop; at
+    # most one at a time ingests
+    watch_task = asyncio.create_task(routes.watch_generations())
+    ingest_task = None
+    if INGEST_ENABLED:
+        ingest_task = asyncio.create_task(run_ingest(IngestLock(INGEST_LOCK_PATH)))
+        if TILE_WARM_ENABLED and TILE_STORE == "none":
+            logger.warning(
+                "Tile warm-up with TILE_STORE=none only warms the ingesting "
+                "worker's cache; with several workers set TILE_STORE=sqlite"
+            )
+    else:
+        logger.info("Ingest disabled; serving the published manifest only")
 
     yield
 
     # Shutdown
     logger.info("Shutting down...")
-    fetcher.stop()
-    polling_task.cancel()
-    processing_task.cancel()
+    for task in (ingest_task, watch_task):
+        if task:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
 
-    try:
-        await polling_task
-    except asyncio.CancelledError:
-        pass
-
-    try:
-        await processing_task
-    except asyncio.CancelledError:
-        pass
+    routes.render_queue.shutdown()
+    for renderer in routes.tile_renderers.values():
+        renderer.close()
 
 
 # Create FastAPI app
@@ -109,7 +195,7 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["GET"],
+    allow_methods=["GET", "POST"],
     allow_headers=["*"],
 )
 
@@ -124,8 +210,14 @@ async def root():
         "name": "Weather Radar Tile Server",
         "version": "1.0.0",
         "endpoints": {
-            "tiles": "/tiles/{z}/{x}/{y}.png",
+            "products": "/api/products",
+            "tiles": "/tiles/[{product}/]{z}/{x}/{y}.png",
+            "vector_tiles": "/vtiles/[{product}/]{z}/{x}/{y}.mvt",
             "metadata": "/api/metadata",
+            "value": "/api/value?lat={lat}&lon={lon}",
+            "values": "/api/values",
+            "stats": "/api/stats?bbox={west},{south},{east},{north}",
             "health": "/api/health",
+            "metrics": "/metrics",
         },
     }
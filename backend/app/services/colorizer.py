@@ -0,0 +1,122 @@
+import io
+import threading
+from typing import Tuple
+
+import numpy as np
+from PIL import Image
+
+from app.services.colormap import REFLECTIVITY_RAMP, ColorRamp
+
+
+def _float32_key(value: np.float32) -> int:
+    """Map a float32 to an int that sorts in the same order."""
+    bits = int(np.array(value, dtype=np.float32).view(np.int32))
+    return bits if bits >= 0 else -(bits & 0x7FFFFFFF)
+
+
+def _float32_from_key(key: int) -> np.float32:
+    bits = key if key >= 0 else (-key) | -0x80000000
+    return np.array(bits, dtype=np.int32).view(np.float32)[()]
+
+
+def _first_value_scaling_to(ramp: ColorRamp, scaled: int) -> np.float32:
+    """Smallest float32 value that ramp.rescale maps to scaled or above."""
+    lo = _float32_key(np.float32(ramp.value_min))
+    hi = _float32_key(np.float32(ramp.value_max))
+    while lo < hi:
+        mid = (lo + hi) // 2
+        value = np.array([_float32_from_key(mid)], dtype=np.float32)
+        if ramp.rescale(value)[0] >= scaled:
+            hi = mid
+        else:
+            lo = mid + 1
+    return _float32_from_key(lo)
+
+
+def build_band_thresholds(
+    ramp: ColorRamp = REFLECTIVITY_RAMP,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Express a ramp's rescale + band lookup as value thresholds.
+
+    Returns (thresholds, colors): a pixel's color is colors[k], where k is
+    the number of thresholds at or below its value. Each threshold is
+    the exact float32 where rio-tiler's 0-255 rescale first reaches a scaled
+    value whose band differs from the one below, so bucketizing raw values
+    gives the same colors as rescaling and applying the discrete colormap.
+    """
+    lut = ramp.lut
+    steps = [0] + [s for s in range(1, 256) if lut[s] != lut[s - 1]]
+    thresholds = np.array(
+        [_first_value_scaling_to(ramp, s) for s in steps[1:]], dtype=np.float32
+    )
+    colors = np.array([ramp.bands[lut[s]][2] for s in steps], dtype=np.uint8)
+    return thresholds, colors
+
+
+DBZ_THRESHOLDS, THRESHOLD_COLORS = build_band_thresholds()
+
+
+class Colorizer:
+    """
+    Colors float tiles of one ramp with threshold compares and a table lookup.
+
+    Replaces ImageData.rescale + render(colormap=DISCRETE_COLORMAP), which
+    allocates float64 temporaries and a colormap table per tile. Every step
+    writes into buffers reused per thread and tile shape, and masked pixels
+    are folded into the lookup as the first (fully transparent) step. The
+    PNG encoder copies the RGBA buffer before it is reused.
+    """
+
+    def __init__(self, ramp: ColorRamp = REFLECTIVITY_RAMP):
+        if ramp is REFLECTIVITY_RAMP:
+            self.thresholds, self.colors = DBZ_THRESHOLDS, THRESHOLD_COLORS
+        else:
+            self.thresholds, self.colors = build_band_thresholds(ramp)
+        self._local = threading.local()
+
+    def _buffers(self, shape: Tuple[int, int]) -> Tuple[np.ndarray, ...]:
+        buffers = getattr(self._local, "buffers", None)
+        if buffers is None or buffers[0].shape != shape:
+            buffers = (
+                np.empty(shape, dtype=np.uint8),  # step index
+                np.empty(shape, dtype=bool),  # compare scratch
+                np.empty(shape + (4,), dtype=np.uint8),  # RGBA
+            )
+            self._local.buffers = buffers
+        return buffers
+
+    def colorize(self, array: np.ma.MaskedArray) -> np.ndarray:
+        """
+        Return the (height, width, 4) RGBA image of a (1, height, width) tile.
+
+        The result is this thread's buffer, overwritten by the next call.
+        """
+        data = np.ma.getdata(array)[0]
+        steps, above, rgba = self._buffers(data.shape)
+
+        # With 16 thresholds, compares into a bool buffer beat searchsorted,
+        # which allocates an intp result. NaN compares False: step 0
+        steps.fill(0)
+        for threshold in self.thresholds:
+            np.greater_equal(data, threshold, out=above)
+            np.add(steps, above, out=steps, casting="unsafe")
+
+        mask = np.ma.getmask(array)
+        if mask is not np.ma.nomask:
+            # Step 0 is (0, 0, 0, 0), as rio-tiler renders masked pixels
+            np.putmask(steps, mask[0], 0)
+
+        np.take(self.colors, steps, axis=0, out=rgba)
+        return rgba
+
+    def render_png(self, array: np.ma.MaskedArray) -> bytes:
+        """Colorize a float tile and encode it as an RGBA PNG."""
+        return self.encode_png(self.colorize(array))
+
+    @staticmethod
+    def encode_png(rgba: np.ndarray) -> bytes:
+        """Encode a (height, width, 4) RGBA image as PNG."""
+        buffer = io.BytesIO()
+        Image.fromarray(rgba, mode="RGBA").save(buffer, format="PNG")
+        return buffer.getvalue()
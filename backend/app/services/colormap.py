@@ -0,0 +1,182 @@
+import numpy as np
+
+# Reflectivity range mapped onto the 0-255 colormap
+# MRMS reflectivity typically -10 to 80 dBZ
+DBZ_MIN = -10
+DBZ_MAX = 80
+
+# Bound of the open-ended lowest and highest band of every ramp
+BAND_OPEN_BOUND = 999
+
+# NOAA Standard Radar Color Ramp (discrete/banded)
+# Each entry is (min_dbz, max_dbz): (R, G, B, A)
+RADAR_BANDS = [
+    # Below threshold - transparent
+    (-999, 5, (0, 0, 0, 0)),
+    (5, 10, (0, 0, 0, 0)),
+    # Light precipitation (blues)
+    (10, 15, (64, 164, 176, 200)),    # Teal
+    (15, 20, (64, 128, 255, 220)),    # Light blue
+    # Light rain (cyans/greens)
+    (20, 25, (0, 236, 236, 230)),     # Cyan
+    (25, 30, (0, 192, 0, 240)),       # Light green
+    # Moderate (greens)
+    (30, 35, (0, 144, 0, 250)),       # Green
+    (35, 40, (0, 100, 0, 255)),       # Dark green
+    # Moderate-heavy (yellows)
+    (40, 45, (255, 255, 0, 255)),     # Yellow
+    (45, 50, (255, 192, 0, 255)),     # Orange-yellow
+    # Heavy (oranges/reds)
+    (50, 55, (255, 128, 0, 255)),     # Orange
+    (55, 60, (255, 0, 0, 255)),       # Red
+    # Very heavy (dark reds)
+    (60, 65, (192, 0, 0, 255)),       # Dark red
+    (65, 70, (144, 0, 0, 255)),       # Darker red
+    # Severe (magentas/purples)
+    (70, 75, (255, 0, 255, 255)),     # Magenta
+    (75, 80, (192, 0, 192, 255)),     # Purple
+    (80, 999, (128, 64, 255, 255)),   # Violet (extreme)
+]
+
+
+# Precipitation rate (mm/hr), from drizzle to extreme rainfall
+PRECIP_RATE_BANDS = [
+    (-999, 0.5, (0, 0, 0, 0)),
+    (0.5, 1, (160, 230, 160, 180)),     # Pale green
+    (1, 2.5, (80, 200, 80, 210)),       # Light green
+    (2.5, 5, (0, 160, 0, 230)),         # Green
+    (5, 10, (255, 255, 0, 245)),        # Yellow
+    (10, 15, (255, 192, 0, 255)),       # Orange-yellow
+    (15, 25, (255, 128, 0, 255)),       # Orange
+    (25, 50, (255, 0, 0, 255)),         # Red
+    (50, 75, (192, 0, 0, 255)),         # Dark red
+    (75, 100, (255, 0, 255, 255)),      # Magenta
+    (100, 999, (128, 64, 255, 255)),    # Violet (extreme)
+]
+
+# 18 dBZ echo top height (km), from shallow showers to deep convection
+ECHO_TOP_BANDS = [
+    (-999, 1, (0, 0, 0, 0)),
+    (1, 3, (120, 120, 255, 200)),       # Lavender
+    (3, 5, (64, 128, 255, 220)),        # Light blue
+    (5, 7, (0, 192, 192, 235)),         # Teal
+    (7, 9, (0, 192, 0, 245)),           # Green
+    (9, 11, (255, 255, 0, 255)),        # Yellow
+    (11, 13, (255, 160, 0, 255)),       # Orange
+    (13, 15, (255, 0, 0, 255)),         # Red
+    (15, 17, (192, 0, 128, 255)),       # Crimson
+    (17, 999, (255, 0, 255, 255)),      # Magenta (overshooting tops)
+]
+
+
+class ColorRamp:
+    """
+    Discrete color bands of one product and the 0-255 scaling behind them.
+
+    Values are clipped to [value_min, value_max] and scaled to 0-255 as
+    rio-tiler rescales tiles; each scaled value maps to the band containing
+    it. Band 0 is drawn transparent and also holds no-data pixels. Band
+    bounds should fall on multiples of (value_max - value_min) / 255, or a
+    band narrower than one step may never be drawn.
+    """
+
+    def __init__(self, bands: list, value_min: float, value_max: float):
+        self.bands = bands
+        self.value_min = value_min
+        self.value_max = value_max
+        # Scaled value -> band index, shared by the colormap and quantization
+        self.lut = build_band_lut(bands, value_min, value_max)
+        self.colormap = build_discrete_colormap(bands, self.lut)
+        # RGBA palette indexed by band, for 8-bit palette PNGs (PLTE + tRNS)
+        self.palette = bytes(c for _, _, color in bands for c in color)
+        # Band index -> whether the band draws anything (non-zero alpha)
+        self.visible = np.array([color[3] > 0 for _, _, color in bands])
+        # Lower bound of every band above band 0, the thresholds counted by
+        # region statistics
+        self.thresholds = np.array(
+            [low for low, _, _ in bands[1:]], dtype=np.float32
+        )
+
+    def rescale(self, data: np.ndarray) -> np.ndarray:
+        """
+        Scale values to 0-255 exactly as rio-tiler's ImageData.rescale does.
+
+        rio-tiler clips and scales in float64, stores back into the float32
+        source array and then truncates to uint8; the same steps are repeated
+        here so quantized output matches rendered tiles pixel for pixel.
+        """
+        low, high = self.value_min, self.value_max
+        scaled = np.clip(data, low, high, dtype=np.float64) - low
+        scaled = scaled / np.float64(high - low)
+        scaled = scaled * 255 + 0
+        return scaled.astype(np.float32).astype(np.uint8)
+
+    def quantize(self, data: np.ndarray, rows_per_chunk: int = 512) -> np.ndarray:
+        """
+        Convert a float grid to a uint8 band index grid.
+
+        No-data and NaN pixels fall into band 0, which is transparent. Works in
+        row chunks to keep float64 temporaries small on CONUS-sized grids.
+        """
+        out = np.empty(data.shape, dtype=np.uint8)
+        for start in range(0, data.shape[0], rows_per_chunk):
+            chunk = np.nan_to_num(
+                data[start:start + rows_per_chunk], nan=self.value_min
+            )
+            out[start:start + rows_per_chunk] = self.lut[self.rescale(chunk)]
+        return out
+
+
+def build_band_lut(bands: list, value_min: float, value_max: float) -> np.ndarray:
+    """
+    Build a 256-entry lookup from scaled pixel values (0-255) to band index.
+
+    Maps scaled values back to the product's units and finds the band
+    containing it. The bands are intervals, not linear interpolation.
+    """
+    lut = np.zeros(256, dtype=np.uint8)
+
+    # rio-tiler rescales data to 0-255
+    # We need to map these back to values
+    value_range = value_max - value_min
+
+    for i in range(256):
+        # Convert pixel value back to the product's units
+        value = value_min + (i / 255.0) * value_range
+
+        # Find the appropriate color band (discrete, not interpolated)
+        for band, (low, high, _) in enumerate(bands):
+            if low <= value < high:
+                lut[i] = band
+                break
+
+    return lut
+
+
+def build_discrete_colormap(bands: list, lut: np.ndarray) -> dict:
+    """
+    Build a 256-entry colormap for rio-tiler.
+
+    Maps scaled pixel values (0-255) back to their band and assigns discrete
+    colors. The colormap uses intervals/bands, not linear interpolation.
+    """
+    colormap = {}
+
+    for i, band in enumerate(lut):
+        colormap[i] = bands[band][2]
+
+    return colormap
+
+
+REFLECTIVITY_RAMP = ColorRamp(RADAR_BANDS, DBZ_MIN, DBZ_MAX)
+# Echo tops scale to 0.1 km steps, precipitation rate to 0.5 mm/hr
+PRECIP_RATE_RAMP = ColorRamp(PRECIP_RATE_BANDS, 0, 127.5)
+ECHO_TOP_RAMP = ColorRamp(ECHO_TOP_BANDS, 0, 25.5)
+
+# The reflectivity ramp's tables, under their original names
+BAND_LUT = REFLECTIVITY_RAMP.lut
+DISCRETE_COLORMAP = REFLECTIVITY_RAMP.colormap
+PALETTE_RGBA = REFLECTIVITY_RAMP.palette
+VISIBLE_BANDS = REFLECTIVITY_RAMP.visible
+rescale_dbz = REFLECTIVITY_RAMP.rescale
+quantize_dbz = REFLECTIVITY_RAMP.quantize
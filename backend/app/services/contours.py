@@ -0,0 +1,467 @@
+import logging
+import math
+import os
+import struct
+import tempfile
+import threading
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+from affine import Affine
+from rasterio import features
+
+from app.services.colormap import BAND_OPEN_BOUND
+from app.services.mercator_grid import EARTH_RADIUS, ORIGIN_SHIFT, WORLD_SIZE
+from app.services.products import Product, default_product
+
+logger = logging.getLogger(__name__)
+
+# Vector tile coordinate extent, and clip buffer around each tile, in tile units
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+
+# Coarsest decimation of the grid polygonized for low zooms
+MAX_DECIMATION = 16
+
+# Edge length in pixels of the raster tiles the levels are matched to
+RASTER_TILE_SIZE = 256
+
+# Rings smaller than this many tile units squared (one pixel of a 256-pixel
+# tile) are dropped: single-pixel speckle is most of the bytes of a noisy
+# field and barely visible
+MIN_RING_AREA = (MVT_EXTENT // RASTER_TILE_SIZE) ** 2
+
+# MVT geometry commands and types
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+POLYGON = 3
+
+
+class ContourLevel(NamedTuple):
+    """Band polygons at one grid decimation, in Web Mercator metres."""
+
+    coords: np.ndarray  # (n, 2) ring vertices, rings open (not repeated)
+    ring_offsets: np.ndarray  # (rings + 1,) into coords
+    polygon_rings: np.ndarray  # (polygons + 1,) into rings; exterior first
+    bands: np.ndarray  # (polygons,) color ramp band index
+    bboxes: np.ndarray  # (polygons, 4) xmin, ymin, xmax, ymax
+
+
+def _decimation(z: int, resolution: float) -> int:
+    """Power-of-two grid decimation whose pixel best matches a tile pixel."""
+    tile_pixel = 360.0 / (RASTER_TILE_SIZE * 2**z)
+    factor = 2 ** max(int(math.floor(math.log2(tile_pixel / resolution))), 0)
+    return min(factor, MAX_DECIMATION)
+
+
+def _block_mean(values: np.ndarray, factor: int) -> np.ndarray:
+    """Mean of the valid pixels of each factor x factor block; NaN if none."""
+    height, width = values.shape
+    rows, cols = -(-height // factor), -(-width // factor)
+    padded = np.full((rows * factor, cols * factor), np.nan, dtype=np.float32)
+    padded[:height, :width] = values
+    blocks = padded.reshape(rows, factor, cols, factor)
+    valid = ~np.isnan(blocks)
+    total = np.where(valid, blocks, 0).sum(axis=(1, 3), dtype=np.float64)
+    count = valid.sum(axis=(1, 3))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(count > 0, total / count, np.nan).astype(np.float32)
+
+
+def _to_mercator(lonlat: np.ndarray) -> np.ndarray:
+    lon, lat = np.radians(lonlat[:, 0]), np.radians(lonlat[:, 1])
+    return np.column_stack(
+        [EARTH_RADIUS * lon, EARTH_RADIUS * np.log(np.tan(np.pi / 4 + lat / 2))]
+    )
+
+
+def _ring_neighbours(starts: np.ndarray, ends: np.ndarray, n: int):
+    """Previous and next vertex of every vertex, wrapping within its ring."""
+    index = np.arange(n)
+    prev, nxt = index - 1, index + 1
+    prev[starts] = ends - 1
+    nxt[ends - 1] = starts
+    return prev, nxt
+
+
+def _polygonize(
+    bands: np.ndarray, visible: np.ndarray, transform: Affine
+) -> ContourLevel:
+    """
+    Trace visible band regions and simplify their pixel staircases.
+
+    Each ring is replaced by the midpoints of its edges, which turns regular
+    staircases into straight runs, and vertices collinear with their
+    neighbours are then dropped. Adjacent bands share edges, so they share
+    the midpoints and stay gap-free along common boundaries.
+    """
+    rings: List[np.ndarray] = []
+    polygon_rings, polygon_bands = [0], []
+    for geometry, band in features.shapes(
+        bands, mask=visible[bands], transform=transform, connectivity=4
+    ):
+        for ring in geometry["coordinates"]:
+            rings.append(np.asarray(ring[:-1], dtype=np.float64))
+        polygon_rings.append(len(rings))
+        polygon_bands.append(int(band))
+
+    if not rings:
+        return ContourLevel(
+            np.empty((0, 2)), np.zeros(1, np.int64), np.zeros(1, np.int64),
+            np.empty(0, np.uint8), np.empty((0, 4)),
+        )
+
+    lengths = np.array([len(r) for r in rings])
+    ends = np.cumsum(lengths)
+    starts = ends - lengths
+    points = np.concatenate(rings)
+    _, nxt = _ring_neighbours(starts, ends, len(points))
+    midpoints = (points + points[nxt]) / 2
+
+    prev, nxt = _ring_neighbours(starts, ends, len(midpoints))
+    before, after = midpoints - midpoints[prev], midpoints[nxt] - midpoints
+    cross = before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0]
+    keep = np.abs(cross) > 1e-12 * np.abs(transform.a * transform.e)
+
+    kept = np.add.reduceat(keep.astype(np.int64), starts)
+    coords = _to_mercator(midpoints[keep])
+    ring_offsets = np.concatenate(([0], np.cumsum(kept)))
+
+    polygon_rings = np.array(polygon_rings, dtype=np.int64)
+    exterior = ring_offsets[polygon_rings[:-1]], ring_offsets[polygon_rings[:-1] + 1]
+    bboxes = np.column_stack(
+        [
+            np.minimum.reduceat(coords, exterior[0], axis=0),
+            np.maximum.reduceat(coords, exterior[0], axis=0),
+        ]
+    )
+    return ContourLevel(
+        coords, ring_offsets, polygon_rings,
+        np.array(polygon_bands, dtype=np.uint8), bboxes,
+    )
+
+
+def _ranges(starts: np.ndarray, ends: np.ndarray) -> np.ndarray:
+    """Concatenated aranges [starts[i], ends[i])."""
+    lengths = ends - starts
+    first = np.cumsum(lengths) - lengths
+    return np.arange(lengths.sum()) - np.repeat(first - starts, lengths)
+
+
+def _ring_index(offsets: np.ndarray):
+    """Ring of every vertex, and the next vertex within its ring."""
+    ring = np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+    following = np.arange(1, len(ring) + 1)
+    wrap = following == offsets[1:][ring]
+    following[wrap] = offsets[:-1][ring[wrap]]
+    return ring, following
+
+
+def _clip_rings(
+    points: np.ndarray,
+    offsets: np.ndarray,
+    rect: Tuple[float, float, float, float],
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Sutherland-Hodgman clip of closed rings to an axis-aligned rectangle,
+    all rings at once; rings clipped away come back empty.
+    """
+    xmin, ymin, xmax, ymax = rect
+    for axis, bound, lower in ((0, xmin, True), (0, xmax, False),
+                               (1, ymin, True), (1, ymax, False)):
+        if not len(points):
+            break
+        ring, index = _ring_index(offsets)
+        following = points[index]
+        inside = points[:, axis] >= bound if lower else points[:, axis] <= bound
+        next_inside = inside[index]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            t = (bound - points[:, axis]) / (following[:, axis] - points[:, axis])
+            crossing = points + t[:, np.newaxis] * (following - points)
+
+        # Per edge: inside->inside emits its end, inside->outside the
+        # crossing, outside->inside the crossing then the end
+        first = np.where((inside ^ next_inside)[:, np.newaxis], crossing, following)
+        emitted = np.stack([first, following], axis=1)
+        mask = np.stack([inside | next_inside, ~inside & next_inside], axis=1)
+        counts = np.bincount(ring, mask.sum(axis=1), minlength=len(offsets) - 1)
+        offsets = np.concatenate(([0], np.cumsum(counts, dtype=np.int64)))
+        points = emitted[mask]
+    return points, offsets
+
+
+def _varints(values: np.ndarray) -> bytes:
+    """Protobuf base-128 varints of non-negative integers below 2**35."""
+    values = np.asarray(values, dtype=np.uint64)
+    length = 1 + sum(
+        (values >= np.uint64(1 << s)).astype(np.int64) for s in (7, 14, 21, 28)
+    )
+    shifts = np.arange(5, dtype=np.uint64) * np.uint64(7)
+    groups = (values[:, np.newaxis] >> shifts) & np.uint64(0x7F)
+    position = np.arange(5)[np.newaxis, :]
+    more = position < (length - 1)[:, np.newaxis]
+    groups |= np.where(more, 0x80, 0).astype(np.uint64)
+    return groups.astype(np.uint8)[position < length[:, np.newaxis]].tobytes()
+
+
+def _field(number: int, payload: bytes) -> bytes:
+    """A length-delimited protobuf field."""
+    return _varints(np.array([number << 3 | 2, len(payload)])) + payload
+
+
+def _value(value) -> bytes:
+    """An MVT Value message: string, unsigned int or (non-integral) double."""
+    if isinstance(value, str):
+        return _field(1, value.encode())
+    if isinstance(value, float):
+        return bytes([3 << 3 | 1]) + struct.pack("<d", value)
+    return _varints(np.array([5 << 3, value]))
+
+
+def _number(value: float):
+    """value as an int when integral, so it is encoded as a uint."""
+    return int(value) if float(value).is_integer() else float(value)
+
+
+class ContourSet:
+    """
+    Simplified color band polygons of one generation, served as Mapbox
+    Vector Tiles.
+
+    Built once at ingest: the value grid is averaged down to the resolution
+    each zoom draws at (as the raster overviews are), quantized to the
+    product's color ramp, traced and simplified. A tile clips the polygons
+    of its zoom's level, drops sub-pixel rings and encodes one feature per
+    band in a layer named after the product, with band, min_{value_key},
+    max_{value_key} (absent on the open-ended top band) and color
+    properties. Encoded tiles are cached for the life of the set; zooms
+    deeper than max_zoom reuse the finest level uncached.
+    """
+
+    def __init__(
+        self,
+        levels: Dict[int, ContourLevel],
+        max_zoom: int,
+        resolution: float,
+        product: Optional[Product] = None,
+    ):
+        self.levels = levels
+        self.max_zoom = max_zoom
+        self.resolution = resolution
+        self.product = product if product is not None else default_product()
+        self._tiles: Dict[Tuple[int, int, int], bytes] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        values: np.ndarray,
+        transform: Affine,
+        max_zoom: int,
+        product: Optional[Product] = None,
+    ) -> "ContourSet":
+        """Build from a north-up EPSG:4326 float grid with NaN for no data."""
+        product = product if product is not None else default_product()
+        resolution = transform.a
+        levels = {}
+        for factor in sorted({_decimation(z, resolution) for z in range(max_zoom + 1)}):
+            grid = _block_mean(values, factor) if factor > 1 else values
+            levels[factor] = _polygonize(
+                product.ramp.quantize(grid),
+                product.ramp.visible,
+                transform * Affine.scale(factor),
+            )
+        contours = cls(levels, max_zoom, resolution, product)
+        logger.info(
+            "Contours: "
+            + ", ".join(
+                f"1/{f} {len(level.bands)} polygons" for f, level in levels.items()
+            )
+        )
+        return contours
+
+    def tile(self, z: int, x: int, y: int) -> bytes:
+        """Encode the XYZ tile as MVT; empty bytes if it has no polygons."""
+        key = (z, x, y)
+        content = self._tiles.get(key)
+        if content is None:
+            content = self._encode(z, x, y)
+            if z <= self.max_zoom:
+                with self._lock:
+                    self._tiles[key] = content
+        return content
+
+    def cached_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """The tile if it was already encoded, else None."""
+        return self._tiles.get((z, x, y))
+
+    def _encode(self, z: int, x: int, y: int) -> bytes:
+        level = self.levels[_decimation(min(z, self.max_zoom), self.resolution)]
+        size = WORLD_SIZE / 2**z
+        left, top = -ORIGIN_SHIFT + x * size, ORIGIN_SHIFT - y * size
+        pad = size * MVT_BUFFER / MVT_EXTENT
+        rect = (left - pad, top - size - pad, left + size + pad, top + pad)
+
+        b = level.bboxes
+        selected = np.flatnonzero(
+            (b[:, 0] <= rect[2]) & (b[:, 2] >= rect[0])
+            & (b[:, 1] <= rect[3]) & (b[:, 3] >= rect[1])
+        )
+        if not len(selected):
+            return b""
+        # Grouped by band, as each band is one feature
+        selected = selected[np.argsort(level.bands[selected], kind="stable")]
+
+        first_ring = level.polygon_rings[selected]
+        rings = _ranges(first_ring, level.polygon_rings[selected + 1])
+        ring_polygon = np.repeat(
+            np.arange(len(selected)), level.polygon_rings[selected + 1] - first_ring
+        )
+        exterior = rings == first_ring[ring_polygon]
+        starts, ends = level.ring_offsets[rings], level.ring_offsets[rings + 1]
+        points = level.coords[_ranges(starts, ends)]
+        offsets = np.concatenate(([0], np.cumsum(ends - starts)))
+
+        contained = (
+            (b[selected, 0] >= rect[0]) & (b[selected, 2] <= rect[2])
+            & (b[selected, 1] >= rect[1]) & (b[selected, 3] <= rect[3])
+        )
+        if not contained.all():
+            points, offsets = _clip_rings(points, offsets, rect)
+
+        scale = MVT_EXTENT / size
+        tile = np.empty((len(points), 2), dtype=np.int64)
+        tile[:, 0] = np.round((points[:, 0] - left) * scale)
+        tile[:, 1] = np.round((top - points[:, 1]) * scale)
+
+        # Drop vertices that round onto their predecessor
+        ring, index = _ring_index(offsets)
+        previous = np.empty_like(index)
+        previous[index] = np.arange(len(index))
+        distinct = np.any(tile != tile[previous], axis=1)
+        tile, ring = tile[distinct], ring[distinct]
+        lengths = np.bincount(ring, minlength=len(rings))
+        offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        # Surveyor's formula (doubled): exterior rings positive, interior
+        # negative
+        _, index = _ring_index(offsets)
+        cross = tile[:, 0] * tile[index, 1] - tile[index, 0] * tile[:, 1]
+        area = np.bincount(ring, cross, minlength=len(rings))
+        valid = (lengths >= 3) & (np.abs(area) >= 2 * MIN_RING_AREA)
+        # A polygon whose exterior collapsed is dropped with its holes
+        polygon_valid = np.zeros(len(selected), dtype=bool)
+        polygon_valid[ring_polygon[exterior]] = valid[exterior]
+        keep = valid & polygon_valid[ring_polygon]
+        if not keep.any():
+            return b""
+
+        flip = ((area > 0) != exterior)[keep]
+        starts, lengths = offsets[:-1][keep], lengths[keep]
+        order = _ranges(starts, starts + lengths)
+        reversed_ring = np.repeat(flip, lengths)
+        ring_start = np.repeat(starts, lengths)
+        order[reversed_ring] = (
+            2 * ring_start + np.repeat(lengths - 1, lengths) - order
+        )[reversed_ring]
+        tile = tile[order]
+
+        # Deltas run on from the previous ring of the same feature
+        ring_bands = level.bands[selected][ring_polygon[keep]]
+        deltas = np.diff(tile, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+        feature_start = np.flatnonzero(np.diff(ring_bands, prepend=-1))
+        feature_points = np.concatenate(([0], np.cumsum(lengths)))[feature_start]
+        deltas[feature_points] = tile[feature_points]
+        zigzag = (deltas << 1) ^ (deltas >> 63)
+
+        # Per ring: MoveTo, x, y, LineTo, (x, y) * (n - 1), ClosePath
+        sizes = 2 * lengths + 3
+        ring_out = np.concatenate(([0], np.cumsum(sizes)))
+        commands = np.empty(ring_out[-1], dtype=np.int64)
+        commands[ring_out[:-1]] = MOVE_TO | 1 << 3
+        commands[ring_out[:-1] + 3] = LINE_TO | (lengths - 1) << 3
+        commands[ring_out[1:] - 1] = CLOSE_PATH | 1 << 3
+        first_vertex = np.cumsum(lengths) - lengths
+        vertex = np.arange(len(tile)) - np.repeat(first_vertex, lengths)
+        position = np.repeat(ring_out[:-1], lengths) + 1 + 2 * vertex + (vertex > 0)
+        commands[position] = zigzag[:, 0]
+        commands[position + 1] = zigzag[:, 1]
+
+        bounds = np.append(ring_out[feature_start], ring_out[-1])
+        return self._encode_layer(
+            {
+                int(ring_bands[r]): commands[bounds[i]:bounds[i + 1]]
+                for i, r in enumerate(feature_start)
+            }
+        )
+
+    def _encode_layer(self, geometries: Dict[int, np.ndarray]) -> bytes:
+        if not geometries:
+            return b""
+        value_key = self.product.value_key
+        keys = ["band", f"min_{value_key}", f"max_{value_key}", "color"]
+        values: List = []
+        value_index: Dict = {}
+
+        def tag(value) -> int:
+            key = (type(value), value)
+            if key not in value_index:
+                value_index[key] = len(values)
+                values.append(value)
+            return value_index[key]
+
+        layer = [
+            _varints(np.array([15 << 3, 2])),
+            _field(1, self.product.name.encode()),
+        ]
+        for band, geometry in sorted(geometries.items()):
+            low, high, (r, g, b, _) = self.product.ramp.bands[band]
+            tags = [
+                0, tag(band),
+                1, tag(_number(max(low, 0))),
+                3, tag(f"#{r:02x}{g:02x}{b:02x}"),
+            ]
+            if high < BAND_OPEN_BOUND:
+                # The top band is open-ended: it has no max
+                tags += [2, tag(_number(high))]
+            feature = (
+                _field(2, _varints(np.array(tags)))
+                + _varints(np.array([3 << 3, POLYGON]))
+                + _field(4, _varints(geometry))
+            )
+            layer.append(_field(2, feature))
+        layer.extend(_field(3, key.encode()) for key in keys)
+        layer.extend(_field(4, _value(value)) for value in values)
+        layer.append(_varints(np.array([5 << 3, MVT_EXTENT])))
+        return _field(3, b"".join(layer))
+
+    def save(self, path: Path):
+        """Write every level as .npz using an atomic rename."""
+        arrays = {
+            "max_zoom": np.array(self.max_zoom),
+            "resolution": np.array(self.resolution),
+        }
+        for factor, level in self.levels.items():
+            for name, array in level._asdict().items():
+                arrays[f"{name}{factor}"] = array
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".npz", dir=path.parent)
+        try:
+            with os.fdopen(temp_fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp_path, path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: Path, product: Optional[Product] = None) -> "ContourSet":
+        with np.load(path) as npz:
+            factors = sorted(int(k[5:]) for k in npz.files if k.startswith("bands"))
+            levels = {
+                f: ContourLevel(*(npz[f"{name}{f}"] for name in ContourLevel._fields))
+                for f in factors
+            }
+            return cls(
+                levels, int(npz["max_zoom"]), float(npz["resolution"]), product
+            )
@@ -0,0 +1,146 @@
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import numpy as np
+from affine import Affine
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator latitude limit
+MAX_LATITUDE = 85.0511287798066
+
+
+def _lon_to_tile(lon: np.ndarray, z: int) -> np.ndarray:
+    n = 2**z
+    x = np.floor((lon + 180.0) / 360.0 * n).astype(np.int64)
+    return np.clip(x, 0, n - 1)
+
+
+def _lat_to_tile(lat: np.ndarray, z: int) -> np.ndarray:
+    n = 2**z
+    lat_rad = np.radians(np.clip(lat, -MAX_LATITUDE, MAX_LATITUDE))
+    y = (1.0 - np.arcsinh(np.tan(lat_rad)) / np.pi) / 2.0 * n
+    return np.clip(np.floor(y).astype(np.int64), 0, n - 1)
+
+
+def _group_starts(ids: np.ndarray) -> np.ndarray:
+    """Indices where a monotonic id sequence changes value."""
+    return np.flatnonzero(np.r_[True, np.diff(ids) != 0])
+
+
+class CoverageIndex:
+    """
+    Per-zoom bitmaps of the XYZ tiles that contain any visible pixel.
+
+    Each zoom stores a boolean array over the tile range the data touches,
+    plus the (x, y) of its top-left tile. Zooms deeper than max_zoom defer to
+    their ancestor at max_zoom, so lookups stay O(1) at every zoom. The index
+    is conservative: every tile a visible pixel's footprint touches is marked,
+    so a tile reported empty is guaranteed to render fully transparent.
+    """
+
+    def __init__(self, levels: Dict[int, Tuple[int, int, np.ndarray]]):
+        self.levels = levels
+        self.max_zoom = max(levels)
+
+    @classmethod
+    def build(
+        cls, visible: np.ndarray, transform: Affine, max_zoom: int
+    ) -> "CoverageIndex":
+        """Build the index from a north-up EPSG:4326 visibility mask."""
+        height, width = visible.shape
+
+        # Pixel edge coordinates
+        lon_edges = transform.c + transform.a * np.arange(width + 1)
+        lat_edges = transform.f + transform.e * np.arange(height + 1)
+
+        # Tiles touched by each pixel's west/east and north/south edges
+        eps_x = abs(transform.a) * 1e-6
+        eps_y = abs(transform.e) * 1e-6
+        x_lo = _lon_to_tile(lon_edges[:-1], max_zoom)
+        x_hi = _lon_to_tile(lon_edges[1:] - eps_x, max_zoom)
+        y_lo = _lat_to_tile(lat_edges[:-1], max_zoom)
+        y_hi = _lat_to_tile(lat_edges[1:] + eps_y, max_zoom)
+
+        x0, y0 = int(x_lo[0]), int(y_lo[0])
+        bitmap = np.zeros(
+            (int(y_hi[-1]) - y0 + 1, int(x_hi[-1]) - x0 + 1), dtype=bool
+        )
+
+        for xs in (x_lo, x_hi):
+            col_starts = _group_starts(xs)
+            cols = np.logical_or.reduceat(visible, col_starts, axis=1)
+            tx = xs[col_starts] - x0
+            for ys in (y_lo, y_hi):
+                row_starts = _group_starts(ys)
+                cells = np.logical_or.reduceat(cols, row_starts, axis=0)
+                bitmap[np.ix_(ys[row_starts] - y0, tx)] |= cells
+
+        levels = {max_zoom: (x0, y0, bitmap)}
+        for z in range(max_zoom - 1, -1, -1):
+            levels[z] = cls._downsample(*levels[z + 1])
+
+        return cls(levels)
+
+    @staticmethod
+    def _downsample(x0: int, y0: int, bitmap: np.ndarray) -> Tuple[int, int, np.ndarray]:
+        """OR-reduce 2x2 child tiles into their parent."""
+        pad_left, pad_top = x0 % 2, y0 % 2
+        height, width = bitmap.shape
+        pad_right = (width + pad_left) % 2
+        pad_bottom = (height + pad_top) % 2
+        padded = np.pad(bitmap, ((pad_top, pad_bottom), (pad_left, pad_right)))
+        h, w = padded.shape
+        parent = padded.reshape(h // 2, 2, w // 2, 2).any(axis=(1, 3))
+        return x0 // 2, y0 // 2, parent
+
+    def is_empty(self, z: int, x: int, y: int) -> bool:
+        """True if the tile is known to contain no visible pixels."""
+        if z > self.max_zoom:
+            shift = z - self.max_zoom
+            z, x, y = self.max_zoom, x >> shift, y >> shift
+
+        x0, y0, bitmap = self.levels[z]
+        col, row = x - x0, y - y0
+        if row < 0 or col < 0 or row >= bitmap.shape[0] or col >= bitmap.shape[1]:
+            return True
+        return not bitmap[row, col]
+
+    def tiles(self, z: int) -> List[Tuple[int, int]]:
+        """All (x, y) tiles at zoom z (<= max_zoom) with visible pixels."""
+        x0, y0, bitmap = self.levels[z]
+        rows, cols = np.nonzero(bitmap)
+        return [(int(x0 + c), int(y0 + r)) for r, c in zip(rows, cols)]
+
+    def count(self, z: int) -> int:
+        """Number of tiles at zoom z (<= max_zoom) with visible pixels."""
+        return int(np.count_nonzero(self.levels[z][2]))
+
+    def save(self, path: Path):
+        """Write the index as .npz using an atomic rename."""
+        arrays = {}
+        for z, (x0, y0, bitmap) in self.levels.items():
+            arrays[f"z{z}"] = bitmap
+            arrays[f"origin{z}"] = np.array([x0, y0], dtype=np.int64)
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".npz", dir=path.parent)
+        try:
+            with os.fdopen(temp_fd, "wb") as f:
+                np.savez_compressed(f, **arrays)
+            os.replace(temp_path, path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: Path) -> "CoverageIndex":
+        with np.load(path) as npz:
+            zooms = sorted(int(k[1:]) for k in npz.files if k.startswith("z"))
+            levels = {}
+            for z in zooms:
+                x0, y0 = npz[f"origin{z}"]
+                levels[z] = (int(x0), int(y0), npz[f"z{z}"])
+        return cls(levels)
@@ -0,0 +1,247 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import rasterio
+from rio_tiler.io import Reader
+
+from app.services.contours import ContourSet
+from app.services.coverage import CoverageIndex
+from app.services.mercator_grid import MercatorGrid
+from app.services.products import Product, default_product
+from app.services.region_stats import RegionStats
+from app.services.shared_grid import open_shared_grids
+from app.services.value_grid import ValueGrid, band_values
+
+logger = logging.getLogger(__name__)
+
+
+class DatasetPool:
+    """
+    Open rio-tiler readers for one generation of a GeoTIFF.
+
+    Each render thread lazily opens its own reader and keeps it for the life
+    of the generation, so cache misses skip the open/header/overview parsing.
+    If a pre-warped Web Mercator raster or a coverage index is given, it is
+    loaded into memory once on first use. If a shared grid header is given,
+    its arrays are mapped read-only instead and tiles need no GDAL reads at
+    all. Point queries use the full-resolution shared array, or else the
+    GeoTIFF's base raster read into memory on the first query. Region
+    statistics are loaded from the generation's tables, or built from that
+    grid if ingest did not write them. Band contours for vector tiles are
+    loaded from the generation's file on the first vector tile. Band values,
+    thresholds and contour properties follow the product's color ramp.
+
+    Callers bracket use with acquire()/release(); once the pool is retired,
+    its handles are closed when the last in-flight render releases it.
+    """
+
+    def __init__(
+        self,
+        path: Path,
+        generation: float,
+        mercator_path: Optional[Path] = None,
+        coverage_path: Optional[Path] = None,
+        shared_path: Optional[Path] = None,
+        stats_path: Optional[Path] = None,
+        contours_path: Optional[Path] = None,
+        product: Optional[Product] = None,
+    ):
+        self.path = path
+        self.generation = generation
+        self.product = product if product is not None else default_product()
+        self.mercator_path = mercator_path
+        self.coverage_path = coverage_path
+        self._mercator_grid: Optional[MercatorGrid] = None
+        self._mercator_loaded = False
+        self._mercator_lock = threading.Lock()
+        self._coverage: Optional[CoverageIndex] = None
+        self._coverage_loaded = False
+        self.shared_path = shared_path
+        self._shared: Dict[int, MercatorGrid] = {}
+        self._shared_loaded = False
+        self._values: Optional[ValueGrid] = None
+        self.stats_path = stats_path
+        self._stats: Optional[RegionStats] = None
+        self.contours_path = contours_path
+        self._contours: Optional[ContourSet] = None
+        self._contours_loaded = False
+        self._local = threading.local()
+        self._readers: List[Reader] = []
+        self._lock = threading.Lock()
+        self._active = 0
+        self._retired = False
+
+    def acquire(self):
+        """Mark a render as in flight on this pool."""
+        with self._lock:
+            self._active += 1
+
+    def release(self):
+        """Mark a render as finished, closing handles if the pool was retired."""
+        with self._lock:
+            self._active -= 1
+            should_close = self._retired and self._active == 0
+        if should_close:
+            self._close()
+
+    def reader(self) -> Reader:
+        """Return this thread's reader, opening it on first use."""
+        src = getattr(self._local, "reader", None)
+        if src is None:
+            # Opened inside an explicit environment, so the dataset does not
+            # own a thread-local one that only this thread could tear down:
+            # _close() may run on whichever thread releases the pool last
+            with rasterio.Env():
+                src = Reader(str(self.path))
+            self._local.reader = src
+            with self._lock:
+                self._readers.append(src)
+        return src
+
+    def mercator_grid(self) -> Optional[MercatorGrid]:
+        """Return the in-memory Web Mercator pyramid, or None if unavailable."""
+        if self.mercator_path is None:
+            return None
+        shared = self._shared_grids().get(3857)
+        if shared is not None:
+            return shared
+        with self._mercator_lock:
+            if not self._mercator_loaded:
+                self._mercator_loaded = True
+                try:
+                    if self.mercator_path.exists():
+                        self._mercator_grid = MercatorGrid.load(self.mercator_path)
+                except Exception as e:
+                    logger.warning(f"Failed to load {self.mercator_path.name}: {e}")
+        return self._mercator_grid
+
+    def native_grid(self) -> Optional[MercatorGrid]:
+        """Return the shared EPSG:4326 pyramid, or None if not published."""
+        return self._shared_grids().get(4326)
+
+    def _shared_grids(self) -> Dict[int, MercatorGrid]:
+        if self._shared_loaded or self.shared_path is None:
+            return self._shared
+        with self._mercator_lock:
+            if not self._shared_loaded:
+                self._shared_loaded = True
+                try:
+                    self._shared = open_shared_grids(self.shared_path)
+                except Exception as e:
+                    logger.warning(f"Failed to map shared grid: {e}")
+        return self._shared
+
+    def value_grid(self) -> ValueGrid:
+        """Return the full-resolution grid for point queries."""
+        if self._values is not None:
+            return self._values
+        native = self.native_grid()
+        values = band_values(self.product.ramp)
+        with self._mercator_lock:
+            if self._values is None:
+                if native is not None:
+                    data, transform = native.levels[0]
+                    self._values = ValueGrid(
+                        data, transform, native.nodata, values
+                    )
+                else:
+                    self._values = ValueGrid.load(self.path, values)
+        return self._values
+
+    def region_stats(self) -> RegionStats:
+        """Return the region statistics tables, building them if missing."""
+        if self._stats is not None:
+            return self._stats
+        grid = self.value_grid()
+        with self._mercator_lock:
+            if self._stats is None:
+                try:
+                    if self.stats_path is not None and self.stats_path.exists():
+                        self._stats = RegionStats.load(self.stats_path)
+                except Exception as e:
+                    logger.warning(f"Failed to load {self.stats_path.name}: {e}")
+                if self._stats is None:
+                    values = grid.window(slice(None), slice(None))
+                    self._stats = RegionStats.build(
+                        values,
+                        grid.transform,
+                        thresholds=self.product.ramp.thresholds,
+                    )
+        return self._stats
+
+    def contours(self) -> Optional[ContourSet]:
+        """Return the band contours, or None if ingest did not build them."""
+        if self._contours_loaded or self.contours_path is None:
+            return self._contours
+        with self._mercator_lock:
+            if not self._contours_loaded:
+                self._contours_loaded = True
+                try:
+                    if self.contours_path.exists():
+                        self._contours = ContourSet.load(
+                            self.contours_path, self.product
+                        )
+                except Exception as e:
+                    logger.warning(f"Failed to load {self.contours_path.name}: {e}")
+        return self._contours
+
+    def cached_vector_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """
+        An already encoded vector tile, or None; never loads the contours,
+        so it is safe on the event loop.
+        """
+        contours = self._contours
+        return contours.cached_tile(z, x, y) if contours is not None else None
+
+    def coverage(self) -> Optional[CoverageIndex]:
+        """Return the tile coverage index, or None if unavailable."""
+        if self._coverage_loaded or self.coverage_path is None:
+            return self._coverage
+        with self._lock:
+            if not self._coverage_loaded:
+                self._coverage_loaded = True
+                try:
+                    if self.coverage_path.exists():
+                        self._coverage = CoverageIndex.load(self.coverage_path)
+                except Exception as e:
+                    logger.warning(f"Failed to load {self.coverage_path.name}: {e}")
+        return self._coverage
+
+    def preload(self):
+        """
+        Load the coverage index now rather than on first use, so that
+        is_empty(), which runs on the event loop, never reads disk.
+        """
+        self.coverage()
+
+    def is_empty(self, z: int, x: int, y: int) -> bool:
+        """True if the coverage index says the tile has nothing to draw."""
+        coverage = self.coverage()
+        return coverage is not None and coverage.is_empty(z, x, y)
+
+    def retire(self):
+        """Stop handing out this pool; close handles once renders drain."""
+        with self._lock:
+            self._retired = True
+            should_close = self._active == 0
+        if should_close:
+            self._close()
+
+    def _close(self):
+        with self._lock:
+            readers, self._readers = self._readers, []
+        self._mercator_grid = None
+        self._shared = {}
+        self._values = None
+        self._stats = None
+        self._contours = None
+        self._coverage = None
+        with rasterio.Env():
+            for src in readers:
+                src.close()
+        if readers:
+            logger.debug(
+                f"Closed {len(readers)} handles for generation {self.generation}"
+            )
@@ -1,121 +1,404 @@
 import asyncio
 import aiohttp
-import gzip
 import logging
+import os
+import re
+import tempfile
+import time
+import zlib
 from pathlib import Path
-from datetime import datetime
-from typing import Optional
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
 from email.utils import parsedate_to_datetime
 
 from app.config import (
-    NOAA_BASE_URL,
-    NOAA_LATEST_FILE,
     DATA_DIR,
     POLL_INTERVAL,
     MAX_GRIB_FILES,
+    FETCH_BACKFILL_ENABLED,
+    FETCH_BACKFILL_CONCURRENCY,
 )
+from app.services.metrics import INGEST_STAGE_SECONDS
+from app.services.products import Product, default_product
 
 logger = logging.getLogger(__name__)
 
+# Compressed bytes read from the response per step
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Every GRIB2 message starts with GRIB and ends with 7777
+GRIB_START = b"GRIB"
+GRIB_END = b"7777"
+
+# MRMS publishes a frame every two minutes
+MRMS_FRAME_INTERVAL = 120
+
+# Timestamped files in the product directory listing; hrefs may be relative
+# (NOAA's Apache index) or carry the directory path
+MRMS_FRAME_PATTERN = re.compile(
+    r'href="(?:[^"]*/)?([^"/]*_(\d{8}-\d{6})\.grib2\.gz)"'
+)
+
+
+class DownloadError(Exception):
+    """A download was truncated or did not decompress to a GRIB2 file."""
+
+
+class GzipFileWriter:
+    """
+    Incrementally gunzips chunks into a file.
+
+    Handles multi-member gzip streams like gzip.decompress. zlib verifies each
+    member's CRC32 and length trailer, so a stream that reaches eof intact is
+    known to be complete.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file = open(path, "wb")
+        self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.decompress_seconds = 0.0
+        self._head = b""
+        self._tail = b""
+
+    def write(self, chunk: bytes):
+        self.bytes_in += len(chunk)
+        start = time.perf_counter()
+        while chunk:
+            self._emit(self._decompressor.decompress(chunk))
+            if not self._decompressor.eof:
+                break
+            # Start the next gzip member, if any
+            chunk = self._decompressor.unused_data
+            if chunk:
+                self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        self.decompress_seconds += time.perf_counter() - start
+
+    def finish(self):
+        """Flush and close, raising DownloadError if the output is not whole."""
+        try:
+            self._emit(self._decompressor.flush())
+        finally:
+            self._file.close()
+
+        if not self._decompressor.eof:
+            raise DownloadError("gzip stream truncated")
+        if self._head[:4] != GRIB_START or self._tail[-4:] != GRIB_END:
+            raise DownloadError("decompressed data is not a complete GRIB2 file")
+
+    def abort(self):
+        self._file.close()
+
+    def _emit(self, data: bytes):
+        if not data:
+            return
+        self._file.write(data)
+        self.bytes_out += len(data)
+        if len(self._head) < 4:
+            self._head += data[:4]
+        self._tail = (self._tail + data)[-4:]
+
+
+def create_session(fetchers: int = 1) -> aiohttp.ClientSession:
+    """
+    Pooled HTTP session for fetchers polling side by side: each may hold a
+    latest-file request and FETCH_BACKFILL_CONCURRENCY backfills at once.
+    """
+    return aiohttp.ClientSession(
+        timeout=aiohttp.ClientTimeout(total=60),
+        connector=aiohttp.TCPConnector(
+            limit=fetchers * (FETCH_BACKFILL_CONCURRENCY + 1),
+            keepalive_timeout=max(POLL_INTERVAL * 3, 30),
+        ),
+    )
+
 
 class MRMSFetcher:
-    """Fetches MRMS radar data from NOAA."""
+    """
+    Fetches one MRMS product from NOAA.
+
+    Polls the product's latest file with a single conditional GET over a
+    pooled HTTP session: the session given, shared with other products'
+    fetchers and closed by its owner, or else one held for the fetcher's
+    lifetime. Each new file is put on queue, if given, as (path, timestamp),
+    timestamped with its valid time as the product directory lists it.
+    With FETCH_BACKFILL_ENABLED, frames that were published between two polls
+    are fetched from the product directory and put on backfill_queue, oldest
+    first, so they reach the animation loop without superseding the latest.
+    """
 
-    def __init__(self):
+    def __init__(
+        self,
+        queue: Optional["asyncio.Queue[Tuple[Path, datetime]]"] = None,
+        product: Optional[Product] = None,
+        session: Optional[aiohttp.ClientSession] = None,
+        backfill_queue: Optional["asyncio.Queue[Tuple[Path, datetime]]"] = None,
+    ):
+        self.product = product if product is not None else default_product()
+        self.queue = queue
+        self.backfill_queue = backfill_queue
         self.current_file: Optional[Path] = None
         self.current_timestamp: Optional[datetime] = None
         self.last_modified: Optional[str] = None
+        self.etag: Optional[str] = None
+        self.last_fetch_stats: Optional[dict] = None
+        self._session = session
+        self._owns_session = session is None
         self._running = False
         self._backoff = POLL_INTERVAL
 
     @property
     def url(self) -> str:
-        return f"{NOAA_BASE_URL}{NOAA_LATEST_FILE}"
+        return f"{self.product.url}{self.product.latest_file}"
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Return the pooled session, creating it on first use if not shared."""
+        if self._owns_session and (self._session is None or self._session.closed):
+            self._session = create_session()
+        return self._session
 
     async def start_polling(self):
         """Background task that polls NOAA for new data."""
         self._running = True
-        logger.info(f"Starting MRMS fetcher, polling every {POLL_INTERVAL}s")
-
-        # Fetch immediately on startup
-        await self._fetch_latest()
+        logger.info(
+            f"Starting MRMS fetcher for {self.product.name}, "
+            f"polling every {POLL_INTERVAL}s"
+        )
 
+        # Fetch immediately on startup; a failure there backs off like any other
         while self._running:
-            await asyncio.sleep(self._backoff)
             try:
                 await self._fetch_latest()
                 self._backoff = POLL_INTERVAL  # Reset backoff on success
             except Exception as e:
-                logger.error(f"Fetch error: {e}")
+                logger.error(f"Fetch error ({self.product.name}): {e}")
                 # Exponential backoff, max 10 minutes
                 self._backoff = min(self._backoff * 2, 600)
                 logger.info(f"Backing off to {self._backoff}s")
+            await asyncio.sleep(self._backoff)
 
     def stop(self):
         """Stop the polling loop."""
         self._running = False
 
+    async def close(self):
+        """Close the pooled HTTP session, unless it is shared."""
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+
     async def _fetch_latest(self):
         """Download and decompress the latest GRIB2 file if it's new."""
-        timeout = aiohttp.ClientTimeout(total=60)
+        # Conditional GET: the server answers 304 while nothing changed
+        headers = {}
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+
+        start = time.monotonic()
+        async with self._get_session().get(self.url, headers=headers) as resp:
+            if resp.status == 304:
+                logger.debug("No new data available")
+                return
+            if resp.status != 200:
+                logger.error(
+                    f"GET request for {self.product.name} failed: {resp.status}"
+                )
+                return
 
-        async with aiohttp.ClientSession(timeout=timeout) as session:
-            # Check Last-Modified header first
+            ttfb = time.monotonic() - start
+            last_modified = resp.headers.get("Last-Modified")
+
+            # Parse timestamp from Last-Modified or use current time
             try:
-                async with session.head(self.url) as resp:
-                    if resp.status != 200:
-                        logger.warning(f"HEAD request failed: {resp.status}")
-                        return
-
-                    last_modified = resp.headers.get("Last-Modified")
-                    if last_modified == self.last_modified:
-                        logger.debug("No new data available")
-                        return
+                if last_modified:
+                    published = parsedate_to_datetime(last_modified)
+                else:
+                    published = datetime.now(timezone.utc)
+            except Exception:
+                published = datetime.now(timezone.utc)
+
+            if last_modified and last_modified == self.last_modified:
+                # Server ignored the conditional headers
+                logger.debug("No new data available")
+                return
+
+            # Timestamp with the valid time, as backfilled frames are;
+            # Last-Modified only if the listing cannot be read
+            try:
+                timestamp = await self._valid_time(published) or published
             except Exception as e:
-                logger.warning(f"HEAD request failed: {e}, proceeding with GET")
+                logger.warning(f"Listing {self.product.name} frames failed: {e}")
+                timestamp = published
+
+            logger.info(f"Fetching new {self.product.name} data...")
+
+            # Save with timestamp in filename
+            filepath = DATA_DIR / self._filename(timestamp)
+
+            try:
+                writer = await self._download(resp, filepath)
+            except (DownloadError, zlib.error) as e:
+                logger.error(f"Failed to decompress: {e}")
+                return
 
-            # Download the file
-            logger.info("Fetching new radar data...")
-            async with session.get(self.url) as resp:
-                if resp.status != 200:
-                    logger.error(f"GET request failed: {resp.status}")
-                    return
+        elapsed = time.monotonic() - start
+        self.last_fetch_stats = {
+            "ttfb": round(ttfb, 3),
+            "elapsed": round(elapsed, 3),
+            "bytes": writer.bytes_in,
+            "bytes_per_second": round(writer.bytes_in / max(elapsed, 1e-6)),
+            "decompressed_bytes": writer.bytes_out,
+        }
+        logger.info(
+            f"Saved {filepath.name} ({writer.bytes_out / 1024 / 1024:.1f} MB) "
+            f"in {elapsed:.2f}s: TTFB {ttfb * 1000:.0f} ms, "
+            f"{writer.bytes_in / 1024 / 1024 / max(elapsed, 1e-6):.2f} MB/s"
+        )
 
-                compressed = await resp.read()
-                self.last_modified = resp.headers.get("Last-Modified")
+        previous = self.current_timestamp
+        self.last_modified = last_modified
+        self.etag = resp.headers.get("ETag")
+        self.current_file = filepath
+        self.current_timestamp = timestamp
+        if self.queue is not None:
+            self.queue.put_nowait((filepath, timestamp))
 
-                # Parse timestamp from Last-Modified or use current time
+        if FETCH_BACKFILL_ENABLED and previous is not None:
+            gap = (timestamp - previous).total_seconds()
+            if gap > MRMS_FRAME_INTERVAL * 1.5:
                 try:
-                    if self.last_modified:
-                        timestamp = parsedate_to_datetime(self.last_modified)
-                    else:
-                        timestamp = datetime.utcnow()
-                except Exception:
-                    timestamp = datetime.utcnow()
-
-                # Decompress
+                    await self._backfill(previous, timestamp)
+                except Exception as e:
+                    logger.warning(f"Backfill of {self.product.name} failed: {e}")
+
+        # Clean up old files
+        self._cleanup_old_files()
+
+    def _filename(self, timestamp: datetime) -> str:
+        return f"{self.product.name}_{timestamp.strftime('%Y%m%d_%H%M%S')}.grib2"
+
+    async def list_frames(self) -> List[Tuple[datetime, str]]:
+        """List (valid time, file name) of the timestamped product files."""
+        async with self._get_session().get(self.product.url) as resp:
+            resp.raise_for_status()
+            listing = await resp.text()
+
+        frames = {}
+        for name, stamp in MRMS_FRAME_PATTERN.findall(listing):
+            valid_time = datetime.strptime(stamp, "%Y%m%d-%H%M%S").replace(
+                tzinfo=timezone.utc
+            )
+            frames[valid_time] = name
+        return sorted(frames.items())
+
+    async def _valid_time(self, published: datetime) -> Optional[datetime]:
+        """
+        Valid time of the latest file: that of the newest listed frame
+        published by its Last-Modified, or None if none is listed.
+        """
+        frames = [
+            valid_time
+            for valid_time, _ in await self.list_frames()
+            if valid_time <= published
+        ]
+        return frames[-1] if frames else None
+
+    async def _backfill(self, previous: datetime, current: datetime):
+        """
+        Fetch frames published after the previous poll but before the current
+        one, both given as valid times.
+        """
+        frames = [
+            (valid_time, name)
+            for valid_time, name in await self.list_frames()
+            if previous < valid_time < current
+        ]
+        frames = frames[-(MAX_GRIB_FILES - 1):] if MAX_GRIB_FILES > 1 else []
+        missing = [
+            (valid_time, name)
+            for valid_time, name in frames
+            if not (DATA_DIR / self._filename(valid_time)).exists()
+        ]
+        if not missing:
+            return
+
+        logger.info(f"Backfilling {len(missing)} missed {self.product.name} frames")
+        semaphore = asyncio.Semaphore(FETCH_BACKFILL_CONCURRENCY)
+
+        async def fetch(valid_time: datetime, name: str) -> Optional[Path]:
+            filepath = DATA_DIR / self._filename(valid_time)
+            async with semaphore:
                 try:
-                    decompressed = gzip.decompress(compressed)
-                except gzip.BadGzipFile as e:
-                    logger.error(f"Failed to decompress: {e}")
-                    return
+                    async with self._get_session().get(
+                        f"{self.product.url}{name}"
+                    ) as resp:
+                        resp.raise_for_status()
+                        await self._download(resp, filepath)
+                except Exception as e:
+                    logger.warning(f"Backfill of {name} failed: {e}")
+                    return None
+            return filepath
+
+        paths = await asyncio.gather(*(fetch(*frame) for frame in missing))
+        fetched = [
+            (path, valid_time)
+            for path, (valid_time, _) in zip(paths, missing)
+            if path is not None
+        ]
+        logger.info(
+            f"Backfilled {len(fetched)}/{len(missing)} {self.product.name} frames"
+        )
+        if self.backfill_queue is not None:
+            for item in fetched:
+                self.backfill_queue.put_nowait(item)
+
+    async def _download(
+        self, resp: aiohttp.ClientResponse, filepath: Path
+    ) -> GzipFileWriter:
+        """
+        Stream the gzipped response body into filepath.
+
+        Decompression runs off the event loop, chunk by chunk, into a temp file
+        that is renamed into place only once the stream is verified complete.
+        Records the fetch (whole download) and decompress stage timings.
+        """
+        start = time.perf_counter()
+        temp_fd, temp_path = tempfile.mkstemp(
+            prefix=f".{self.product.name}_", suffix=".part", dir=DATA_DIR
+        )
+        os.close(temp_fd)
+        writer = GzipFileWriter(Path(temp_path))
 
-                # Save with timestamp in filename
-                filename = f"reflectivity_{timestamp.strftime('%Y%m%d_%H%M%S')}.grib2"
-                filepath = DATA_DIR / filename
+        try:
+            async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                await asyncio.to_thread(writer.write, chunk)
 
-                filepath.write_bytes(decompressed)
-                logger.info(f"Saved {filepath.name} ({len(decompressed) / 1024 / 1024:.1f} MB)")
+            expected = resp.content_length
+            if expected is not None and writer.bytes_in != expected:
+                raise DownloadError(
+                    f"received {writer.bytes_in} of {expected} bytes"
+                )
 
-                self.current_file = filepath
-                self.current_timestamp = timestamp
+            await asyncio.to_thread(writer.finish)
+            os.replace(temp_path, filepath)
+        except BaseException:
+            writer.abort()
+            Path(temp_path).unlink(missing_ok=True)
+            raise
 
-                # Clean up old files
-                self._cleanup_old_files()
+        INGEST_STAGE_SECONDS.observe(time.perf_counter() - start, "fetch")
+        INGEST_STAGE_SECONDS.observe(writer.decompress_seconds, "decompress")
+        return writer
 
     def _cleanup_old_files(self):
-        """Keep only the last N GRIB2 files."""
-        grib_files = sorted(DATA_DIR.glob("reflectivity_*.grib2"), reverse=True)
+        """Keep only the last N GRIB2 files of the product."""
+        grib_files = sorted(
+            DATA_DIR.glob(f"{self.product.name}_*.grib2"), reverse=True
+        )
 
         for old_file in grib_files[MAX_GRIB_FILES:]:
             try:
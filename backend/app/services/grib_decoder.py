@@ -0,0 +1,90 @@
+import logging
+from pathlib import Path
+from typing import Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Bounds as (west, south, east, north) of the pixel centres
+Bounds = Tuple[float, float, float, float]
+
+
+class GribDecodeError(Exception):
+    """The file is not a single regular lat/lon message eccodes can decode."""
+
+
+def decode_grib(
+    grib_path: Path, nodata: float, nodata_below: float = -90
+) -> Tuple[np.ndarray, Bounds]:
+    """
+    Decode a single-message regular_ll GRIB2 file with eccodes.
+
+    Grid geometry comes from the grid definition section, so no coordinate
+    arrays are built. Values are decoded straight to float32 and returned
+    north-up, with MRMS missing values (below nodata_below) and bitmapped
+    points set to nodata in place.
+    """
+    # Imported on first use: loading eccodes ahead of PROJ users (pyproj,
+    # rio-tiler) in the same process can break their PROJ database lookup
+    try:
+        import eccodes
+    except ImportError:
+        raise GribDecodeError("eccodes is not installed")
+
+    with open(grib_path, "rb") as f:
+        gid = eccodes.codes_grib_new_from_file(f)
+        if gid is None:
+            raise GribDecodeError(f"no GRIB message in {grib_path.name}")
+        try:
+            if eccodes.codes_get(gid, "gridType") != "regular_ll":
+                raise GribDecodeError(
+                    f"unsupported grid type {eccodes.codes_get(gid, 'gridType')}"
+                )
+
+            width = eccodes.codes_get(gid, "Ni")
+            height = eccodes.codes_get(gid, "Nj")
+            lat_first = eccodes.codes_get(gid, "latitudeOfFirstGridPointInDegrees")
+            lat_last = eccodes.codes_get(gid, "latitudeOfLastGridPointInDegrees")
+            lon_first = eccodes.codes_get(gid, "longitudeOfFirstGridPointInDegrees")
+            lon_last = eccodes.codes_get(gid, "longitudeOfLastGridPointInDegrees")
+            i_negative = eccodes.codes_get(gid, "iScansNegatively")
+            j_positive = eccodes.codes_get(gid, "jScansPositively")
+            if eccodes.codes_get(gid, "jPointsAreConsecutive"):
+                raise GribDecodeError("column-major grids are not supported")
+
+            has_bitmap = eccodes.codes_get(gid, "bitmapPresent")
+            missing = eccodes.codes_get(gid, "missingValue")
+
+            values = eccodes.codes_get_float_array(gid, "values")
+        finally:
+            eccodes.codes_release(gid)
+
+        extra = eccodes.codes_grib_new_from_file(f)
+        if extra is not None:
+            try:
+                raise GribDecodeError("multi-message files are not supported")
+            finally:
+                eccodes.codes_release(extra)
+
+    if values.size != width * height:
+        raise GribDecodeError(f"expected {width * height} values, got {values.size}")
+
+    data = values.reshape(height, width)
+    if has_bitmap:
+        data[data == missing] = nodata
+    np.putmask(data, data < nodata_below, nodata)
+
+    # Handle longitude wrapping (MRMS uses 0-360 or -180 to 180)
+    lons = np.array([lon_first, lon_last])
+    lons = np.where(lons > 180, lons - 360, lons)
+    west, east = float(lons.min()), float(lons.max())
+    south, north = min(lat_first, lat_last), max(lat_first, lat_last)
+
+    # Orient north-up, west-to-east
+    if j_positive:
+        data = data[::-1]
+    if i_negative:
+        data = data[:, ::-1]
+
+    return np.ascontiguousarray(data), (west, south, east, north)
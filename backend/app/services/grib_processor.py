@@ -1,149 +1,569 @@
 import logging
 import os
+import shutil
 import tempfile
+import warnings
+from contextlib import ExitStack
 from pathlib import Path
-from typing import Optional
+from xml.sax.saxutils import escape
+from typing import Callable, List, Optional, Tuple
 
 import numpy as np
 import rasterio
-import xarray as xr
+import rasterio.shutil
+from affine import Affine
 from rasterio.crs import CRS
+from rasterio.dtypes import dtype_rev, typename_fwd
 from rasterio.enums import Resampling
+from rasterio.errors import NotGeoreferencedWarning
+from rasterio.io import MemoryFile
 from rasterio.transform import from_bounds
-
-from app.config import DATA_DIR, LATEST_GEOTIFF
+from rasterio.warp import calculate_default_transform, reproject
+
+from app.config import (
+    COLOR_INDEX_ENABLED,
+    CONTOURS_NAME,
+    COVERAGE_INDEX_ENABLED,
+    COVERAGE_INDEX_NAME,
+    COVERAGE_MAX_ZOOM,
+    GEOTIFF_BLOCKSIZE,
+    GEOTIFF_COMPRESS,
+    GEOTIFF_DBZ_STEP,
+    GEOTIFF_LAYOUT,
+    GEOTIFF_NAME,
+    GRIB_DECODER,
+    MERCATOR_GEOTIFF_NAME,
+    REGION_STATS_ENABLED,
+    REGION_STATS_NAME,
+    SHARED_GRID_ENABLED,
+    SHARED_GRID_HEADER_NAME,
+    VECTOR_TILE_MAX_ZOOM,
+    VECTOR_TILES_ENABLED,
+    WEB_MERCATOR_ENABLED,
+)
+from app.services.contours import ContourSet
+from app.services.coverage import CoverageIndex
+from app.services.grib_decoder import GribDecodeError, decode_grib
+from app.services.metrics import StageTimings
+from app.services.products import Product, default_product
+from app.services.region_stats import RegionStats
+from app.services.registry import Generation, new_generation_dir
+from app.services.shared_grid import publish_header, publish_levels
+from app.services.value_grid import ValueGrid, band_values
 
 logger = logging.getLogger(__name__)
 
+# No-data value written to every output raster
+NODATA = -999.0
+
+# Overview decimation factors built for every output raster
+OVERVIEW_LEVELS = [2, 4, 8, 16]
+
+# Codecs that take a TIFF predictor
+PREDICTOR_CODECS = ("deflate", "lzw", "zstd")
+
+# Web Mercator sphere circumference in metres
+EARTH_CIRCUMFERENCE = 2 * np.pi * 6378137.0
+
+
+def _write_geotiff(
+    path: Path,
+    data: np.ndarray,
+    crs: CRS,
+    transform: Affine,
+    nodata: Optional[float] = NODATA,
+    resampling: Resampling = Resampling.average,
+    layout: str = GEOTIFF_LAYOUT,
+    compress: str = GEOTIFF_COMPRESS,
+    timings: Optional[StageTimings] = None,
+    classify: Optional[Callable[[np.ndarray], np.ndarray]] = None,
+):
+    """
+    Write a single-band GeoTIFF with overviews.
+
+    With layout "cog" the file is a Cloud-Optimized GeoTIFF written in one
+    pass: internally tiled, overviews ahead of the full-resolution data, so a
+    tile read touches a few contiguous blocks. Layout "gtiff" is the original
+    striped file with overviews appended afterwards.
+
+    With classify, the file holds classify() of data and of each of its
+    overviews as resampled above, with no nodata, instead of data itself.
+
+    Uses atomic file replacement to prevent partial reads. The time spent is
+    added to timings as geotiff_write and overview_build; a COG builds its
+    overviews inside the write, so it records geotiff_write only.
+    """
+    if timings is None:
+        timings = StageTimings()
+    if classify is not None:
+        with timings.stage("overview_build"):
+            levels = _classified_levels(
+                path, data, crs, transform, nodata, resampling, layout, classify
+            )
+        data = levels[0]
+    height, width = data.shape
+
+    profile = {"compress": compress}
+    if compress in PREDICTOR_CODECS:
+        # Floating-point predictor for dBZ, horizontal differencing for indices
+        profile["predictor"] = 3 if np.issubdtype(data.dtype, np.floating) else 2
+
+    # Write to temporary file first (for atomic swap)
+    temp_fd, temp_path = tempfile.mkstemp(suffix=".tif", dir=path.parent)
+    os.close(temp_fd)
+    temp_path = Path(temp_path)
+
+    try:
+        if classify is not None:
+            with timings.stage("geotiff_write"):
+                _write_levels(temp_path, levels, crs, transform, layout, profile)
+        elif layout == "cog":
+            with timings.stage("geotiff_write"), rasterio.open(
+                temp_path,
+                "w",
+                driver="COG",
+                height=height,
+                width=width,
+                count=1,
+                dtype=data.dtype,
+                crs=crs,
+                transform=transform,
+                nodata=nodata,
+                blocksize=GEOTIFF_BLOCKSIZE,
+                overview_resampling=resampling.name,
+                overview_count=len(OVERVIEW_LEVELS),
+                **profile,
+            ) as dst:
+                dst.write(data, 1)
+        else:
+            with timings.stage("geotiff_write"), rasterio.open(
+                temp_path,
+                "w",
+                driver="GTiff",
+                height=height,
+                width=width,
+                count=1,
+                dtype=data.dtype,
+                crs=crs,
+                transform=transform,
+                nodata=nodata,
+                **profile,
+            ) as dst:
+                dst.write(data, 1)
+
+            # Add overviews for efficient tile serving
+            with timings.stage("overview_build"):
+                with rasterio.open(temp_path, "r+") as dst:
+                    dst.build_overviews(OVERVIEW_LEVELS, resampling)
+                    dst.update_tags(ns='rio_overview', resampling=resampling.name)
+
+        # Atomic swap - os.replace is atomic on POSIX
+        os.replace(temp_path, path)
+
+    except Exception as e:
+        # Clean up temp file on failure
+        if temp_path.exists():
+            temp_path.unlink()
+        raise e
+
+
+def _classified_levels(
+    path: Path,
+    data: np.ndarray,
+    crs: CRS,
+    transform: Affine,
+    nodata: Optional[float],
+    resampling: Resampling,
+    layout: str,
+    classify: Callable[[np.ndarray], np.ndarray],
+) -> List[np.ndarray]:
+    """
+    Classify data and each overview level of it, finest first.
+
+    The overviews are those of data written as a GeoTIFF of its own, so a
+    classified level matches classifying what the unclassified raster
+    serves at that level pixel for pixel.
+    """
+    temp_fd, scratch = tempfile.mkstemp(suffix=".tif", dir=path.parent)
+    os.close(temp_fd)
+    scratch = Path(scratch)
+    try:
+        _write_geotiff(
+            scratch, data, crs, transform, nodata, resampling, layout, "none"
+        )
+        levels = [classify(data)]
+        for i in range(len(OVERVIEW_LEVELS)):
+            with rasterio.open(scratch, overview_level=i) as src:
+                levels.append(classify(src.read(1)))
+        return levels
+    finally:
+        scratch.unlink(missing_ok=True)
+
+
+def _write_levels(
+    path: Path,
+    levels: List[np.ndarray],
+    crs: CRS,
+    transform: Affine,
+    layout: str,
+    profile: dict,
+):
+    """
+    Write a GeoTIFF whose overviews are the given levels, not resampled.
+
+    GDAL cannot take overview pixels at creation, so each level goes into
+    an in-memory GeoTIFF and a VRT declares levels[1:] as the base's
+    overviews; the copy to path keeps them.
+    """
+    height, width = levels[0].shape
+    data_type = typename_fwd[dtype_rev[levels[0].dtype.name]]
+    with ExitStack() as stack:
+        # The level files carry no georeferencing; the VRT does
+        stack.enter_context(warnings.catch_warnings())
+        warnings.simplefilter("ignore", NotGeoreferencedWarning)
+
+        names = []
+        for level in levels:
+            memfile = stack.enter_context(MemoryFile())
+            with memfile.open(
+                driver="GTiff",
+                height=level.shape[0],
+                width=level.shape[1],
+                count=1,
+                dtype=level.dtype,
+            ) as dst:
+                dst.write(level, 1)
+            names.append(memfile.name)
+
+        source = (
+            '<SimpleSource><SourceFilename relativeToVRT="0">{}</SourceFilename>'
+            "<SourceBand>1</SourceBand></SimpleSource>"
+        )
+        overview = (
+            '<Overview><SourceFilename relativeToVRT="0">{}</SourceFilename>'
+            "<SourceBand>1</SourceBand></Overview>"
+        )
+        vrt = (
+            f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">'
+            f"<SRS>{escape(crs.to_wkt())}</SRS>"
+            f"<GeoTransform>{', '.join(map(repr, transform.to_gdal()))}</GeoTransform>"
+            f'<VRTRasterBand dataType="{data_type}" band="1">'
+            + source.format(names[0])
+            + "".join(overview.format(name) for name in names[1:])
+            + "</VRTRasterBand></VRTDataset>"
+        )
+
+        if layout == "cog":
+            options = {
+                "driver": "COG",
+                "blocksize": GEOTIFF_BLOCKSIZE,
+                "overviews": "FORCE_USE_EXISTING",
+            }
+        else:
+            options = {"driver": "GTiff", "copy_src_overviews": True}
+        with rasterio.open(vrt) as src:
+            rasterio.shutil.copy(src, path, **options, **profile)
+
+
+def _round_to_step(data: np.ndarray, step: float, nodata: float) -> np.ndarray:
+    """Round values to a multiple of step, leaving nodata untouched."""
+    rounded = np.round(data / step) * step
+    return np.where(data == nodata, nodata, rounded).astype(np.float32)
+
 
 class GRIBProcessor:
-    """Processes GRIB2 files and converts them to GeoTIFF."""
+    """Processes one product's GRIB2 files and converts them to GeoTIFF."""
 
-    def __init__(self):
+    def __init__(self, product: Optional[Product] = None):
+        self.product = product if product is not None else default_product()
         self._last_processed: Optional[Path] = None
 
-    def process_grib(self, grib_path: Path) -> Optional[Path]:
+    def process_grib(
+        self, grib_path: Path, timings: Optional[StageTimings] = None
+    ) -> Optional[Generation]:
         """
         Process GRIB2 file and convert to GeoTIFF.
 
-        Uses atomic file replacement to prevent partial reads.
-
-        Returns path to the GeoTIFF file, or None on failure.
+        Seconds per stage (decode and write_grid's stages) are added to
+        timings, if given. Returns the new generation, or None on failure.
         """
+        if timings is None:
+            timings = StageTimings()
         if not grib_path.exists():
             logger.error(f"GRIB file not found: {grib_path}")
             return None
 
         try:
-            # Read GRIB2 with xarray/cfgrib
             logger.info(f"Processing {grib_path.name}...")
 
-            ds = xr.open_dataset(
-                grib_path,
-                engine="cfgrib",
-                backend_kwargs={
-                    "indexpath": "",  # Disable .idx file creation
-                },
-            )
-
-            # Extract the data variable (usually 'unknown' for MRMS)
-            data_vars = list(ds.data_vars)
-            if not data_vars:
-                logger.error("No data variables found in GRIB file")
-                ds.close()
+            decoded = None
+            with timings.stage("decode"):
+                if GRIB_DECODER == "eccodes":
+                    try:
+                        decoded = decode_grib(
+                            grib_path, NODATA, self.product.nodata_below
+                        )
+                    except GribDecodeError as e:
+                        logger.warning(
+                            f"Fast decode failed ({e}), falling back to cfgrib"
+                        )
+                if decoded is None:
+                    decoded = self._decode_cfgrib(grib_path)
+            if decoded is None:
                 return None
 
-            data_var = data_vars[0]
-            da = ds[data_var]
-            logger.debug(f"Data variable: {data_var}, shape: {da.shape}")
-
-            # Get coordinates
-            lats = da.latitude.values
-            lons = da.longitude.values
-
-            # MRMS data covers CONUS, typically:
-            # Latitude: ~20 to ~55 (north to south in file)
-            # Longitude: ~-130 to ~-60 (or 230 to 300 in 0-360 format)
-
-            # Handle longitude wrapping (MRMS uses 0-360 or -180 to 180)
-            if lons.max() > 180:
-                # Convert from 0-360 to -180 to 180
-                lons = np.where(lons > 180, lons - 360, lons)
-
-            # Calculate bounds (west, south, east, north)
-            west, east = float(lons.min()), float(lons.max())
-            south, north = float(lats.min()), float(lats.max())
-
+            data, (west, south, east, north) = decoded
             logger.debug(f"Bounds: W={west}, S={south}, E={east}, N={north}")
 
-            # Get data array
-            data = da.values.astype(np.float32)
+            result = self.write_grid(data, (west, south, east, north), timings)
+            if result:
+                self._last_processed = grib_path
+            return result
 
-            # Check if latitude is descending (north to south)
-            if lats[0] > lats[-1]:
-                # Data is already north-up, which is correct for GeoTIFF
-                pass
-            else:
-                # Flip to make north-up
-                data = np.flipud(data)
-                south, north = north, south
+        except Exception as e:
+            logger.error(f"Failed to process GRIB: {e}")
+            return None
 
-            # Handle no-data values (MRMS uses various values like -999, -99)
-            nodata = -999.0
-            data = np.where(data < -90, nodata, data)
+    def _decode_cfgrib(
+        self, grib_path: Path
+    ) -> Optional[Tuple[np.ndarray, Tuple[float, float, float, float]]]:
+        """Decode with xarray/cfgrib; returns (north-up data, bounds) or None."""
+        # Imported here so the eccodes path never pays for it
+        import xarray as xr
+
+        ds = xr.open_dataset(
+            grib_path,
+            engine="cfgrib",
+            backend_kwargs={
+                "indexpath": "",  # Disable .idx file creation
+            },
+        )
+
+        # Extract the data variable (usually 'unknown' for MRMS)
+        data_vars = list(ds.data_vars)
+        if not data_vars:
+            logger.error("No data variables found in GRIB file")
+            ds.close()
+            return None
 
-            # Get dimensions
+        data_var = data_vars[0]
+        da = ds[data_var]
+        logger.debug(f"Data variable: {data_var}, shape: {da.shape}")
+
+        # Get coordinates
+        lats = da.latitude.values
+        lons = da.longitude.values
+
+        # MRMS data covers CONUS, typically:
+        # Latitude: ~20 to ~55 (north to south in file)
+        # Longitude: ~-130 to ~-60 (or 230 to 300 in 0-360 format)
+
+        # Handle longitude wrapping (MRMS uses 0-360 or -180 to 180)
+        if lons.max() > 180:
+            # Convert from 0-360 to -180 to 180
+            lons = np.where(lons > 180, lons - 360, lons)
+
+        # Calculate bounds (west, south, east, north)
+        west, east = float(lons.min()), float(lons.max())
+        south, north = float(lats.min()), float(lats.max())
+
+        # Get data array
+        data = da.values.astype(np.float32)
+
+        # Check if latitude is descending (north to south)
+        if lats[0] > lats[-1]:
+            # Data is already north-up, which is correct for GeoTIFF
+            pass
+        else:
+            # Flip to make north-up
+            data = np.flipud(data)
+
+        # Handle no-data values (MRMS uses various values like -999, -99);
+        # cfgrib turns bitmapped points into NaN
+        data = np.where(
+            (data < self.product.nodata_below) | np.isnan(data), NODATA, data
+        )
+
+        ds.close()
+        return data, (west, south, east, north)
+
+    def write_grid(
+        self,
+        data: np.ndarray,
+        bounds: Tuple[float, float, float, float],
+        timings: Optional[StageTimings] = None,
+    ) -> Optional[Generation]:
+        """
+        Write a north-up EPSG:4326 grid of the product as a new generation.
+
+        bounds is (west, south, east, north). Every artifact goes into a fresh
+        generation directory, which nothing reads until the generation is
+        staged in the product's registry. When COLOR_INDEX_ENABLED is set, the
+        grid is stored as uint8 band indices of the product's color ramp
+        instead of float values. Optional
+        artifacts: a pre-warped EPSG:3857 copy (WEB_MERCATOR_ENABLED), the tile
+        coverage index (COVERAGE_INDEX_ENABLED), region statistics tables
+        (REGION_STATS_ENABLED), band contours for vector tiles
+        (VECTOR_TILES_ENABLED) and memory-mappable copies of every raster's
+        levels (SHARED_GRID_ENABLED).
+
+        Seconds per stage are added to timings, if given. Returns the
+        generation, or None on failure.
+        """
+        if timings is None:
+            timings = StageTimings()
+        directory = None
+        try:
             height, width = data.shape
-
-            # Create affine transform
-            transform = from_bounds(west, south, east, north, width, height)
-
-            # Write to temporary file first (for atomic swap)
-            temp_fd, temp_path = tempfile.mkstemp(suffix=".tif", dir=DATA_DIR)
-            os.close(temp_fd)
-            temp_path = Path(temp_path)
-
-            try:
-                with rasterio.open(
-                    temp_path,
-                    "w",
-                    driver="GTiff",
-                    height=height,
-                    width=width,
-                    count=1,
-                    dtype=np.float32,
-                    crs=CRS.from_epsg(4326),
-                    transform=transform,
-                    nodata=nodata,
-                    compress="deflate",
-                ) as dst:
-                    dst.write(data, 1)
-
-                # Add overviews for efficient tile serving
-                with rasterio.open(temp_path, "r+") as dst:
-                    overview_levels = [2, 4, 8, 16]
-                    dst.build_overviews(overview_levels, Resampling.average)
-                    dst.update_tags(ns='rio_overview', resampling='average')
-
-                # Atomic swap - os.replace is atomic on POSIX
-                os.replace(temp_path, LATEST_GEOTIFF)
-                logger.info(f"Created GeoTIFF: {LATEST_GEOTIFF.name}")
-
-                self._last_processed = grib_path
-                ds.close()
-
-                return LATEST_GEOTIFF
-
-            except Exception as e:
-                # Clean up temp file on failure
-                if temp_path.exists():
-                    temp_path.unlink()
-                raise e
+            transform = from_bounds(*bounds, width, height)
+            directory = new_generation_dir(self.product)
+            artifacts = {}
+            ramp = self.product.ramp
+
+            if VECTOR_TILES_ENABLED:
+                with timings.stage("contours"):
+                    # From the unrounded values, so low zooms average real ones
+                    values = ValueGrid(data, transform, NODATA)
+                    ContourSet.build(
+                        values.window(slice(None), slice(None)),
+                        transform,
+                        VECTOR_TILE_MAX_ZOOM,
+                        self.product,
+                    ).save(directory / CONTOURS_NAME)
+                artifacts["contours"] = CONTOURS_NAME
+
+            if GEOTIFF_DBZ_STEP > 0 and self.product.units == "dBZ":
+                # Fewer distinct values compress far better
+                data = _round_to_step(data, GEOTIFF_DBZ_STEP, NODATA)
+
+            # Classified from the values as written, so the coverage index
+            # agrees with the pixels tiles render
+            bands = None
+            if COLOR_INDEX_ENABLED or COVERAGE_INDEX_ENABLED:
+                bands = ramp.quantize(data)
+
+            if COVERAGE_INDEX_ENABLED:
+                with timings.stage("coverage"):
+                    self._write_coverage(
+                        bands, transform, directory / COVERAGE_INDEX_NAME
+                    )
+                artifacts["coverage"] = COVERAGE_INDEX_NAME
+
+            classify = None
+            stored, nodata = data, NODATA
+            if COLOR_INDEX_ENABLED:
+                # Band indices are categorical (band 0 is transparent, so no
+                # nodata), and each overview level is classified from the
+                # float grid averaged as the float path does: both render
+                # the same pixels at every zoom
+                classify = ramp.quantize
+                stored, nodata = bands, None
+
+            if REGION_STATS_ENABLED:
+                with timings.stage("region_stats"):
+                    # Built from the values as stored, as queries read them
+                    values = ValueGrid(stored, transform, nodata, band_values(ramp))
+                    RegionStats.build(
+                        values.window(slice(None), slice(None)),
+                        transform,
+                        thresholds=ramp.thresholds,
+                    ).save(directory / REGION_STATS_NAME)
+                artifacts["region_stats"] = REGION_STATS_NAME
+
+            grids = {}
+            if WEB_MERCATOR_ENABLED:
+                mercator_path = directory / MERCATOR_GEOTIFF_NAME
+                self._write_mercator(
+                    mercator_path, data, transform, classify, timings
+                )
+                artifacts["mercator"] = MERCATOR_GEOTIFF_NAME
+                if SHARED_GRID_ENABLED:
+                    with timings.stage("shared_grid"):
+                        grids["mercator"] = publish_levels(mercator_path, "mercator")
+
+            geotiff_path = directory / GEOTIFF_NAME
+            _write_geotiff(
+                geotiff_path, data, CRS.from_epsg(4326), transform,
+                timings=timings, classify=classify,
+            )
+            artifacts["geotiff"] = GEOTIFF_NAME
+            logger.info(f"Created GeoTIFF: {directory.name}/{GEOTIFF_NAME}")
+
+            if SHARED_GRID_ENABLED:
+                with timings.stage("shared_grid"):
+                    grids["native"] = publish_levels(geotiff_path, "native")
+                    publish_header(directory / SHARED_GRID_HEADER_NAME, grids)
+                artifacts["shared_grid"] = SHARED_GRID_HEADER_NAME
+
+            west, south, east, north = bounds
+            return Generation(
+                id=geotiff_path.stat().st_mtime,
+                directory=str(directory),
+                bounds={"west": west, "south": south, "east": east, "north": north},
+                artifacts=artifacts,
+                size=sum(p.stat().st_size for p in directory.iterdir()),
+            )
 
         except Exception as e:
-            logger.error(f"Failed to process GRIB: {e}")
+            logger.error(f"Failed to write GeoTIFF: {e}")
+            if directory is not None:
+                shutil.rmtree(directory, ignore_errors=True)
             return None
 
+    def _write_coverage(self, bands: np.ndarray, transform: Affine, path: Path):
+        """Record which tiles contain any visible pixel."""
+        coverage = CoverageIndex.build(
+            self.product.ramp.visible[bands], transform, COVERAGE_MAX_ZOOM
+        )
+        coverage.save(path)
+        logger.info(
+            f"Coverage index: {coverage.count(COVERAGE_MAX_ZOOM)} non-empty "
+            f"tiles at z{COVERAGE_MAX_ZOOM}"
+        )
+
+    def _write_mercator(
+        self,
+        path: Path,
+        data: np.ndarray,
+        transform: Affine,
+        classify: Optional[Callable[[np.ndarray], np.ndarray]],
+        timings: StageTimings,
+    ):
+        """Reproject the grid to Web Mercator once so tiles can be array slices."""
+        height, width = data.shape
+        src_crs = CRS.from_epsg(4326)
+        dst_crs = CRS.from_epsg(3857)
+        west, north = transform * (0, 0)
+        east, south = transform * (width, height)
+
+        # Square pixels matching the source longitude spacing in metres
+        res = transform.a * EARTH_CIRCUMFERENCE / 360.0
+        dst_transform, dst_width, dst_height = calculate_default_transform(
+            src_crs, dst_crs, width, height,
+            left=west, bottom=south, right=east, top=north,
+            resolution=res,
+        )
+
+        with timings.stage("reproject"):
+            warped = np.full((dst_height, dst_width), NODATA, dtype=data.dtype)
+            reproject(
+                source=data,
+                destination=warped,
+                src_transform=transform,
+                src_crs=src_crs,
+                src_nodata=NODATA,
+                dst_transform=dst_transform,
+                dst_crs=dst_crs,
+                dst_nodata=NODATA,
+                resampling=Resampling.nearest,
+            )
+
+        _write_geotiff(
+            path, warped, dst_crs, dst_transform,
+            timings=timings, classify=classify,
+        )
+        logger.info(f"Created GeoTIFF: {path.parent.name}/{path.name}")
+
     @property
     def last_processed(self) -> Optional[Path]:
         return self._last_processed
@@ -0,0 +1,204 @@
+import asyncio
+import fcntl
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from app.config import INGEST_WORKERS
+from app.services.grib_processor import GRIBProcessor
+from app.services.metrics import INGEST_STAGE_SECONDS, INGESTS, StageTimings
+from app.services.products import ENABLED_PRODUCTS, Product
+from app.services.registry import Generation
+
+logger = logging.getLogger(__name__)
+
+# Processors owned by each ingest worker process, by product name
+_worker_processors: Dict[str, GRIBProcessor] = {}
+
+
+def _init_worker(level: int):
+    logging.basicConfig(
+        level=level,
+        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    )
+
+
+def _process(
+    product: str, grib_path: Path
+) -> Tuple[Optional[Generation], Dict[str, float]]:
+    """
+    Convert one GRIB2 file of product in a worker process.
+
+    Returns the generation (None on failure) and seconds per stage, which
+    the pipeline records in the serving process's metrics.
+    """
+    processor = _worker_processors.get(product)
+    if processor is None:
+        processor = GRIBProcessor(ENABLED_PRODUCTS[product])
+        _worker_processors[product] = processor
+    timings = StageTimings()
+    return processor.process_grib(grib_path, timings), dict(timings)
+
+
+class IngestLock:
+    """
+    Non-blocking exclusive flock electing the one process that ingests.
+
+    Every uvicorn worker shares DATA_DIR; only the holder fetches, converts,
+    warms and publishes, the rest serve whatever the manifest names. The
+    kernel drops the lock when its holder exits, so a waiting worker takes
+    over on its next acquire().
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._file: Optional[IO] = None
+
+    @property
+    def held(self) -> bool:
+        return self._file is not None
+
+    def acquire(self) -> bool:
+        if self._file is None:
+            lock = open(self.path, "a")
+            try:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock.close()
+                return False
+            self._file = lock
+        return True
+
+    def release(self):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+class _WakingQueue(asyncio.Queue):
+    """Queue that sets an event whenever an item is put on it."""
+
+    def __init__(self, wakeup: asyncio.Event):
+        super().__init__()
+        self._wakeup = wakeup
+
+    def _put(self, item):
+        super()._put(item)
+        self._wakeup.set()
+
+
+class IngestPipeline:
+    """
+    Converts fetched GRIB2 files in a pool of worker processes.
+
+    Each product's fetcher puts (path, timestamp) on that product's queue,
+    and backfilled past frames on its backfill queue. Decode, GeoTIFF
+    writes and overview builds run in the workers, so the event loop keeps
+    serving tiles throughout, and files of different products convert in
+    parallel on up to INGEST_WORKERS cores. If several files of a product
+    queue up during a conversion the newest is converted first and the
+    others move to the backfill queue. Backfilled files are never skipped,
+    but only convert while no new file waits, so past frames still fill
+    their slots in the animation loop.
+    on_ingested is awaited with the product and the new generation, stamped
+    with the file's timestamp, as soon as a conversion succeeds; that is
+    where the serving side publishes it.
+    """
+
+    def __init__(
+        self,
+        on_ingested: Callable[[Product, Generation], Awaitable[None]],
+        products: Optional[List[Product]] = None,
+    ):
+        if products is None:
+            products = list(ENABLED_PRODUCTS.values())
+        self.products = products
+        self._wakeups = {product.name: asyncio.Event() for product in products}
+        self.queues: Dict[str, "asyncio.Queue[Tuple[Path, datetime]]"] = {
+            name: _WakingQueue(wakeup) for name, wakeup in self._wakeups.items()
+        }
+        self.backfill_queues: Dict[str, "asyncio.Queue[Tuple[Path, datetime]]"] = {
+            name: _WakingQueue(wakeup) for name, wakeup in self._wakeups.items()
+        }
+        self._on_ingested = on_ingested
+        self._executor = self._create_executor()
+
+    @staticmethod
+    def _create_executor() -> ProcessPoolExecutor:
+        return ProcessPoolExecutor(
+            max_workers=INGEST_WORKERS,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(logging.getLogger().getEffectiveLevel(),),
+        )
+
+    async def run(self):
+        """Background task: convert queued files until cancelled."""
+        await asyncio.gather(*(self._consume(product) for product in self.products))
+
+    async def _consume(self, product: Product):
+        """Convert one product's queued files, one at a time."""
+        loop = asyncio.get_running_loop()
+        queue = self.queues[product.name]
+        backfill = self.backfill_queues[product.name]
+        wakeup = self._wakeups[product.name]
+
+        while True:
+            while queue.empty() and backfill.empty():
+                wakeup.clear()
+                await wakeup.wait()
+
+            if not queue.empty():
+                grib_path, timestamp = queue.get_nowait()
+
+                # Newer data goes first; anything it superseded is backfilled
+                skipped = 0
+                while not queue.empty():
+                    backfill.put_nowait((grib_path, timestamp))
+                    grib_path, timestamp = queue.get_nowait()
+                    skipped += 1
+                if skipped:
+                    logger.info(
+                        f"Deferring {skipped} superseded {product.name} files"
+                    )
+            else:
+                grib_path, timestamp = backfill.get_nowait()
+                if not grib_path.exists():
+                    # Cleaned up by the fetcher before its turn came
+                    continue
+
+            executor = self._executor
+            try:
+                start = time.monotonic()
+                result, timings = await loop.run_in_executor(
+                    executor, _process, product.name, grib_path
+                )
+                for stage, seconds in timings.items():
+                    INGEST_STAGE_SECONDS.observe(seconds, stage)
+                INGESTS.inc(label_value="ok" if result else "failed")
+                if not result:
+                    continue
+                logger.info(
+                    f"Ingested {grib_path.name} in {time.monotonic() - start:.2f}s"
+                )
+                await self._on_ingested(
+                    product, result._replace(timestamp=timestamp.isoformat())
+                )
+            except BrokenProcessPool:
+                INGESTS.inc(label_value="failed")
+                logger.error(f"Ingest worker died on {grib_path.name}, restarting it")
+                # Other products' conversions fail with the same pool; only
+                # the first to notice replaces it
+                if self._executor is executor:
+                    self._executor = self._create_executor()
+            except Exception as e:
+                logger.error(f"Processing error: {e}")
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
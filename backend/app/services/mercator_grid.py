@@ -0,0 +1,114 @@
+import logging
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+logger = logging.getLogger(__name__)
+
+# Web Mercator sphere radius, world extent (metres) and origin offset
+EARTH_RADIUS = 6378137.0
+WORLD_SIZE = 2 * np.pi * EARTH_RADIUS
+ORIGIN_SHIFT = WORLD_SIZE / 2
+
+# Geographic levels may be this much coarser than the tile, which matches
+# the overview GDAL picks when rio-tiler warps the same GeoTIFF
+GEOGRAPHIC_OVERVIEW_TOLERANCE = 1.2
+
+
+class MercatorGrid:
+    """
+    In-memory raster pyramid for one data generation, cut into Web Mercator
+    tiles.
+
+    Tiles are cut by nearest-neighbour index arithmetic on the level whose
+    resolution best matches the tile, so no per-tile warping is needed. The
+    levels are EPSG:3857, or EPSG:4326 when geographic is set; the lon/lat
+    to Web Mercator mapping is separable, so the same arithmetic applies
+    with a latitude lookup per output row.
+    """
+
+    def __init__(
+        self,
+        levels: List[Tuple[np.ndarray, Affine]],
+        nodata: Optional[float],
+        geographic: bool = False,
+    ):
+        # Ordered finest to coarsest
+        self.levels = levels
+        self.nodata = nodata
+        self.geographic = geographic
+
+    @classmethod
+    def load(cls, path: Path) -> "MercatorGrid":
+        """Read the base raster and all of its overviews into memory."""
+        with rasterio.open(path) as src:
+            levels = [(src.read(1), src.transform)]
+            nodata = src.nodata
+            overview_count = len(src.overviews(1))
+
+        for i in range(overview_count):
+            with rasterio.open(path, overview_level=i) as ovr:
+                levels.append((ovr.read(1), ovr.transform))
+
+        nbytes = sum(data.nbytes for data, _ in levels)
+        logger.info(
+            f"Loaded {path.name} into memory ({len(levels)} levels, "
+            f"{nbytes / 1024 / 1024:.1f} MB)"
+        )
+        return cls(levels, nodata)
+
+    def _select_level(self, res: float) -> Tuple[np.ndarray, Affine]:
+        """Pick the coarsest level that is still at least as fine as res."""
+        selected = self.levels[0]
+        for data, transform in self.levels[1:]:
+            if transform.a > res:
+                break
+            selected = (data, transform)
+        return selected
+
+    def tile(
+        self, z: int, x: int, y: int, tilesize: int = 256, span: int = 1
+    ) -> Optional[np.ma.MaskedArray]:
+        """
+        Cut a span x span block of XYZ tiles, starting at (x, y), as a
+        (1, tilesize * span, tilesize * span) masked array.
+
+        Returns None if the block does not intersect the raster.
+        """
+        res = WORLD_SIZE / (tilesize * 2**z)
+        left = -ORIGIN_SHIFT + x * tilesize * res
+        top = ORIGIN_SHIFT - y * tilesize * res
+
+        # Output pixel centres in metres
+        centers = (np.arange(tilesize * span) + 0.5) * res
+        xs = left + centers
+        ys = top - centers
+
+        if self.geographic:
+            data, transform = self._select_level(
+                res * 360.0 / WORLD_SIZE * GEOGRAPHIC_OVERVIEW_TOLERANCE
+            )
+            xs = xs * 360.0 / WORLD_SIZE
+            ys = np.degrees(np.arctan(np.sinh(ys / EARTH_RADIUS)))
+        else:
+            data, transform = self._select_level(res)
+        height, width = data.shape
+
+        # Source pixel containing each output pixel centre
+        cols = np.floor((xs - transform.c) / transform.a).astype(np.int64)
+        rows = np.floor((ys - transform.f) / transform.e).astype(np.int64)
+
+        col_ok = (cols >= 0) & (cols < width)
+        row_ok = (rows >= 0) & (rows < height)
+        if not col_ok.any() or not row_ok.any():
+            return None
+
+        block = data[np.ix_(np.clip(rows, 0, height - 1), np.clip(cols, 0, width - 1))]
+        mask = ~row_ok[:, np.newaxis] | ~col_ok[np.newaxis, :]
+        if self.nodata is not None:
+            mask |= block == self.nodata
+
+        return np.ma.MaskedArray(block[np.newaxis], mask=mask[np.newaxis])
@@ -0,0 +1,240 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+# Bucket upper bounds in seconds
+TILE_STAGE_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0,
+)
+INGEST_STAGE_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 25.0, 60.0, 120.0)
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+def _labels(pairs: Dict[str, str]) -> str:
+    if not pairs:
+        return ""
+    inner = ",".join(
+        '{}="{}"'.format(
+            k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        )
+        for k, v in pairs.items()
+    )
+    return "{" + inner + "}"
+
+
+class Metric:
+    """Base class: one metric family in the Prometheus text format."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        self.name = name
+        self.documentation = documentation
+        self.label = label
+        self._lock = threading.Lock()
+
+    def _label_pairs(self, value: Optional[str]) -> Dict[str, str]:
+        return {self.label: value} if self.label and value is not None else {}
+
+    def collect(self) -> List[str]:
+        return [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+            *self._samples(),
+        ]
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    """Monotonic total, optionally split by one label."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, label: Optional[str] = None):
+        super().__init__(name, documentation, label)
+        self._values: Dict[Optional[str], float] = {}
+
+    def inc(self, amount: float = 1, label_value: Optional[str] = None):
+        with self._lock:
+            self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+        return [
+            f"{self.name}{_labels(self._label_pairs(k))} {_format_value(v)}"
+            for k, v in values.items()
+        ]
+
+
+class Histogram(Metric):
+    """Cumulative-bucket histogram, optionally split by one label."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        buckets: Sequence[float],
+        label: Optional[str] = None,
+    ):
+        super().__init__(name, documentation, label)
+        self.buckets = tuple(buckets)
+        # label value -> [per-bucket counts (last is +Inf), sum]
+        self._series: Dict[Optional[str], list] = {}
+
+    def observe(self, value: float, label_value: Optional[str] = None):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label_value)
+            if series is None:
+                counts = [0] * (len(self.buckets) + 1)
+                series = self._series[label_value] = [counts, 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def time(self, label_value: Optional[str] = None) -> "_Timer":
+        """Context manager observing the duration of its with block."""
+        return _Timer(self, label_value)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            series = {
+                k: (list(counts), total) for k, (counts, total) in self._series.items()
+            }
+
+        lines = []
+        for label_value, (counts, total) in series.items():
+            pairs = self._label_pairs(label_value)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                le = _labels({**pairs, "le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(pairs)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(pairs)} {cumulative}")
+        return lines
+
+
+class _Timer:
+    # A plain class: cheaper to enter and exit than a generator context manager
+    __slots__ = ("_histogram", "_label_value", "_start")
+
+    def __init__(self, histogram: Histogram, label_value: Optional[str]):
+        self._histogram = histogram
+        self._label_value = label_value
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc_info):
+        self._histogram.observe(time.perf_counter() - self._start, self._label_value)
+
+
+class CallbackMetric(Metric):
+    """
+    Gauge or counter read from a callback at scrape time.
+
+    The callback returns a number, a {label value: number} dict, or None to
+    omit the metric from this scrape.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Union[None, float, Dict[str, float]]],
+        kind: str = "gauge",
+        label: Optional[str] = None,
+    ):
+        super().__init__(name, documentation, label)
+        self.kind = kind
+        self._callback = callback
+
+    def _samples(self) -> List[str]:
+        value = self._callback()
+        if value is None:
+            return []
+        if not isinstance(value, dict):
+            value = {None: value}
+        return [
+            f"{self.name}{_labels(self._label_pairs(k))} {_format_value(v)}"
+            for k, v in value.items()
+        ]
+
+
+class MetricsRegistry:
+    """Ordered set of metric families rendered together for a scrape."""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+class StageTimings(dict):
+    """Seconds per named stage, accumulated over repeated stages."""
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self[name] = self.get(name, 0.0) + time.perf_counter() - start
+
+
+# Process-wide metrics, served on /metrics
+REGISTRY = MetricsRegistry()
+
+INGEST_STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "radar_ingest_stage_seconds",
+        "Time spent per ingest stage.",
+        INGEST_STAGE_BUCKETS,
+        label="stage",
+    )
+)
+INGESTS = REGISTRY.register(
+    Counter("radar_ingests_total", "Ingested GRIB2 files by result.", label="result")
+)
+TILE_STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "radar_tile_stage_seconds",
+        "Time spent per tile rendering stage.",
+        TILE_STAGE_BUCKETS,
+        label="stage",
+    )
+)
+TILE_REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "radar_tile_request_seconds",
+        "Tile request handling time, from routing to response.",
+        TILE_STAGE_BUCKETS,
+    )
+)
+TILE_RESPONSES = REGISTRY.register(
+    Counter("radar_tile_responses_total", "Tile responses by status.", label="status")
+)
+TILE_BYTES_SERVED = REGISTRY.register(
+    Counter("radar_tile_bytes_served_total", "Bytes sent in tile responses.")
+)
@@ -0,0 +1,93 @@
+from pathlib import Path
+from typing import Dict, NamedTuple
+
+from app.config import DEFAULT_PRODUCT, NOAA_MRMS_URL, PRODUCTS, PRODUCTS_DIR
+from app.services.colormap import (
+    ECHO_TOP_RAMP,
+    PRECIP_RATE_RAMP,
+    REFLECTIVITY_RAMP,
+    ColorRamp,
+)
+
+
+class Product(NamedTuple):
+    """One MRMS 2D product: where it is published and how it is drawn."""
+
+    # URL and storage name, e.g. /tiles/{name}/{z}/{x}/{y}.png
+    name: str
+    title: str
+    # Directory under NOAA_MRMS_URL, and file name up to ".latest.grib2.gz"
+    # (timestamped frames add a level suffix: _00.50_YYYYMMDD-HHMMSS)
+    directory: str
+    file_stem: str
+    units: str
+    # Key of values in API responses and vector tile properties (dbz, max_dbz)
+    value_key: str
+    ramp: ColorRamp
+    # Decoded values below this are no data (missing or outside coverage)
+    nodata_below: float
+
+    @property
+    def url(self) -> str:
+        return f"{NOAA_MRMS_URL}{self.directory}/"
+
+    @property
+    def latest_file(self) -> str:
+        return f"{self.file_stem}.latest.grib2.gz"
+
+    @property
+    def data_dir(self) -> Path:
+        return PRODUCTS_DIR / self.name
+
+    @property
+    def manifest(self) -> Path:
+        return self.data_dir / "manifest.json"
+
+    @property
+    def generations_dir(self) -> Path:
+        return self.data_dir / "generations"
+
+
+# Every product the server knows; PRODUCTS selects the ones that run.
+# MRMS marks missing data with -999 and no radar coverage with -99 (-3 for
+# precipitation rate); a no-echo 0 is kept as a value and drawn transparent
+CATALOG: Dict[str, Product] = {
+    product.name: product
+    for product in (
+        Product(
+            "reflectivity", "Reflectivity at lowest altitude",
+            "ReflectivityAtLowestAltitude", "MRMS_ReflectivityAtLowestAltitude",
+            "dBZ", "dbz", REFLECTIVITY_RAMP, -90,
+        ),
+        Product(
+            "composite", "Composite reflectivity",
+            "MergedReflectivityQCComposite",
+            "MRMS_MergedReflectivityQCComposite",
+            "dBZ", "dbz", REFLECTIVITY_RAMP, -90,
+        ),
+        Product(
+            "precip_rate", "Precipitation rate",
+            "PrecipRate", "MRMS_PrecipRate",
+            "mm/hr", "mm_hr", PRECIP_RATE_RAMP, 0,
+        ),
+        Product(
+            "echo_tops", "18 dBZ echo tops",
+            "EchoTop_18", "MRMS_EchoTop_18",
+            "km", "km", ECHO_TOP_RAMP, 0,
+        ),
+    )
+}
+
+_unknown = [name for name in PRODUCTS if name not in CATALOG]
+if _unknown:
+    raise ValueError(
+        f"Unknown PRODUCTS {', '.join(_unknown)}; known: {', '.join(CATALOG)}"
+    )
+
+# The configured products, in PRODUCTS order
+ENABLED_PRODUCTS: Dict[str, Product] = {name: CATALOG[name] for name in PRODUCTS}
+
+
+def default_product() -> Product:
+    """The product served on the routes without a product name."""
+    return ENABLED_PRODUCTS[DEFAULT_PRODUCT]
@@ -0,0 +1,272 @@
+import logging
+import os
+import tempfile
+from pathlib import Path
+from typing import List, Tuple
+
+import numpy as np
+from affine import Affine
+
+from app.services.colormap import REFLECTIVITY_RAMP
+from app.services.value_grid import ValueGrid
+
+logger = logging.getLogger(__name__)
+
+# Edge length in pixels of the blocks the tables are built over
+STATS_BLOCK = 16
+
+# Reflectivity thresholds counted: the lower bound of every color band above
+# "none"; other products count their own ramp's bands
+STATS_THRESHOLDS = REFLECTIVITY_RAMP.thresholds
+
+
+def _levels(values: np.ndarray, thresholds: np.ndarray) -> np.ndarray:
+    """0 for no data, else 1 + the number of thresholds at or below the value."""
+    levels = (~np.isnan(values)).astype(np.uint8)
+    for threshold in thresholds:
+        # NaN compares False
+        levels += values >= threshold
+    return levels
+
+
+def _fringe(
+    r0: int, r1: int, c0: int, c1: int, ir0: int, ir1: int, ic0: int, ic1: int
+) -> Tuple[Tuple[slice, slice], ...]:
+    """The four strips of [r0, r1) x [c0, c1) around [ir0, ir1) x [ic0, ic1)."""
+    return (
+        (slice(r0, ir0), slice(c0, c1)),
+        (slice(ir1, r1), slice(c0, c1)),
+        (slice(ir0, ir1), slice(c0, ic0)),
+        (slice(ir0, ir1), slice(ic1, c1)),
+    )
+
+
+class RegionStats:
+    """
+    Summed-area tables and a max pyramid over one generation's grid, for
+    bounding-box aggregates.
+
+    The grid is cut into STATS_BLOCK x STATS_BLOCK blocks. For every
+    threshold (plus "has data") a summed-area table over the blocks gives
+    the pixel count of any block-aligned rectangle in four lookups, and a
+    pyramid of 2x2 block maxima gives its maximum in O(log) slices. A bbox
+    is answered exactly: its block-aligned interior from the tables, and the
+    partial blocks along its edges (at most STATS_BLOCK pixels deep) from the
+    full-resolution grid.
+    """
+
+    def __init__(
+        self,
+        counts: np.ndarray,
+        maxima: List[np.ndarray],
+        transform: Affine,
+        shape: Tuple[int, int],
+        block: int = STATS_BLOCK,
+        thresholds: np.ndarray = STATS_THRESHOLDS,
+    ):
+        # counts[k] is the summed-area table of layer k: 0 is "has data",
+        # k >= 1 is ">= thresholds[k - 1]"
+        self.counts = counts
+        self.thresholds = thresholds
+        # Block maxima, then 2x2 reductions down to one cell; -inf is no data
+        self.maxima = maxima
+        self.transform = transform
+        self.shape = shape
+        self.block = block
+
+    @classmethod
+    def build(
+        cls,
+        values: np.ndarray,
+        transform: Affine,
+        block: int = STATS_BLOCK,
+        thresholds: np.ndarray = STATS_THRESHOLDS,
+    ) -> "RegionStats":
+        """Build the tables from a float32 grid with NaN for no data."""
+        height, width = values.shape
+        rows, cols = -(-height // block), -(-width // block)
+        level_count = len(thresholds) + 2
+
+        histogram = np.empty((rows, cols, level_count), dtype=np.int64)
+        block_max = np.empty((rows, cols), dtype=np.float32)
+        col_offsets = (np.arange(width) // block * level_count)[np.newaxis, :]
+        col_starts = np.arange(0, width, block)
+        for row in range(rows):
+            strip = values[row * block:(row + 1) * block]
+            ids = (col_offsets + _levels(strip, thresholds)).ravel()
+            histogram[row] = np.bincount(
+                ids, minlength=cols * level_count
+            ).reshape(cols, level_count)
+            # fmax skips NaN; an all-NaN block stays NaN
+            column_max = np.fmax.reduce(strip, axis=0)
+            block_max[row] = np.fmax.reduceat(column_max, col_starts)
+        block_max[np.isnan(block_max)] = -np.inf
+
+        # Pixels at or above each level, without level 0 (no data)
+        at_least = np.cumsum(histogram[..., ::-1], axis=-1)[..., ::-1][..., 1:]
+        dtype = np.int32 if height * width < 2**31 else np.int64
+        counts = np.zeros((at_least.shape[-1], rows + 1, cols + 1), dtype=dtype)
+        layers = np.moveaxis(at_least, -1, 0)
+        counts[:, 1:, 1:] = layers.cumsum(axis=1).cumsum(axis=2)
+
+        maxima = [block_max]
+        while maxima[-1].shape != (1, 1):
+            maxima.append(cls._downsample(maxima[-1]))
+
+        return cls(counts, maxima, transform, (height, width), block, thresholds)
+
+    @staticmethod
+    def _downsample(maxima: np.ndarray) -> np.ndarray:
+        """Max-reduce 2x2 cells into their parent."""
+        height, width = maxima.shape
+        padded = np.pad(
+            maxima, ((0, height % 2), (0, width % 2)), constant_values=-np.inf
+        )
+        h, w = padded.shape
+        return padded.reshape(h // 2, 2, w // 2, 2).max(axis=(1, 3))
+
+    def query(
+        self,
+        bbox: Tuple[float, float, float, float],
+        grid: ValueGrid,
+        value_key: str = "dbz",
+    ) -> dict:
+        """
+        Aggregate the pixels whose centres lie in bbox (west, south, east,
+        north); grid supplies the full-resolution edge strips. The maximum
+        is reported as max_{value_key}.
+        """
+        r0, r1, c0, c1 = self._pixel_window(bbox)
+        pixels = max(r1 - r0, 0) * max(c1 - c0, 0)
+        counts = np.zeros(len(self.counts), dtype=np.int64)
+        maximum = -np.inf
+
+        if pixels:
+            block = self.block
+            height, width = self.shape
+            br0, bc0 = -(-r0 // block), -(-c0 // block)
+            # The last block row/column may be partial; it ends at the edge
+            br1 = r1 // block if r1 < height else self.counts.shape[1] - 1
+            bc1 = c1 // block if c1 < width else self.counts.shape[2] - 1
+
+            if br0 < br1 and bc0 < bc1:
+                sat = self.counts
+                counts += (
+                    sat[:, br1, bc1] - sat[:, br0, bc1]
+                    - sat[:, br1, bc0] + sat[:, br0, bc0]
+                )
+                maximum = self._range_max(0, br0, br1, bc0, bc1)
+                strips = _fringe(
+                    r0, r1, c0, c1,
+                    br0 * block, min(br1 * block, height),
+                    bc0 * block, min(bc1 * block, width),
+                )
+            else:
+                strips = ((slice(r0, r1), slice(c0, c1)),)
+
+            for rows, cols in strips:
+                values = grid.window(rows, cols)
+                if values.size:
+                    strip_counts, strip_max = self._strip_stats(
+                        values, self.thresholds
+                    )
+                    counts += strip_counts
+                    maximum = max(maximum, strip_max)
+
+        valid = int(counts[0])
+        return {
+            "bbox": list(bbox),
+            "pixels": pixels,
+            "valid_pixels": valid,
+            f"max_{value_key}": (
+                round(float(maximum), 1) if np.isfinite(maximum) else None
+            ),
+            "pixels_above": {
+                f"{t:g}": int(n) for t, n in zip(self.thresholds, counts[1:])
+            },
+            "fraction_above": {
+                f"{t:g}": (round(int(n) / pixels, 6) if pixels else None)
+                for t, n in zip(self.thresholds, counts[1:])
+            },
+        }
+
+    def _pixel_window(
+        self, bbox: Tuple[float, float, float, float]
+    ) -> Tuple[int, int, int, int]:
+        """Rows [r0, r1) and columns [c0, c1) of pixel centres inside bbox."""
+        west, south, east, north = bbox
+        t = self.transform
+        height, width = self.shape
+        c0 = int(np.ceil((west - t.c) / t.a - 0.5))
+        c1 = int(np.floor((east - t.c) / t.a - 0.5)) + 1
+        r0 = int(np.ceil((north - t.f) / t.e - 0.5))
+        r1 = int(np.floor((south - t.f) / t.e - 0.5)) + 1
+        return (
+            min(max(r0, 0), height), min(max(r1, 0), height),
+            min(max(c0, 0), width), min(max(c1, 0), width),
+        )
+
+    def _range_max(self, level: int, r0: int, r1: int, c0: int, c1: int) -> float:
+        """Max of cells [r0, r1) x [c0, c1) of a pyramid level (non-empty)."""
+        cells = self.maxima[level]
+        if level + 1 < len(self.maxima):
+            # Parents entirely inside the range answer its middle
+            pr0, pr1 = -(-r0 // 2), r1 // 2
+            pc0, pc1 = -(-c0 // 2), c1 // 2
+            if pr0 < pr1 and pc0 < pc1:
+                best = self._range_max(level + 1, pr0, pr1, pc0, pc1)
+                for rows, cols in _fringe(
+                    r0, r1, c0, c1, 2 * pr0, 2 * pr1, 2 * pc0, 2 * pc1
+                ):
+                    part = cells[rows, cols]
+                    if part.size:
+                        best = max(best, float(part.max()))
+                return best
+        return float(cells[r0:r1, c0:c1].max())
+
+    @staticmethod
+    def _strip_stats(
+        values: np.ndarray, thresholds: np.ndarray
+    ) -> Tuple[np.ndarray, float]:
+        """Per-layer counts and max of a block of pixels."""
+        # Sorting and bisecting beats one compare pass per threshold
+        valid = np.sort(values[~np.isnan(values)], axis=None)
+        counts = np.empty(len(thresholds) + 1, dtype=np.int64)
+        counts[0] = len(valid)
+        counts[1:] = len(valid) - np.searchsorted(valid, thresholds)
+        return counts, float(valid[-1]) if len(valid) else -np.inf
+
+    def save(self, path: Path):
+        """Write the tables as .npz using an atomic rename."""
+        arrays = {
+            "counts": self.counts,
+            "transform": np.array(list(self.transform)[:6]),
+            "shape": np.array(self.shape, dtype=np.int64),
+            "block": np.array(self.block),
+            "thresholds": self.thresholds,
+        }
+        for i, maxima in enumerate(self.maxima):
+            arrays[f"max{i}"] = maxima
+
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".npz", dir=path.parent)
+        try:
+            with os.fdopen(temp_fd, "wb") as f:
+                # Uncompressed: the tables compress poorly and load faster as is
+                np.savez(f, **arrays)
+            os.replace(temp_path, path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+
+    @classmethod
+    def load(cls, path: Path) -> "RegionStats":
+        with np.load(path) as npz:
+            levels = sorted(int(k[3:]) for k in npz.files if k.startswith("max"))
+            return cls(
+                npz["counts"],
+                [npz[f"max{i}"] for i in levels],
+                Affine(*npz["transform"]),
+                tuple(int(n) for n in npz["shape"]),
+                int(npz["block"]),
+                npz["thresholds"],
+            )
@@ -0,0 +1,223 @@
+import fcntl
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from app.config import (
+    FRAME_COUNT,
+    FRAME_DISK_BUDGET,
+    KEEP_GENERATIONS,
+    REGISTRY_POLL_INTERVAL,
+)
+from app.services.products import Product, default_product
+
+logger = logging.getLogger(__name__)
+
+
+class Generation(NamedTuple):
+    """One ingested radar frame and the artifacts written for it."""
+
+    id: float
+    directory: str
+    bounds: Dict[str, float]
+    # Artifact name ("geotiff", "mercator", "coverage", "shared_grid") to
+    # file name inside directory
+    artifacts: Dict[str, str]
+    timestamp: Optional[str] = None
+    # Total bytes of the artifacts on disk
+    size: int = 0
+
+    def path(self, artifact: str) -> Optional[Path]:
+        """Absolute path of an artifact, or None if it was not written."""
+        name = self.artifacts.get(artifact)
+        return Path(self.directory) / name if name else None
+
+    @property
+    def timestamp_unix(self) -> Optional[int]:
+        if self.timestamp is None:
+            return None
+        return int(datetime.fromisoformat(self.timestamp).timestamp())
+
+
+def new_generation_dir(product: Product) -> Path:
+    """Create an empty, uniquely named directory for a generation's artifacts."""
+    product.generations_dir.mkdir(parents=True, exist_ok=True)
+    return Path(
+        tempfile.mkdtemp(prefix=f"{time.time():.6f}-", dir=product.generations_dir)
+    )
+
+
+class GenerationRegistry:
+    """
+    Manifest of the generation of one product being served, shared by every
+    process.
+
+    The manifest records two generations: current, whose artifacts tiles are
+    rendered from, and published, whose timestamp clients are told about.
+    Ingest stages a generation (current only) so it can be warmed, then
+    publishes it. Published generations are also inserted into frames, the
+    animation loop: the last FRAME_COUNT by timestamp, oldest first, trimmed
+    further to FRAME_DISK_BUDGET. A generation older than the published one
+    (a backfilled or late frame) only joins frames. Writers replace the
+    manifest by atomic rename; readers re-stat it at most once per
+    REGISTRY_POLL_INTERVAL, so every worker
+    switches within that interval and never sees a half-written manifest.
+    Stage and publish hold an exclusive lock on manifest.lock from re-reading
+    the manifest to pruning, so concurrent writers never drop each other's
+    frames or delete each other's directories.
+    Artifacts live in per-generation directories that are never modified,
+    so a worker still on the previous generation keeps reading valid files.
+    """
+
+    def __init__(self, product: Optional[Product] = None):
+        self.product = product if product is not None else default_product()
+        self.path = self.product.manifest
+        self.lock_path = self.path.with_name("manifest.lock")
+        self.current: Optional[Generation] = None
+        self.published: Optional[Generation] = None
+        self.frames: Tuple[Generation, ...] = ()
+        self._frames_by_timestamp: Dict[int, Generation] = {}
+        self._signature = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def reload(self, force: bool = False) -> Optional[Generation]:
+        """Pick up a newer manifest if one was written; returns current."""
+        now = time.monotonic()
+        if not force and now - self._checked_at < REGISTRY_POLL_INTERVAL:
+            return self.current
+
+        with self._lock:
+            self._checked_at = now
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                return self.current
+
+            signature = (st.st_ino, st.st_mtime_ns, st.st_size)
+            if signature == self._signature:
+                return self.current
+
+            try:
+                with open(self.path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Failed to read {self.path.name}: {e}")
+                return self.current
+
+            self._signature = signature
+            self.current = _from_dict(manifest.get("current"))
+            self.published = _from_dict(manifest.get("published"))
+            self.frames = tuple(
+                Generation(**frame) for frame in manifest.get("frames", [])
+            )
+            self._frames_by_timestamp = {
+                frame.timestamp_unix: frame for frame in self.frames
+            }
+        return self.current
+
+    def frame(self, timestamp_unix: int) -> Optional[Generation]:
+        """The published generation with this timestamp, if still kept."""
+        return self._frames_by_timestamp.get(timestamp_unix)
+
+    def is_past(self, generation: Generation) -> bool:
+        """Whether generation is older than the published one."""
+        self.reload()
+        return _order(generation) < _order(self.published)
+
+    def stage(self, generation: Generation):
+        """Make generation the one tiles are rendered from, unless it is past."""
+        with self._locked():
+            self.reload(force=True)
+            if self.is_past(generation):
+                return
+            self._write(generation, self.published, list(self.frames))
+
+    def publish(self, generation: Generation):
+        """
+        Make generation current and advertise it, or only add it to frames
+        if it is past; prune old artifacts.
+        """
+        with self._locked():
+            self.reload(force=True)
+            frames = [f for f in self.frames if f.timestamp != generation.timestamp]
+            frames.append(generation)
+            frames = sorted(frames, key=_order)[-FRAME_COUNT:]
+            while len(frames) > 1 and sum(f.size for f in frames) > FRAME_DISK_BUDGET:
+                frames.pop(0)
+            if self.is_past(generation):
+                self._write(self.current, self.published, frames)
+            else:
+                self._write(generation, generation, frames)
+            self._prune()
+
+    @contextmanager
+    def _locked(self):
+        """Hold the manifest's exclusive writer lock, across processes."""
+        self.lock_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _write(
+        self,
+        current: Generation,
+        published: Optional[Generation],
+        frames: List[Generation],
+    ):
+        manifest = {
+            "current": current._asdict(),
+            "published": published._asdict() if published else None,
+            "frames": [frame._asdict() for frame in frames],
+        }
+        temp_fd, temp_path = tempfile.mkstemp(suffix=".json", dir=self.path.parent)
+        try:
+            with os.fdopen(temp_fd, "w") as f:
+                json.dump(manifest, f)
+            os.replace(temp_path, self.path)
+        except Exception:
+            Path(temp_path).unlink(missing_ok=True)
+            raise
+        self.reload(force=True)
+
+    def _prune(self):
+        """
+        Delete generation directories the manifest no longer references,
+        sparing the newest KEEP_GENERATIONS for workers that lag behind.
+        """
+        keep = {
+            Path(g.directory).name
+            for g in (self.current, self.published, *self.frames)
+            if g
+        }
+        directories = sorted(
+            (p for p in self.product.generations_dir.iterdir() if p.is_dir()),
+            key=lambda p: p.stat().st_mtime,
+            reverse=True,
+        )
+        for directory in directories[KEEP_GENERATIONS:]:
+            if directory.name not in keep:
+                shutil.rmtree(directory, ignore_errors=True)
+                logger.debug(f"Removed generation {directory.name}")
+
+
+def _from_dict(data: Optional[dict]) -> Optional[Generation]:
+    return Generation(**data) if data else None
+
+
+def _order(generation: Optional[Generation]) -> float:
+    """Sort key by frame time; a missing or untimed generation sorts first."""
+    if generation is None or generation.timestamp is None:
+        return float("-inf")
+    return datetime.fromisoformat(generation.timestamp).timestamp()
@@ -0,0 +1,62 @@
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class RenderQueueFull(Exception):
+    """Raised when too many distinct renders are already in flight."""
+
+
+class RenderQueue:
+    """
+    Runs blocking tile renders on a bounded thread pool.
+
+    Concurrent requests for the same key share a single render (single-flight),
+    and new keys are rejected once max_pending renders are outstanding so
+    latency stays bounded under bursts.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="tile-render",
+        )
+        self._max_pending = max_pending
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+
+    @property
+    def pending(self) -> int:
+        """Number of distinct renders currently queued or running."""
+        return len(self._inflight)
+
+    async def run(self, key: Hashable, func: Callable[..., bytes], *args) -> bytes:
+        """
+        Run func(*args) on the pool, coalescing with any in-flight render for key.
+
+        Raises RenderQueueFull if the render would exceed the pending limit.
+        """
+        future = self._inflight.get(key)
+
+        if future is None:
+            if len(self._inflight) >= self._max_pending:
+                raise RenderQueueFull(f"{len(self._inflight)} renders pending")
+
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._executor, func, *args)
+            self._inflight[key] = future
+
+            def _done(f: asyncio.Future, key=key):
+                if self._inflight.get(key) is f:
+                    del self._inflight[key]
+
+            future.add_done_callback(_done)
+
+        # Shield so a disconnecting client doesn't cancel the shared render
+        return await asyncio.shield(future)
+
+    def shutdown(self):
+        """Stop accepting work and release the worker threads."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,89 @@
+import json
+import logging
+from pathlib import Path
+from typing import Dict
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+from app.services.mercator_grid import MercatorGrid
+
+logger = logging.getLogger(__name__)
+
+# Bumped when the header layout changes
+SHARED_GRID_VERSION = 1
+
+
+def publish_levels(geotiff_path: Path, name: str) -> dict:
+    """
+    Copy a GeoTIFF's base raster and overviews into .npy files beside it.
+
+    Returns the header entry describing the levels.
+    """
+    directory = geotiff_path.parent
+
+    with rasterio.open(geotiff_path) as src:
+        crs = src.crs.to_epsg()
+        nodata = src.nodata
+        bounds = list(src.bounds)
+        overview_count = len(src.overviews(1))
+
+    levels = []
+    for i in range(overview_count + 1):
+        # Level 0 is the base raster, then overviews finest to coarsest
+        kwargs = {"overview_level": i - 1} if i else {}
+        with rasterio.open(geotiff_path, **kwargs) as src:
+            data = src.read(1)
+            transform = src.transform
+        filename = f"{name}-{i}.npy"
+        np.save(directory / filename, data)
+        levels.append(
+            {
+                "file": filename,
+                "shape": list(data.shape),
+                "transform": list(transform)[:6],
+            }
+        )
+
+    return {
+        "crs": crs,
+        "nodata": nodata,
+        "bounds": bounds,
+        "dtype": str(data.dtype),
+        "levels": levels,
+    }
+
+
+def publish_header(header_path: Path, grids: Dict[str, dict]):
+    """Describe the published grids; arrays are resolved beside the header."""
+    header = {"version": SHARED_GRID_VERSION, "grids": grids}
+    with open(header_path, "w") as f:
+        json.dump(header, f)
+
+
+def open_shared_grids(header_path: Path) -> Dict[int, MercatorGrid]:
+    """
+    Map every grid of a generation read-only, keyed by EPSG code.
+
+    Mapped pages are shared with every other process mapping the same files
+    through the OS page cache.
+    """
+    with open(header_path) as f:
+        header = json.load(f)
+    if header.get("version") != SHARED_GRID_VERSION:
+        raise FileNotFoundError(f"No usable shared grid header at {header_path}")
+
+    grids = {}
+    for entry in header["grids"].values():
+        levels = [
+            (
+                np.load(header_path.parent / level["file"], mmap_mode="r"),
+                Affine(*level["transform"]),
+            )
+            for level in entry["levels"]
+        ]
+        grids[entry["crs"]] = MercatorGrid(
+            levels, entry["nodata"], geographic=entry["crs"] == 4326
+        )
+    return grids
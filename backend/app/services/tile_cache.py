@@ -0,0 +1,165 @@
+from collections import OrderedDict
+from typing import Dict, FrozenSet, Hashable, Iterable, Optional, Tuple
+
+Tile = Tuple[int, int, int]
+
+
+class TileCache:
+    """
+    Byte-budgeted LRU cache of rendered tiles, keyed by (generation, z, x, y).
+
+    - Entries are charged by their encoded size, so a dense storm tile costs
+      more than the few-hundred-byte transparent tile.
+    - Tiles at or below pin_max_zoom in the current generation are pinned:
+      every client requests them and they are never evicted by LRU.
+    - When a new generation starts, the previous one is kept (and evicted
+      first under pressure) until mark_warm() is called for the new one.
+      Older generations are dropped in bulk, except those passed to
+      retain() (past animation frames), which are likewise evicted first.
+
+    Not thread-safe; callers serialize access.
+    """
+
+    def __init__(self, max_bytes: int, pin_max_zoom: int = -1):
+        self.max_bytes = max_bytes
+        self.pin_max_zoom = pin_max_zoom
+        self._lru: Dict[Hashable, "OrderedDict[Tile, bytes]"] = {}
+        self._pinned: Dict[Hashable, Dict[Tile, bytes]] = {}
+        self._generation: Optional[Hashable] = None
+        self._previous: Optional[Hashable] = None
+        self._retained: FrozenSet[Hashable] = frozenset()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def generation(self) -> Optional[Hashable]:
+        return self._generation
+
+    def get(
+        self, generation: Hashable, z: int, x: int, y: int, record: bool = True
+    ) -> Optional[bytes]:
+        """Look up a tile; record=False skips the hit/miss counters."""
+        tile = (z, x, y)
+        content = self._pinned.get(generation, {}).get(tile)
+        if content is None:
+            lru = self._lru.get(generation)
+            if lru is not None:
+                content = lru.get(tile)
+                if content is not None:
+                    lru.move_to_end(tile)
+
+        if record:
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return content
+
+    def put(self, generation: Hashable, z: int, x: int, y: int, content: bytes):
+        """Insert a tile for a retained generation, evicting to fit the budget."""
+        if generation not in self._lru:
+            if generation not in self._retained:
+                return
+            self._lru[generation] = OrderedDict()
+            self._pinned[generation] = {}
+
+        tile = (z, x, y)
+        self._discard(generation, tile)
+        if generation == self._generation and z <= self.pin_max_zoom:
+            self._pinned[generation][tile] = content
+        else:
+            self._lru[generation][tile] = content
+        self._bytes += len(content)
+        self._evict()
+
+    def set_generation(self, generation: Hashable):
+        """Start a new generation, retaining only the outgoing one."""
+        if generation == self._generation:
+            return
+
+        previous = self._generation
+        for gen in list(self._lru):
+            if gen != previous and gen not in self._retained:
+                self._drop(gen)
+
+        if previous is not None:
+            # Demote the outgoing generation's pinned tiles so they can be evicted
+            lru = self._lru[previous]
+            lru.update(self._pinned.pop(previous))
+            self._pinned[previous] = {}
+
+        self._generation = generation
+        self._previous = previous
+        self._lru.setdefault(generation, OrderedDict())
+        self._pinned.setdefault(generation, {})
+
+    def mark_warm(self, generation: Hashable):
+        """Drop every unretained generation other than the now-warm one."""
+        if generation != self._generation:
+            return
+        self._previous = None
+        for gen in list(self._lru):
+            if gen != generation and gen not in self._retained:
+                self._drop(gen)
+
+    def retain(self, generations: Iterable[Hashable]):
+        """Keep tiles of these past generations; drop formerly retained ones."""
+        self._retained = frozenset(generations)
+        keep = self._retained | {self._generation, self._previous}
+        for gen in list(self._lru):
+            if gen not in keep:
+                self._drop(gen)
+
+    def clear(self):
+        for gen in list(self._lru):
+            self._drop(gen)
+        if self._generation is not None:
+            self._lru[self._generation] = OrderedDict()
+            self._pinned[self._generation] = {}
+
+    def stats(self) -> dict:
+        entries = sum(len(lru) for lru in self._lru.values())
+        pinned = sum(len(p) for p in self._pinned.values())
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "entries": entries + pinned,
+            "pinned_entries": pinned,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "generations": len(self._lru),
+        }
+
+    def _discard(self, generation: Hashable, tile: Tile):
+        for store in (self._pinned[generation], self._lru[generation]):
+            old = store.pop(tile, None)
+            if old is not None:
+                self._bytes -= len(old)
+
+    def _drop(self, generation: Hashable):
+        for store in (self._lru.pop(generation, {}), self._pinned.pop(generation, {})):
+            self._bytes -= sum(len(content) for content in store.values())
+            self.expirations += len(store)
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            # Stale generations go first, then the current generation's LRU
+            victims = [
+                lru for gen, lru in self._lru.items()
+                if gen != self._generation and lru
+            ]
+            if not victims:
+                current = self._lru.get(self._generation)
+                if not current:
+                    # Only pinned tiles remain
+                    return
+                victims = [current]
+
+            _, content = victims[0].popitem(last=False)
+            self._bytes -= len(content)
+            self.evictions += 1
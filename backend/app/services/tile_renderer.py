@@ -1,153 +1,523 @@
 import io
 import logging
-import os
-from typing import Optional
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
 
 import numpy as np
-from cachetools import LRUCache
+from morecantile import Tile
 from PIL import Image
-from rio_tiler.io import Reader
 from rio_tiler.errors import TileOutsideBounds
+from rio_tiler.io import Reader
+from rio_tiler.models import ImageData
 
-from app.config import LATEST_GEOTIFF
-
-# Tile cache size (number of tiles to keep in memory)
-TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", 1000))
+from app.config import (
+    FRAME_OPEN_MAX,
+    METATILE_MIN_ZOOM,
+    METATILE_SIZE,
+    TILE_CACHE_MAX_BYTES,
+    TILE_CACHE_PIN_MAX_ZOOM,
+    WEB_MERCATOR_ENABLED,
+    WEB_MERCATOR_MAX_ZOOM,
+)
+from app.services.colorizer import Colorizer
+from app.services.coverage import CoverageIndex
+from app.services.dataset_pool import DatasetPool
+from app.services.metrics import TILE_STAGE_SECONDS
+from app.services.products import Product, default_product
+from app.services.registry import Generation, GenerationRegistry
+from app.services.tile_cache import TileCache
+from app.services.tile_store import TileStore, create_tile_store
 
 logger = logging.getLogger(__name__)
 
-# NOAA Standard Radar Color Ramp (discrete/banded)
-# Each entry is (min_dbz, max_dbz): (R, G, B, A)
-RADAR_BANDS = [
-    # Below threshold - transparent
-    (-999, 5, (0, 0, 0, 0)),
-    (5, 10, (0, 0, 0, 0)),
-    # Light precipitation (blues)
-    (10, 15, (64, 164, 176, 200)),    # Teal
-    (15, 20, (64, 128, 255, 220)),    # Light blue
-    # Light rain (cyans/greens)
-    (20, 25, (0, 236, 236, 230)),     # Cyan
-    (25, 30, (0, 192, 0, 240)),       # Light green
-    # Moderate (greens)
-    (30, 35, (0, 144, 0, 250)),       # Green
-    (35, 40, (0, 100, 0, 255)),       # Dark green
-    # Moderate-heavy (yellows)
-    (40, 45, (255, 255, 0, 255)),     # Yellow
-    (45, 50, (255, 192, 0, 255)),     # Orange-yellow
-    # Heavy (oranges/reds)
-    (50, 55, (255, 128, 0, 255)),     # Orange
-    (55, 60, (255, 0, 0, 255)),       # Red
-    # Very heavy (dark reds)
-    (60, 65, (192, 0, 0, 255)),       # Dark red
-    (65, 70, (144, 0, 0, 255)),       # Darker red
-    # Severe (magentas/purples)
-    (70, 75, (255, 0, 255, 255)),     # Magenta
-    (75, 80, (192, 0, 192, 255)),     # Purple
-    (80, 999, (128, 64, 255, 255)),   # Violet (extreme)
-]
-
-
-def build_discrete_colormap() -> dict:
+# Output tile edge in pixels
+TILE_SIZE = 256
+
+# Striped locks serializing renders of the same metatile
+METATILE_LOCK_STRIPES = 64
+
+
+class TileRenderer:
     """
-    Build a 256-entry colormap for rio-tiler.
+    Renders XYZ map tiles of one product from GeoTIFF radar data.
 
-    Maps scaled pixel values (0-255) back to dBZ and assigns discrete colors.
-    The colormap uses intervals/bands, not linear interpolation.
+    Safe to call from multiple render threads; cache access is serialized.
+    Dataset handles are kept open per thread for the registry's current
+    generation and swapped when the registry moves on. Past animation frames
+    get their own handles, for at most FRAME_OPEN_MAX frames at a time, and
+    their cached tiles are kept until the frame leaves the loop. With
+    use_mercator, zooms up to WEB_MERCATOR_MAX_ZOOM are cut from the
+    pre-warped in-memory raster and rio-tiler warping is only the fallback.
+    With a shared grid published for the generation, every zoom is cut from
+    memory-mapped arrays instead of read through GDAL. Tiles the coverage
+    index marks as empty are answered with the shared transparent tile
+    without a read. Misses in the in-memory cache fall through to the
+    optional shared TileStore before rendering.
     """
-    colormap = {}
 
-    # rio-tiler rescales data to 0-255
-    # We need to map these back to dBZ values
-    # Assuming data range: -10 to 80 dBZ (90 dBZ range)
-    dbz_min = -10
-    dbz_max = 80
-    dbz_range = dbz_max - dbz_min
+    def __init__(
+        self,
+        use_mercator: bool = WEB_MERCATOR_ENABLED,
+        store: Optional[TileStore] = None,
+        registry: Optional[GenerationRegistry] = None,
+        product: Optional[Product] = None,
+        cache_bytes: int = TILE_CACHE_MAX_BYTES,
+        pin_max_zoom: int = TILE_CACHE_PIN_MAX_ZOOM,
+    ):
+        self.product = product if product is not None else default_product()
+        self._use_mercator = use_mercator
+        self._store = (
+            store if store is not None else create_tile_store(self.product.name)
+        )
+        self.registry = (
+            registry if registry is not None else GenerationRegistry(self.product)
+        )
+        self._empty_tile: Optional[bytes] = None
+        self._colorizer = Colorizer(self.product.ramp)
+        self._tile_cache = TileCache(cache_bytes, pin_max_zoom)
+        self._generation: float = 0
+        self._pool: Optional[DatasetPool] = None
+        self._frames: Tuple[Generation, ...] = ()
+        self._frame_ids: Dict[float, Generation] = {}
+        self._frame_pools: "OrderedDict[float, DatasetPool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._metatile_locks = [
+            threading.Lock() for _ in range(METATILE_LOCK_STRIPES)
+        ]
 
-    for i in range(256):
-        # Convert pixel value back to dBZ
-        dbz = dbz_min + (i / 255.0) * dbz_range
+    @property
+    def generation(self) -> float:
+        """Id of the generation tiles are served from, as of the last refresh."""
+        return self._generation
 
-        # Find the appropriate color band (discrete, not interpolated)
-        color = (0, 0, 0, 0)  # Default transparent
-        for min_dbz, max_dbz, band_color in RADAR_BANDS:
-            if min_dbz <= dbz < max_dbz:
-                color = band_color
-                break
+    def refresh(self, force: bool = False) -> float:
+        """
+        Start a new cache generation and swap dataset handles if the registry
+        names a new generation.
 
-        colormap[i] = color
+        The registry re-reads its manifest at most once per poll interval
+        unless force is set, so calling this per tile costs no syscalls. A
+        new generation's pool is opened, with its coverage index loaded,
+        before it is swapped in, so this may block on disk: on the event
+        loop, read generation instead and leave refreshing to
+        routes.watch_generations. Returns the current generation id, or 0 if
+        nothing was ingested yet.
+        """
+        current = self.registry.reload(force)
+        generation = current.id if current is not None else 0
+        frames = self.registry.frames
+        if generation == self._generation and frames is self._frames:
+            return generation
 
-    return colormap
+        incoming = None
+        if current is not None and generation != self._generation:
+            incoming = self._create_pool(current)
 
+        retired = []
+        with self._lock:
+            if frames is not self._frames:
+                self._frames = frames
+                self._frame_ids = {frame.id: frame for frame in frames}
+                self._tile_cache.retain(self._frame_ids)
+                for frame in list(self._frame_pools):
+                    if frame not in self._frame_ids:
+                        retired.append(self._frame_pools.pop(frame))
 
-# Pre-build the colormap for performance
-DISCRETE_COLORMAP = build_discrete_colormap()
+            if generation != self._generation:
+                self._tile_cache.set_generation(generation)
+                self._generation = generation
+                outgoing = self._pool
+                self._pool, incoming = incoming, None
+                if outgoing is not None and outgoing.generation in self._frame_ids:
+                    # It lives on as the newest past frame
+                    self._frame_pools[outgoing.generation] = outgoing
+                    retired.extend(self._trim_frame_pools())
+                elif outgoing is not None:
+                    retired.append(outgoing)
 
+        if incoming is not None:
+            # A concurrent refresh swapped in the generation first
+            retired.append(incoming)
+        for pool in retired:
+            pool.retire()
+        if self._store is not None and generation:
+            # Bulk-delete old generations without blocking the caller
+            threading.Thread(
+                target=self._store.evict_stale,
+                args=([generation, *self._frame_ids],),
+                daemon=True,
+            ).start()
+        return generation
 
-class TileRenderer:
-    """Renders XYZ map tiles from GeoTIFF radar data."""
+    def _create_pool(self, generation: Generation) -> DatasetPool:
+        """Open a generation's pool; call outside self._lock, it reads disk."""
+        pool = DatasetPool(
+            generation.path("geotiff"),
+            generation.id,
+            generation.path("mercator") if self._use_mercator else None,
+            generation.path("coverage"),
+            generation.path("shared_grid"),
+            generation.path("region_stats"),
+            generation.path("contours"),
+            self.product,
+        )
+        pool.preload()
+        return pool
 
-    def __init__(self):
-        self._empty_tile: Optional[bytes] = None
-        self._tile_cache: LRUCache = LRUCache(maxsize=TILE_CACHE_SIZE)
-        self._last_mtime: float = 0
+    def _trim_frame_pools(self) -> List[DatasetPool]:
+        """Unlink the least recently used frame pools beyond FRAME_OPEN_MAX."""
+        retired = []
+        while len(self._frame_pools) > FRAME_OPEN_MAX:
+            _, pool = self._frame_pools.popitem(last=False)
+            retired.append(pool)
+        return retired
 
-    def _get_file_mtime(self) -> float:
-        """Get modification time of the GeoTIFF file."""
-        try:
-            return LATEST_GEOTIFF.stat().st_mtime
-        except FileNotFoundError:
-            return 0
+    def get_cached_tile(
+        self, z: int, x: int, y: int, frame: Optional[float] = None
+    ) -> Optional[bytes]:
+        """
+        Return a tile without rendering, or None on a miss.
 
-    def get_tile(self, z: int, x: int, y: int) -> bytes:
+        frame selects a past frame by generation id; None is the current one.
+        Known-empty tiles are answered from the coverage index.
+        """
+        with TILE_STAGE_SECONDS.time("cache_lookup"):
+            if frame is None or frame == self._generation:
+                generation, pool = self._generation, self._pool
+            else:
+                generation, pool = frame, self._frame_pools.get(frame)
+            if pool is not None and pool.is_empty(z, x, y):
+                return self._get_empty_tile()
+
+            with self._lock:
+                return self._tile_cache.get(generation, z, x, y)
+
+    def get_cached_vector_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """Return a vector tile of the current data without encoding, or None."""
+        with TILE_STAGE_SECONDS.time("cache_lookup"):
+            pool = self._pool
+            return pool.cached_vector_tile(z, x, y) if pool is not None else None
+
+    def _checkout_pool(self, frame: Optional[float] = None) -> Optional[DatasetPool]:
+        """Return the handle pool for a frame with a render marked in flight."""
+        while True:
+            # Open a past frame's pool before taking the lock; it reads disk
+            incoming = None
+            generation = self._frame_ids.get(frame)
+            if (
+                generation is not None
+                and frame != self._generation
+                and frame not in self._frame_pools
+            ):
+                incoming = self._create_pool(generation)
+
+            retired = []
+            with self._lock:
+                if frame is None or frame == self._generation:
+                    pool = self._pool
+                elif frame in self._frame_pools:
+                    pool = self._frame_pools[frame]
+                    self._frame_pools.move_to_end(frame)
+                elif frame in self._frame_ids:
+                    if incoming is None:
+                        # Its pool was trimmed since the check; open it again
+                        continue
+                    pool, incoming = incoming, None
+                    self._frame_pools[frame] = pool
+                    retired = self._trim_frame_pools()
+                else:
+                    pool = None
+                if pool is not None:
+                    pool.acquire()
+            break
+
+        if incoming is not None:
+            retired.append(incoming)
+        for old in retired:
+            old.retire()
+        return pool
+
+    def get_tile(
+        self, z: int, x: int, y: int, frame: Optional[float] = None
+    ) -> bytes:
         """
         Generate a PNG tile for the given z/x/y coordinates.
 
+        frame selects a past frame by generation id; None is the current one.
         Uses Web Mercator (EPSG:3857) tile scheme.
         Returns transparent tile if data unavailable or out of bounds.
-        Tiles are cached in memory and invalidated when the source file changes.
+        Tiles are cached in memory and invalidated when the generation changes.
+        From METATILE_MIN_ZOOM down, a miss renders the whole metatile around
+        the tile with one read and warp, and caches every tile in it.
+        Blocking; call from a worker thread rather than the event loop.
         """
-        if not LATEST_GEOTIFF.exists():
-            return self._get_empty_tile()
-
-        # Check if source file changed and invalidate cache
-        mtime = self._get_file_mtime()
-        if mtime != self._last_mtime:
-            self._tile_cache.clear()
-            self._last_mtime = mtime
+        # Switch to a newly staged generation, invalidating the cache
+        self.refresh()
 
-        # Check cache
-        cache_key = (z, x, y)
-        if cache_key in self._tile_cache:
-            return self._tile_cache[cache_key]
+        pool = self._checkout_pool(frame)
+        if pool is None:
+            return self._get_empty_tile()
 
         try:
-            with Reader(str(LATEST_GEOTIFF)) as src:
-                # rio-tiler handles EPSG:4326 -> EPSG:3857 reprojection
-                img = src.tile(x, y, z, tilesize=256)
-
-                # Rescale dBZ values to 0-255 for colormap
-                # MRMS reflectivity typically -10 to 80 dBZ
-                img.rescale(
-                    in_range=((-10, 80),),
-                    out_range=((0, 255),),
-                )
-
-                # Apply discrete colormap and render to PNG
-                content = img.render(
-                    colormap=DISCRETE_COLORMAP,
-                    img_format="PNG",
-                )
-
-                # Cache the rendered tile
-                self._tile_cache[cache_key] = content
+            content = self._lookup(pool, z, x, y)
+            if content is not None:
                 return content
 
+            span = self._metatile_span(z)
+            if span == 1:
+                tiles = self._render_tiles(pool, z, x, y, 1)
+            else:
+                with self._metatile_lock(pool.generation, z, x // span, y // span):
+                    # A neighbour may have rendered this metatile meanwhile
+                    content = self._lookup(pool, z, x, y)
+                    if content is not None:
+                        return content
+                    tiles = self._render_tiles(
+                        pool, z, x - x % span, y - y % span, span
+                    )
+
+            return tiles.get((x, y)) or self._get_empty_tile()
+
         except TileOutsideBounds:
             # Tile is outside the data extent
             return self._get_empty_tile()
         except Exception as e:
             logger.warning(f"Tile error z={z} x={x} y={y}: {e}")
             return self._get_empty_tile()
+        finally:
+            pool.release()
+
+    def _lookup(self, pool: DatasetPool, z: int, x: int, y: int) -> Optional[bytes]:
+        """Find a tile without rendering: cache, coverage index, shared store."""
+        with TILE_STAGE_SECONDS.time("cache_lookup"):
+            with self._lock:
+                content = self._tile_cache.get(pool.generation, z, x, y, record=False)
+            if content is not None:
+                return content
+
+            if pool.is_empty(z, x, y):
+                return self._get_empty_tile()
+
+            if self._store is not None:
+                content = self._store.get(pool.generation, z, x, y)
+                if content is not None:
+                    self.cache_tile(pool.generation, z, x, y, content)
+            return content
+
+    def _metatile_span(self, z: int) -> int:
+        if z < METATILE_MIN_ZOOM:
+            return 1
+        return min(METATILE_SIZE, 2**z)
+
+    def _metatile_lock(self, *key) -> threading.Lock:
+        return self._metatile_locks[hash(key) % len(self._metatile_locks)]
+
+    def _render_tiles(
+        self, pool: DatasetPool, z: int, x0: int, y0: int, span: int
+    ) -> Dict[Tuple[int, int], bytes]:
+        """
+        Render the span x span block of tiles starting at (x0, y0).
+
+        Tiles the coverage index marks as empty are skipped. Every rendered
+        tile is cached and written to the shared store.
+        """
+        with TILE_STAGE_SECONDS.time("read"):
+            img = self._read_block(pool, z, x0, y0, span)
+        if img is None:
+            return {}
+
+        tiles = {}
+        for row in range(span):
+            for col in range(span):
+                x, y = x0 + col, y0 + row
+                if span > 1 and pool.is_empty(z, x, y):
+                    continue
+
+                rows = slice(row * TILE_SIZE, (row + 1) * TILE_SIZE)
+                cols = slice(col * TILE_SIZE, (col + 1) * TILE_SIZE)
+                content = self._render_image(ImageData(img.array[:, rows, cols]))
+
+                tiles[(x, y)] = content
+                self.cache_tile(pool.generation, z, x, y, content)
+                if self._store is not None:
+                    self._store.put(pool.generation, z, x, y, content)
+        return tiles
+
+    def _read_block(
+        self, pool: DatasetPool, z: int, x0: int, y0: int, span: int
+    ) -> Optional[ImageData]:
+        """Read (and warp, if needed) the block's data; None if it has none."""
+        grid = pool.mercator_grid() if z <= WEB_MERCATOR_MAX_ZOOM else None
+        if grid is None:
+            grid = pool.native_grid()
+
+        if grid is not None:
+            # In-memory or shared arrays: the block is index arithmetic
+            array = grid.tile(x=x0, y=y0, z=z, tilesize=TILE_SIZE, span=span)
+            return ImageData(array) if array is not None else None
+        if span == 1:
+            # rio-tiler handles EPSG:4326 -> EPSG:3857 reprojection
+            return pool.reader().tile(x0, y0, z, tilesize=TILE_SIZE)
+        return self._read_metatile(pool.reader(), z, x0, y0, span)
+
+    def _read_metatile(
+        self, src: Reader, z: int, x0: int, y0: int, span: int
+    ) -> ImageData:
+        """Read and warp a span x span block of tiles in one rio-tiler call."""
+        tms = src.tms
+        left, _, _, top = tms.xy_bounds(Tile(x=x0, y=y0, z=z))
+        _, bottom, right, _ = tms.xy_bounds(
+            Tile(x=x0 + span - 1, y=y0 + span - 1, z=z)
+        )
+        return src.part(
+            (left, bottom, right, top),
+            dst_crs=tms.rasterio_crs,
+            bounds_crs=tms.rasterio_crs,
+            height=TILE_SIZE * span,
+            width=TILE_SIZE * span,
+            max_size=None,
+        )
+
+    def cache_tile(self, generation: float, z: int, x: int, y: int, content: bytes):
+        """Cache a tile; the cache ignores generations it no longer retains."""
+        with self._lock:
+            self._tile_cache.put(generation, z, x, y, content)
+
+    def mark_warm(self, generation: float):
+        """Release the previous generation's tiles once generation is warm."""
+        with self._lock:
+            self._tile_cache.mark_warm(generation)
+
+    def sample_points(
+        self, lons: np.ndarray, lats: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """
+        Values of the current generation at each lon/lat (NaN where none).
+
+        Returns None before any data was ingested. Blocking on the first
+        query of a generation without a shared grid, which loads the grid.
+        """
+        self.refresh()
+        pool = self._checkout_pool()
+        if pool is None:
+            return None
+        try:
+            return pool.value_grid().sample(lons, lats)
+        finally:
+            pool.release()
+
+    def sample_route(
+        self, vertices: np.ndarray, max_points: Optional[int] = None
+    ) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        """
+        Sample the current generation along a polyline of (lon, lat) vertices,
+        once per grid pixel crossed.
+
+        Returns (points, distances in km, values), or None before any data was
+        ingested. Raises ValueError past max_points samples.
+        """
+        self.refresh()
+        pool = self._checkout_pool()
+        if pool is None:
+            return None
+        try:
+            grid = pool.value_grid()
+            points, distances = grid.densify(vertices, max_points)
+            return points, distances, grid.sample(points[:, 0], points[:, 1])
+        finally:
+            pool.release()
+
+    def region_stats(
+        self, bboxes: List[Tuple[float, float, float, float]]
+    ) -> Optional[List[dict]]:
+        """
+        Aggregate the current generation over each (west, south, east, north)
+        bbox: pixel counts above every band threshold and the max value.
+
+        Returns None before any data was ingested.
+        """
+        self.refresh()
+        pool = self._checkout_pool()
+        if pool is None:
+            return None
+        try:
+            stats, grid = pool.region_stats(), pool.value_grid()
+            value_key = self.product.value_key
+            return [stats.query(bbox, grid, value_key) for bbox in bboxes]
+        finally:
+            pool.release()
+
+    def get_vector_tile(self, z: int, x: int, y: int) -> Optional[bytes]:
+        """
+        Band contours of the current generation as a Mapbox Vector Tile.
+
+        Returns an empty tile before any data was ingested, and None if the
+        current generation has no contours. Blocking; call from a worker
+        thread rather than the event loop.
+        """
+        self.refresh()
+        pool = self._checkout_pool()
+        if pool is None:
+            return b""
+        try:
+            contours = pool.contours()
+            if contours is None:
+                return None
+            with TILE_STAGE_SECONDS.time("vector"):
+                return contours.tile(z, x, y)
+        finally:
+            pool.release()
+
+    def coverage(self) -> Optional[CoverageIndex]:
+        """Coverage index of the current generation, if one was built."""
+        pool = self._pool
+        return pool.coverage() if pool is not None else None
+
+    def cache_stats(self) -> dict:
+        """Hit/miss/eviction counters and memory use of the tile cache."""
+        with self._lock:
+            return self._tile_cache.stats()
+
+    def _render_image(self, img: ImageData) -> bytes:
+        """Colorize values and encode as PNG."""
+        if img.array.dtype == np.uint8:
+            # Ingest already quantized to band indices
+            with TILE_STAGE_SECONDS.time("colorize"):
+                indices = np.where(
+                    np.ma.getmaskarray(img.array[0]), 0, img.array.data[0]
+                ).astype(np.uint8)
+            with TILE_STAGE_SECONDS.time("encode"):
+                return self._encode_palette_png(indices)
+
+        # Same colors as rescaling the ramp's range to 0-255 and applying its
+        # colormap, in one pass over preallocated buffers
+        with TILE_STAGE_SECONDS.time("colorize"):
+            rgba = self._colorizer.colorize(img.array)
+        with TILE_STAGE_SECONDS.time("encode"):
+            return self._colorizer.encode_png(rgba)
+
+    def _encode_palette_png(self, indices: np.ndarray) -> bytes:
+        """Encode band indices as an 8-bit palette PNG (PLTE + tRNS)."""
+        img = Image.fromarray(indices, mode="P")
+        img.putpalette(self.product.ramp.palette, rawmode="RGBA")
+        buffer = io.BytesIO()
+        img.save(buffer, format="PNG")
+        return buffer.getvalue()
+
+    def close(self):
+        """Close open dataset handles and the shared tile store."""
+        with self._lock:
+            retired = [self._pool, *self._frame_pools.values()]
+            self._pool = None
+            self._frame_pools.clear()
+            self._frames, self._frame_ids = (), {}
+            self._generation = 0
+        for pool in retired:
+            if pool is not None:
+                pool.retire()
+        if self._store is not None:
+            self._store.close()
 
     def _get_empty_tile(self) -> bytes:
         """Return a cached transparent 256x256 PNG tile."""
@@ -0,0 +1,139 @@
+import logging
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterable, Optional
+
+from app.config import TILE_STORE, TILE_STORE_PATH
+
+logger = logging.getLogger(__name__)
+
+
+class TileStore:
+    """
+    Second-tier tile cache shared by every worker process on the host.
+
+    Entries are keyed by (generation, z, x, y) within the store's namespace,
+    one per product. Implementations must be safe to call from multiple
+    threads and processes at once.
+    """
+
+    def get(self, generation: float, z: int, x: int, y: int) -> Optional[bytes]:
+        raise NotImplementedError
+
+    def put(self, generation: float, z: int, x: int, y: int, content: bytes):
+        raise NotImplementedError
+
+    def evict_stale(self, generations: Iterable[float]):
+        """Drop every entry of the namespace not in one of generations."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteTileStore(TileStore):
+    """
+    MBTiles-style SQLite store in DATA_DIR.
+
+    Uses WAL mode so readers in other workers never block on a writer, and one
+    connection per thread. Survives restarts; stale generations are deleted in
+    bulk when a worker first sees a new generation. Every product's stores
+    share one file, with generations stored as "{namespace}:{generation}".
+    """
+
+    def __init__(self, path: Path, namespace: str):
+        self.path = path
+        self.namespace = namespace
+        self._prefix = f"{namespace}:"
+        self._local = threading.local()
+        self._connections = []
+        self._lock = threading.Lock()
+
+        conn = self._connection()
+        conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS tiles (
+                generation TEXT NOT NULL,
+                zoom_level INTEGER NOT NULL,
+                tile_column INTEGER NOT NULL,
+                tile_row INTEGER NOT NULL,
+                tile_data BLOB NOT NULL,
+                PRIMARY KEY (generation, zoom_level, tile_column, tile_row)
+            ) WITHOUT ROWID
+            """
+        )
+        conn.commit()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def get(self, generation: float, z: int, x: int, y: int) -> Optional[bytes]:
+        try:
+            row = self._connection().execute(
+                "SELECT tile_data FROM tiles WHERE generation = ? "
+                "AND zoom_level = ? AND tile_column = ? AND tile_row = ?",
+                (self._key(generation), z, x, y),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"Tile store read failed: {e}")
+            return None
+        return row[0] if row else None
+
+    def put(self, generation: float, z: int, x: int, y: int, content: bytes):
+        conn = self._connection()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO tiles VALUES (?, ?, ?, ?, ?)",
+                (self._key(generation), z, x, y, content),
+            )
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Tile store write failed: {e}")
+
+    def evict_stale(self, generations: Iterable[float]):
+        keep = [self._key(generation) for generation in generations]
+        conn = self._connection()
+        try:
+            # Rows without a namespace predate products and are always stale
+            deleted = conn.execute(
+                "DELETE FROM tiles WHERE (substr(generation, 1, ?) = ? "
+                "OR instr(generation, ':') = 0) AND generation NOT IN "
+                f"({', '.join('?' * len(keep))})",
+                [len(self._prefix), self._prefix, *keep],
+            ).rowcount
+            conn.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"Tile store eviction failed: {e}")
+            return
+        if deleted:
+            logger.info(
+                f"Evicted {deleted} stale {self.namespace} tiles from "
+                f"{self.path.name}"
+            )
+
+    def _key(self, generation: float) -> str:
+        return f"{self._prefix}{generation!r}"
+
+    def close(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+
+
+def create_tile_store(namespace: str) -> Optional[TileStore]:
+    """Build the configured shared tile store, or None if disabled."""
+    if TILE_STORE == "sqlite":
+        return SQLiteTileStore(TILE_STORE_PATH, namespace)
+    if TILE_STORE != "none":
+        logger.warning(f"Unknown TILE_STORE '{TILE_STORE}', shared cache disabled")
+    return None
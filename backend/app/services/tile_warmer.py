@@ -0,0 +1,182 @@
+import asyncio
+import logging
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import morecantile
+
+from app.services.products import ENABLED_PRODUCTS
+from app.services.tile_renderer import TileRenderer
+
+logger = logging.getLogger(__name__)
+
+# Tiles per worker task; amortizes inter-process overhead
+WARM_BATCH_SIZE = 16
+
+WEB_MERCATOR_TMS = morecantile.tms.get("WebMercatorQuad")
+
+# Tile cache of each warm worker's renderers. Warmed tiles are cached by the
+# serving process (and the shared store), so workers only keep enough for the
+# rest of a metatile to be found by the next tiles of a batch; nothing is
+# pinned
+WARM_WORKER_CACHE_BYTES = 8 * 1024 * 1024
+
+# Renderers owned by each warm worker process, by product name
+_worker_renderers: Dict[str, TileRenderer] = {}
+
+
+def _render_batch(
+    product: str, generation: float, tiles: List[Tuple[int, int, int]]
+) -> List[Tuple[int, int, int, bytes]]:
+    """Render tiles in a worker process; skip the batch if the data moved on."""
+    renderer = _worker_renderers.get(product)
+    if renderer is None:
+        renderer = TileRenderer(
+            product=ENABLED_PRODUCTS[product],
+            cache_bytes=WARM_WORKER_CACHE_BYTES,
+            pin_max_zoom=-1,
+        )
+        _worker_renderers[product] = renderer
+
+    # The generation was just staged; don't wait out the registry poll interval
+    if renderer.refresh(force=True) != generation:
+        return []
+    return [(z, x, y, renderer.get_tile(z, x, y)) for z, x, y in tiles]
+
+
+class TileWarmer:
+    """
+    Pre-renders a zoom range into the tile cache right after each ingest.
+
+    Rendering runs in a process pool so warming never competes with the
+    serving threads for the GIL; every product shares the pool, so products
+    ingested together are warmed side by side. The workers write each tile
+    to the shared TileStore, where every serving worker finds it, and the
+    ingest process also caches it in memory. Tiles the coverage index marks
+    as empty are skipped. Warming stops at the time budget; whatever finished
+    is cached.
+    """
+
+    def __init__(
+        self,
+        min_zoom: int,
+        max_zoom: int,
+        workers: int,
+        time_budget: float,
+    ):
+        self.min_zoom = min_zoom
+        self.max_zoom = max_zoom
+        self.time_budget = time_budget
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        self.last_report: Optional[dict] = None
+
+    def _plan(
+        self, renderer: TileRenderer, bounds: Dict[str, float]
+    ) -> Dict[int, List[Tuple[int, int]]]:
+        """Tiles to render per zoom, using the coverage index when available."""
+        coverage = renderer.coverage()
+        plan = {}
+        for z in range(self.min_zoom, self.max_zoom + 1):
+            if coverage is not None and z <= coverage.max_zoom:
+                plan[z] = coverage.tiles(z)
+            else:
+                plan[z] = [
+                    (x, y) for x, y in self._tiles_in(bounds, z)
+                    if coverage is None or not coverage.is_empty(z, x, y)
+                ]
+        return plan
+
+    @staticmethod
+    def _tiles_in(bounds: Dict[str, float], z: int):
+        for tile in WEB_MERCATOR_TMS.tiles(
+            bounds["west"], bounds["south"], bounds["east"], bounds["north"],
+            zooms=[z],
+        ):
+            yield tile.x, tile.y
+
+    async def warm(self, renderer: TileRenderer, bounds: Dict[str, float]) -> dict:
+        """
+        Render the configured zooms for the renderer's current generation into
+        its cache.
+
+        Returns a report with per-zoom tile counts and elapsed seconds.
+        """
+        start = time.monotonic()
+        product = renderer.product.name
+        # The generation was just staged; refreshing reads the manifest and
+        # opens its pool, so it runs off the event loop
+        generation = await asyncio.to_thread(renderer.refresh, True)
+        plan = self._plan(renderer, bounds)
+
+        # Lowest zooms first: every client needs them, so they win the budget
+        loop = asyncio.get_running_loop()
+        futures = {}
+        for z in sorted(plan):
+            tiles = [(z, x, y) for x, y in plan[z]]
+            for i in range(0, len(tiles), WARM_BATCH_SIZE):
+                batch = tiles[i:i + WARM_BATCH_SIZE]
+                future = loop.run_in_executor(
+                    self._executor, _render_batch, product, generation, batch
+                )
+                futures[future] = z
+
+        zooms = {
+            z: {"planned": len(tiles), "rendered": 0, "elapsed": 0.0}
+            for z, tiles in plan.items()
+        }
+
+        failed = 0
+        pending = set(futures)
+        deadline = start + self.time_budget
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(
+                pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+            )
+            for future in done:
+                z = futures[future]
+                try:
+                    results = future.result()
+                except Exception as e:
+                    logger.warning(f"Warm batch of {product} failed at z{z}: {e}")
+                    failed += 1
+                    continue
+                for tz, x, y, content in results:
+                    renderer.cache_tile(generation, tz, x, y, content)
+                zooms[z]["rendered"] += len(results)
+                zooms[z]["elapsed"] = round(time.monotonic() - start, 3)
+
+        for future in pending:
+            future.cancel()
+
+        renderer.mark_warm(generation)
+
+        report = {
+            "product": product,
+            "generation": generation,
+            "elapsed": round(time.monotonic() - start, 3),
+            "complete": not pending and not failed,
+            "zooms": zooms,
+        }
+        self.last_report = report
+
+        summary = ", ".join(
+            f"z{z}: {r['rendered']}/{r['planned']} in {r['elapsed']:.2f}s"
+            for z, r in zooms.items()
+        )
+        status = "hit time budget" if pending else "complete"
+        logger.info(
+            f"Tile warm-up of {product} {status} in {report['elapsed']:.2f}s "
+            f"({summary})"
+        )
+        return report
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,128 @@
+import logging
+from pathlib import Path
+from typing import Optional, Tuple
+
+import numpy as np
+import rasterio
+from affine import Affine
+
+from app.services.colormap import REFLECTIVITY_RAMP, ColorRamp
+
+logger = logging.getLogger(__name__)
+
+# Mean Earth radius for along-route distances
+EARTH_RADIUS_KM = 6371.0088
+
+
+def band_values(ramp: ColorRamp) -> np.ndarray:
+    """
+    Value reported for each band index when the grid stores band indices:
+    the band's lower bound, with the transparent band 0 as no echo.
+    """
+    return np.concatenate(([np.nan], ramp.thresholds)).astype(np.float32)
+
+
+BAND_DBZ = band_values(REFLECTIVITY_RAMP)
+
+
+class ValueGrid:
+    """
+    Full-resolution EPSG:4326 grid of one generation, for point queries.
+
+    Points are answered by index arithmetic on the in-memory (or memory-
+    mapped) array, with no GDAL reads. Values are what ingest stored: the
+    product's values (dBZ rounded to GEOTIFF_DBZ_STEP if set), or with
+    COLOR_INDEX_ENABLED the lower bound of the pixel's color band, looked up
+    in band_values. No data and points outside the grid are NaN.
+    """
+
+    def __init__(
+        self,
+        data: np.ndarray,
+        transform: Affine,
+        nodata: Optional[float],
+        band_values: np.ndarray = BAND_DBZ,
+    ):
+        self.data = data
+        self.transform = transform
+        self.nodata = nodata
+        self.band_values = band_values
+        self.quantized = data.dtype == np.uint8
+
+    @classmethod
+    def load(cls, path: Path, band_values: np.ndarray = BAND_DBZ) -> "ValueGrid":
+        """Read a GeoTIFF's full-resolution band into memory."""
+        with rasterio.open(path) as src:
+            grid = cls(src.read(1), src.transform, src.nodata, band_values)
+        logger.info(
+            f"Loaded {path.name} for point queries "
+            f"({grid.data.nbytes / 1024 / 1024:.1f} MB)"
+        )
+        return grid
+
+    def sample(self, lons: np.ndarray, lats: np.ndarray) -> np.ndarray:
+        """Values at each lon/lat as float32, NaN where there is none."""
+        height, width = self.data.shape
+        t = self.transform
+        cols = np.floor((lons - t.c) / t.a).astype(np.int64)
+        rows = np.floor((lats - t.f) / t.e).astype(np.int64)
+        inside = (cols >= 0) & (cols < width) & (rows >= 0) & (rows < height)
+
+        values = self._dbz(
+            self.data[np.where(inside, rows, 0), np.where(inside, cols, 0)]
+        )
+        values[~inside] = np.nan
+        return values
+
+    def window(self, rows: slice, cols: slice) -> np.ndarray:
+        """Values of a block of the grid as float32, NaN where there is none."""
+        return self._dbz(self.data[rows, cols])
+
+    def _dbz(self, raw: np.ndarray) -> np.ndarray:
+        if self.quantized:
+            return self.band_values[raw]
+        values = raw.astype(np.float32)
+        if self.nodata is not None:
+            values[raw == self.nodata] = np.nan
+        return values
+
+    def densify(
+        self, vertices: np.ndarray, max_points: Optional[int] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sample points along a polyline of (lon, lat) vertices.
+
+        Each segment is split into steps no longer than one grid pixel, so
+        every pixel the route crosses is sampled. Straight lines are in
+        lon/lat, as on the grid. Returns the (n, 2) points and the distance
+        along the route to each, in kilometres. Raises ValueError if that
+        takes more than max_points samples.
+        """
+        if len(vertices) < 2:
+            return vertices.copy(), np.zeros(len(vertices))
+
+        t = self.transform
+        delta = np.diff(vertices, axis=0)
+        pixels = np.maximum(np.abs(delta[:, 0] / t.a), np.abs(delta[:, 1] / t.e))
+        steps = np.maximum(np.ceil(pixels).astype(np.int64), 1)
+        if max_points is not None and steps.sum() + 1 > max_points:
+            raise ValueError(
+                f"Route needs {steps.sum() + 1} samples, more than {max_points}"
+            )
+
+        # Fraction along its segment of every sample but the final vertex
+        segment = np.repeat(np.arange(len(steps)), steps)
+        first = np.cumsum(steps) - steps
+        fraction = (np.arange(steps.sum()) - first[segment]) / steps[segment]
+
+        points = np.empty((len(segment) + 1, 2))
+        points[:-1] = vertices[:-1][segment] + delta[segment] * fraction[:, None]
+        points[-1] = vertices[-1]
+
+        lon, lat = np.radians(points[:, 0]), np.radians(points[:, 1])
+        a = (
+            np.sin(np.diff(lat) / 2) ** 2
+            + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        )
+        legs = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+        return points, np.concatenate(([0.0], np.cumsum(legs)))
@@ -0,0 +1,119 @@
+"""
+Compare the LUT colorizer with rio-tiler rescale + DISCRETE_COLORMAP rendering,
+and check that both produce identical pixels.
+
+Tiles are 256x256 windows of a synthetic CONUS grid, no-data masked as the
+renderer sees them, plus windows of uniform noise over -30..100 dBZ and the
+float32 values on either side of every color threshold.
+
+Usage (from backend/):
+    python -m benchmarks.bench_colorizer [--tiles 200]
+"""
+import argparse
+import io
+import statistics
+import time
+
+import numpy as np
+from PIL import Image
+from rio_tiler.colormap import apply_cmap
+from rio_tiler.models import ImageData
+
+from app.services.colorizer import DBZ_THRESHOLDS, Colorizer
+from app.services.colormap import DISCRETE_COLORMAP
+from benchmarks.synthetic import NODATA, make_reflectivity_grid
+
+TILE = 256
+
+
+def sample_tiles(count: int, seed: int = 0) -> list:
+    """Masked (1, 256, 256) float32 dBZ tiles."""
+    rng = np.random.default_rng(seed)
+    grid = make_reflectivity_grid(2800, 1400, seed=seed)
+    tiles = []
+    for i in range(count):
+        if i % 4 == 3:
+            data = rng.uniform(-30, 100, (TILE, TILE)).astype(np.float32)
+            data[rng.random((TILE, TILE)) < 0.1] = NODATA
+        else:
+            y = rng.integers(0, grid.shape[0] - TILE)
+            x = rng.integers(0, grid.shape[1] - TILE)
+            data = grid[y:y + TILE, x:x + TILE].copy()
+        tiles.append(np.ma.MaskedArray(data[None], mask=(data == NODATA)[None]))
+
+    # Every float32 within 64 ulps of each threshold
+    edges = []
+    for threshold in DBZ_THRESHOLDS:
+        value = threshold
+        for _ in range(64):
+            value = np.nextafter(value, np.float32(-np.inf))
+        for _ in range(128):
+            edges.append(value)
+            value = np.nextafter(value, np.float32(np.inf))
+    edges = np.resize(np.array(edges, dtype=np.float32), (TILE, TILE))
+    tiles.append(np.ma.MaskedArray(edges[None], mask=np.zeros((1, TILE, TILE), bool)))
+    return tiles
+
+
+def rio_tiler_colorize(array: np.ma.MaskedArray) -> np.ndarray:
+    """The renderer's previous colorize step, as RGBA."""
+    img = ImageData(array.copy())
+    img.rescale(in_range=((-10, 80),), out_range=((0, 255),))
+    rgb, alpha = apply_cmap(img.array.data, DISCRETE_COLORMAP)
+    alpha = np.where(img.mask != 0, alpha, 0).astype(np.uint8)
+    return np.dstack([*rgb, alpha])
+
+
+def rio_tiler_png(array: np.ma.MaskedArray) -> bytes:
+    """The renderer's previous colorize and encode."""
+    img = ImageData(array.copy())
+    img.rescale(in_range=((-10, 80),), out_range=((0, 255),))
+    return img.render(colormap=DISCRETE_COLORMAP, img_format="PNG")
+
+
+def decode(png: bytes) -> np.ndarray:
+    return np.asarray(Image.open(io.BytesIO(png)).convert("RGBA"))
+
+
+def time_ms(func, tiles: list, repeat: int = 3) -> list:
+    timings = []
+    for _ in range(repeat):
+        for tile in tiles:
+            start = time.perf_counter()
+            func(tile)
+            timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--tiles", type=int, default=200)
+    args = parser.parse_args()
+
+    tiles = sample_tiles(args.tiles)
+    colorizer = Colorizer()
+
+    for tile in tiles:
+        expected = decode(rio_tiler_png(tile))
+        assert np.array_equal(rio_tiler_colorize(tile), expected)
+        assert np.array_equal(colorizer.colorize(tile), expected)
+        assert np.array_equal(decode(colorizer.render_png(tile)), expected)
+    print(f"{len(tiles)} tiles pixel-identical")
+
+    cases = (
+        ("colorize", "rio-tiler", rio_tiler_colorize),
+        ("colorize", "lut", colorizer.colorize),
+        ("colorize+png", "rio-tiler", rio_tiler_png),
+        ("colorize+png", "lut", colorizer.render_png),
+    )
+    for stage, name, func in cases:
+        timings = time_ms(func, tiles)
+        p95 = sorted(timings)[int(len(timings) * 0.95)]
+        print(
+            f"{stage:>12} {name:>9}: mean {statistics.mean(timings):.3f} ms, "
+            f"median {statistics.median(timings):.3f} ms, p95 {p95:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
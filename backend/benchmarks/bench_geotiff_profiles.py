@@ -0,0 +1,89 @@
+"""
+Compare GeoTIFF output profiles: ingest (write) time, file size and cold
+tile read latency through the rio-tiler path.
+
+Every profile runs in a fresh process with its own DATA_DIR, configured
+through the same environment variables the server reads.
+
+Usage (from backend/):
+    python -m benchmarks.bench_geotiff_profiles [--width 7000 --height 3500]
+"""
+import argparse
+import multiprocessing
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.synthetic import CONUS_BOUNDS, CONUS_HEIGHT, CONUS_WIDTH
+
+PROFILES = {
+    "gtiff-deflate": {"GEOTIFF_LAYOUT": "gtiff", "GEOTIFF_COMPRESS": "deflate"},
+    "cog-deflate": {"GEOTIFF_LAYOUT": "cog", "GEOTIFF_COMPRESS": "deflate"},
+    "cog-lzw": {"GEOTIFF_LAYOUT": "cog", "GEOTIFF_COMPRESS": "lzw"},
+    "cog-zstd": {"GEOTIFF_LAYOUT": "cog", "GEOTIFF_COMPRESS": "zstd"},
+    "cog-zstd-0.5dBZ": {
+        "GEOTIFF_LAYOUT": "cog",
+        "GEOTIFF_COMPRESS": "zstd",
+        "GEOTIFF_DBZ_STEP": "0.5",
+    },
+}
+
+
+def run_profile(env: dict, width: int, height: int) -> dict:
+    """Write the synthetic grid with one profile and time tile reads."""
+    os.environ.update(env)
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="radar-bench-")
+    # Isolate the GeoTIFF: every tile must come from a read
+    os.environ["WEB_MERCATOR_ENABLED"] = "false"
+    os.environ["COVERAGE_INDEX_ENABLED"] = "false"
+    os.environ["METATILE_SIZE"] = "1"
+    os.environ["TILE_STORE"] = "none"
+
+    from app.services.grib_processor import GRIBProcessor
+    from app.services.registry import GenerationRegistry
+    from app.services.tile_renderer import TileRenderer
+    from benchmarks.synthetic import make_reflectivity_grid, tile_trace
+
+    data = make_reflectivity_grid(width, height)
+    start = time.perf_counter()
+    generation = GRIBProcessor().write_grid(data, CONUS_BOUNDS)
+    ingest = time.perf_counter() - start
+    GenerationRegistry().publish(generation)
+
+    renderer = TileRenderer()
+    trace = tile_trace()
+    timings = []
+    for z, x, y in trace:
+        renderer._tile_cache.clear()
+        start = time.perf_counter()
+        renderer.get_tile(z, x, y)
+        timings.append((time.perf_counter() - start) * 1000)
+    renderer.close()
+
+    return {
+        "ingest": ingest,
+        "size_mb": generation.path("geotiff").stat().st_size / 1024 / 1024,
+        "mean": statistics.mean(timings),
+        "p95": sorted(timings)[int(len(timings) * 0.95)],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    args = parser.parse_args()
+
+    context = multiprocessing.get_context("spawn")
+    for name, env in PROFILES.items():
+        with context.Pool(1) as pool:
+            r = pool.apply(run_profile, (env, args.width, args.height))
+        print(
+            f"{name:>16}: ingest {r['ingest']:.2f}s, {r['size_mb']:.1f} MB, "
+            f"tiles mean {r['mean']:.2f} ms, p95 {r['p95']:.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
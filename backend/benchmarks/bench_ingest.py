@@ -0,0 +1,93 @@
+"""
+Compare GRIB2 ingest through the direct eccodes decoder and xarray/cfgrib:
+wall time and peak RSS of the decode alone and of the full ingest.
+
+Every run is a fresh process so imports, caches and peak RSS are not shared.
+
+Usage (from backend/):
+    python -m benchmarks.bench_ingest [--width 7000 --height 3500]
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.synthetic import (
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    make_reflectivity_grid,
+    write_grib2,
+)
+
+DECODERS = ("cfgrib", "eccodes")
+
+
+def _peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run_stage(decoder: str, stage: str, grib_path: str, data_dir: str) -> dict:
+    """Decode only, or fully ingest, grib_path; runs in a fresh process."""
+    os.environ["DATA_DIR"] = data_dir
+    os.environ["GRIB_DECODER"] = decoder
+
+    start = time.perf_counter()
+    from app.services.grib_processor import NODATA, GRIBProcessor
+
+    processor = GRIBProcessor()
+    imported = time.perf_counter()
+
+    ok = True
+    if stage == "ingest":
+        ok = processor.process_grib(Path(grib_path)) is not None
+    elif decoder == "eccodes":
+        from app.services.grib_decoder import decode_grib
+
+        decode_grib(Path(grib_path), NODATA)
+    else:
+        processor._decode_cfgrib(Path(grib_path))
+
+    return {
+        "ok": ok,
+        "import": imported - start,
+        "wall": time.perf_counter() - imported,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="radar-bench-")
+    grib_path = os.path.join(work_dir, "synthetic.grib2")
+    write_grib2(grib_path, make_reflectivity_grid(args.width, args.height), CONUS_BOUNDS)
+    print(
+        f"{args.width}x{args.height} grid, "
+        f"{os.path.getsize(grib_path) / 1024 / 1024:.1f} MB GRIB2"
+    )
+
+    context = multiprocessing.get_context("spawn")
+    for decoder in DECODERS:
+        for stage in ("decode", "ingest"):
+            data_dir = tempfile.mkdtemp(prefix=f"{decoder}-", dir=work_dir)
+            with context.Pool(1) as pool:
+                r = pool.apply(run_stage, (decoder, stage, grib_path, data_dir))
+            print(
+                f"{decoder:>8} {stage:>6}: import {r['import']:.2f}s, "
+                f"wall {r['wall']:.2f}s, peak RSS {r['peak_rss_mb']:.0f} MB"
+                + ("" if r["ok"] else " (FAILED)")
+            )
+
+
+if __name__ == "__main__":
+    main()
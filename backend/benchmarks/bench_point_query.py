@@ -0,0 +1,106 @@
+"""
+Time point and route reflectivity queries on a synthetic CONUS grid, in
+process and through the /api/values endpoint.
+
+Usage (from backend/):
+    python -m benchmarks.bench_point_query [--width 7000 --height 3500]
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="radar-bench-"))
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app import main as app_main  # noqa: E402
+from app.api import routes  # noqa: E402
+from app.services.grib_processor import GRIBProcessor  # noqa: E402
+from app.services.registry import GenerationRegistry  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    make_reflectivity_grid,
+)
+
+BATCH_SIZES = (1, 1000, 10000, 100000)
+
+
+def random_points(count: int, rng: np.random.Generator) -> np.ndarray:
+    west, south, east, north = CONUS_BOUNDS
+    return np.column_stack(
+        [rng.uniform(west, east, count), rng.uniform(south, north, count)]
+    )
+
+
+def report(name: str, timings: list):
+    print(
+        f"{name:>28}: mean {statistics.mean(timings):.3f} ms, "
+        f"median {statistics.median(timings):.3f} ms, min {min(timings):.3f} ms"
+    )
+
+
+async def time_http(points: np.ndarray, repeat: int) -> list:
+    transport = httpx.ASGITransport(app=app_main.app)
+    # Encoded once, so the timings leave out client-side JSON encoding
+    body = json.dumps({"points": points.tolist()}).encode()
+    headers = {"Content-Type": "application/json"}
+    timings = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = await client.post("/api/values", content=body, headers=headers)
+            timings.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    data = make_reflectivity_grid(args.width, args.height)
+    GenerationRegistry().publish(GRIBProcessor().write_grid(data, CONUS_BOUNDS))
+    renderer = routes.tile_renderer
+    rng = np.random.default_rng(0)
+
+    # First query loads the grid
+    start = time.perf_counter()
+    renderer.sample_points(np.array([-97.0]), np.array([35.0]))
+    print(f"grid load: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for count in BATCH_SIZES:
+        points = random_points(count, rng)
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            renderer.sample_points(points[:, 0], points[:, 1])
+            timings.append((time.perf_counter() - start) * 1000)
+        report(f"sample {count} points", timings)
+
+    route = random_points(10, rng)
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        samples = renderer.sample_route(route)[0]
+        timings.append((time.perf_counter() - start) * 1000)
+    report(f"route, {len(samples)} samples", timings)
+
+    for count in BATCH_SIZES[:3]:
+        timings = asyncio.run(time_http(random_points(count, rng), args.repeat))
+        report(f"POST /api/values {count}", timings)
+
+    renderer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Compare bbox aggregates from the region statistics tables with computing
+them on demand over the grid, and check that both agree.
+
+Boxes range from county to multi-state size over a synthetic CONUS grid.
+
+Usage (from backend/):
+    python -m benchmarks.bench_region_stats [--width 7000 --height 3500]
+"""
+import argparse
+import statistics
+import time
+
+import numpy as np
+from rasterio.transform import from_bounds
+
+from app.services.region_stats import STATS_THRESHOLDS, RegionStats
+from app.services.value_grid import ValueGrid
+from benchmarks.synthetic import (
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    NODATA,
+    make_reflectivity_grid,
+)
+
+
+def random_bboxes(count: int, seed: int = 0) -> list:
+    """Boxes from about 0.2 to 10 degrees on a side inside CONUS."""
+    rng = np.random.default_rng(seed)
+    west, south, east, north = CONUS_BOUNDS
+    boxes = []
+    for _ in range(count):
+        size = 10 ** rng.uniform(np.log10(0.2), 1)
+        lon = rng.uniform(west, east - size)
+        lat = rng.uniform(south, north - size / 2)
+        boxes.append((lon, lat, lon + size, lat + size / 2))
+    return boxes
+
+
+def on_demand(stats: RegionStats, values: np.ndarray, bbox: tuple) -> dict:
+    """The same aggregates computed over every pixel of the window."""
+    r0, r1, c0, c1 = stats._pixel_window(bbox)
+    window = values[r0:r1, c0:c1]
+    valid = window[~np.isnan(window)]
+    return {
+        "valid_pixels": valid.size,
+        "max_dbz": round(float(valid.max()), 1) if valid.size else None,
+        "pixels_above": {
+            f"{t:g}": int(np.count_nonzero(valid >= t)) for t in STATS_THRESHOLDS
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    parser.add_argument("--boxes", type=int, default=500)
+    args = parser.parse_args()
+
+    data = make_reflectivity_grid(args.width, args.height)
+    transform = from_bounds(*CONUS_BOUNDS, args.width, args.height)
+    grid = ValueGrid(data, transform, NODATA)
+    values = grid.window(slice(None), slice(None))
+
+    start = time.perf_counter()
+    stats = RegionStats.build(values, transform)
+    print(
+        f"build: {time.perf_counter() - start:.2f}s, "
+        f"{stats.counts.nbytes / 1024 / 1024:.1f} MB of tables"
+    )
+
+    boxes = random_bboxes(args.boxes)
+    for box in boxes:
+        expected, result = on_demand(stats, values, box), stats.query(box, grid)
+        assert all(result[key] == expected[key] for key in expected), box
+    print(f"{len(boxes)} boxes agree")
+
+    cases = (
+        ("on demand", lambda box: on_demand(stats, values, box)),
+        ("tables", lambda box: stats.query(box, grid)),
+    )
+    for name, func in cases:
+        timings = []
+        for box in boxes:
+            start = time.perf_counter()
+            func(box)
+            timings.append((time.perf_counter() - start) * 1000)
+        p95 = sorted(timings)[int(len(timings) * 0.95)]
+        print(
+            f"{name:>10}: mean {statistics.mean(timings):.3f} ms, "
+            f"median {statistics.median(timings):.3f} ms, p95 {p95:.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,65 @@
+"""
+Compare cold-tile latency of the rio-tiler warp path and the pre-warped
+Web Mercator path on a synthetic CONUS grid.
+
+Usage (from backend/):
+    python -m benchmarks.bench_tile_paths [--width 7000 --height 3500]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="radar-bench-"))
+os.environ["WEB_MERCATOR_ENABLED"] = "true"
+
+from app.services.grib_processor import GRIBProcessor  # noqa: E402
+from app.services.registry import GenerationRegistry  # noqa: E402
+from app.services.tile_renderer import TileRenderer  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    make_reflectivity_grid,
+    tile_trace,
+)
+
+
+def time_cold_tiles(renderer: TileRenderer, trace: list) -> list:
+    """Render every tile in trace with an empty cache; return ms per tile."""
+    timings = []
+    for z, x, y in trace:
+        renderer._tile_cache.clear()
+        start = time.perf_counter()
+        renderer.get_tile(z, x, y)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    args = parser.parse_args()
+
+    data = make_reflectivity_grid(args.width, args.height)
+    GenerationRegistry().publish(GRIBProcessor().write_grid(data, CONUS_BOUNDS))
+    trace = tile_trace()
+
+    for name, use_mercator in (("rio-tiler", False), ("mercator", True)):
+        renderer = TileRenderer(use_mercator=use_mercator)
+        # Warm-up: opens handles / loads the in-memory pyramid
+        renderer.get_tile(*trace[0])
+        timings = time_cold_tiles(renderer, trace)
+        p95 = sorted(timings)[int(len(timings) * 0.95)]
+        print(
+            f"{name:>10}: {len(timings)} tiles, "
+            f"mean {statistics.mean(timings):.2f} ms, "
+            f"median {statistics.median(timings):.2f} ms, p95 {p95:.2f} ms"
+        )
+        renderer.close()
+
+
+if __name__ == "__main__":
+    main()
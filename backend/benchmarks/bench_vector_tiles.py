@@ -0,0 +1,82 @@
+"""
+Compare contour vector tiles with PNG raster tiles on a synthetic CONUS grid:
+bytes per zoom for every tile over CONUS, and encode time per tile.
+
+Usage (from backend/):
+    python -m benchmarks.bench_vector_tiles [--width 7000 --height 3500]
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import time
+
+os.environ.setdefault("DATA_DIR", tempfile.mkdtemp(prefix="radar-bench-"))
+os.environ["VECTOR_TILES_ENABLED"] = "true"
+
+import morecantile  # noqa: E402
+
+from app.config import VECTOR_TILE_MAX_ZOOM  # noqa: E402
+from app.services.grib_processor import GRIBProcessor  # noqa: E402
+from app.services.metrics import StageTimings  # noqa: E402
+from app.services.registry import GenerationRegistry  # noqa: E402
+from app.services.tile_renderer import TileRenderer  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    make_reflectivity_grid,
+)
+
+TMS = morecantile.tms.get("WebMercatorQuad")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    parser.add_argument("--max-zoom", type=int, default=VECTOR_TILE_MAX_ZOOM + 2)
+    args = parser.parse_args()
+
+    data = make_reflectivity_grid(args.width, args.height)
+    timings = StageTimings()
+    generation = GRIBProcessor().write_grid(data, CONUS_BOUNDS, timings)
+    GenerationRegistry().publish(generation)
+    print(
+        f"contours: {timings['contours']:.2f}s at ingest, "
+        f"{generation.path('contours').stat().st_size / 1024 / 1024:.1f} MB"
+    )
+
+    renderer = TileRenderer()
+    # Warm-up: loads the contours and opens the raster
+    start = time.perf_counter()
+    renderer.get_vector_tile(0, 0, 0)
+    print(f"contours load: {(time.perf_counter() - start) * 1000:.1f} ms")
+    renderer.get_tile(0, 0, 0)
+
+    for z in range(args.max_zoom + 1):
+        tiles = list(TMS.tiles(*CONUS_BOUNDS, [z]))
+        sizes = {"mvt": 0, "png": 0}
+        encode = {"mvt": [], "png": []}
+        for tile in tiles:
+            for kind, render in (
+                ("mvt", renderer.get_vector_tile),
+                ("png", renderer.get_tile),
+            ):
+                start = time.perf_counter()
+                content = render(z, tile.x, tile.y)
+                encode[kind].append((time.perf_counter() - start) * 1000)
+                sizes[kind] += len(content)
+        print(
+            f"z{z:<2} {len(tiles):>5} tiles: "
+            f"mvt {sizes['mvt'] / 1024:>8.0f} KB "
+            f"({statistics.mean(encode['mvt']):.2f} ms/tile), "
+            f"png {sizes['png'] / 1024:>8.0f} KB "
+            f"({statistics.mean(encode['png']):.2f} ms/tile)"
+        )
+
+    renderer.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Local stand-in for the NOAA MRMS 2D directory, for offline runs."""
+import gzip
+import os
+import shutil
+import socket
+from datetime import datetime, timezone
+from pathlib import Path
+
+from aiohttp import web
+
+# Product directory (below the served root) and latest file of reflectivity
+PRODUCT_DIRECTORY = "ReflectivityAtLowestAltitude"
+LATEST_NAME = "MRMS_ReflectivityAtLowestAltitude.latest.grib2.gz"
+
+
+def free_port() -> int:
+    """Ask the OS for a free local TCP port."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def publish_frame(directory: Path, grib_path: Path, valid_time: datetime):
+    """
+    Gzip a GRIB2 file into directory as a timestamped frame and as latest.
+
+    Both files get valid_time as their mtime, so the server's Last-Modified
+    (which the fetcher matches against the listing) matches the frame name.
+    """
+    stamp = valid_time.strftime("%Y%m%d-%H%M%S")
+    frame = directory / f"MRMS_ReflectivityAtLowestAltitude_00.50_{stamp}.grib2.gz"
+    with open(grib_path, "rb") as src, gzip.open(frame, "wb", compresslevel=6) as dst:
+        shutil.copyfileobj(src, dst)
+
+    latest = directory / LATEST_NAME
+    temp = latest.with_suffix(".part")
+    shutil.copyfile(frame, temp)
+    mtime = valid_time.replace(tzinfo=timezone.utc).timestamp()
+    for path in (frame, temp):
+        os.utime(path, (mtime, mtime))
+    os.replace(temp, latest)
+
+
+class LocalMRMSServer:
+    """
+    Serves a directory like the MRMS 2D directory, one subdirectory per
+    product.
+
+    aiohttp's static handler answers conditional GETs (Last-Modified and
+    ETag) and renders an index page with an href per file, so the fetcher's
+    polling and backfill run unmodified against it.
+    """
+
+    def __init__(self, directory: Path, port: int):
+        self.directory = directory
+        self.port = port
+        self._runner: web.AppRunner = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_static("/", self.directory, show_index=True)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, "127.0.0.1", self.port).start()
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
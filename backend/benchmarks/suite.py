@@ -0,0 +1,296 @@
+"""
+Offline benchmark suite: ingest end to end, cold vs warm tile throughput and
+concurrent HTTP latency, on synthetic MRMS data, with JSON results.
+
+Scenarios:
+  ingest  The app starts with its fetcher pointed at a local file server that
+          holds a synthetic GRIB2 frame. Measures fetch, conversion, warm-up
+          and time until /api/metadata publishes the frame.
+  tiles   A fresh TileRenderer replays pan/zoom map sessions twice: first
+          with an empty cache (cold), then again (warm).
+  http    Concurrent clients replay their own sessions against the FastAPI
+          app in-process (httpx ASGI transport), each viewport's tiles in
+          parallel, first with an empty tile cache and then warm.
+
+Settings from the environment (WEB_MERCATOR_ENABLED, GEOTIFF_LAYOUT, ...)
+apply, so two configurations can be compared with --baseline.
+
+Usage (from backend/):
+    python -m benchmarks.suite [--width 7000 --height 3500] [--clients 8]
+        [--output results.json] [--baseline previous.json]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from benchmarks.file_server import (
+    PRODUCT_DIRECTORY,
+    LocalMRMSServer,
+    free_port,
+    publish_frame,
+)
+
+if "RADAR_SUITE_DIR" not in os.environ:
+    # Spawned workers re-import this module; they must reuse the parent's
+    os.environ["RADAR_SUITE_DIR"] = tempfile.mkdtemp(prefix="radar-suite-")
+    os.environ["RADAR_SUITE_PORT"] = str(free_port())
+WORK_DIR = Path(os.environ["RADAR_SUITE_DIR"])
+SERVER_PORT = int(os.environ["RADAR_SUITE_PORT"])
+
+# Must be set before app.config is imported
+os.environ["DATA_DIR"] = str(WORK_DIR / "data")
+os.environ["NOAA_MRMS_URL"] = f"http://127.0.0.1:{SERVER_PORT}/"
+os.environ["PRODUCTS"] = "reflectivity"
+os.environ.setdefault("POLL_INTERVAL", "1")
+os.environ.setdefault("TILE_STORE", "none")
+
+import httpx  # noqa: E402
+import numpy as np  # noqa: E402
+
+from app import main as app_main  # noqa: E402
+from app.api import routes  # noqa: E402
+from app.services.tile_renderer import TileRenderer  # noqa: E402
+from benchmarks.synthetic import (  # noqa: E402
+    CONUS_BOUNDS,
+    CONUS_HEIGHT,
+    CONUS_WIDTH,
+    make_reflectivity_grid,
+    pan_zoom_session,
+    write_grib2,
+)
+
+# Settings recorded with the results
+RECORDED_SETTINGS = (
+    "WEB_MERCATOR_ENABLED", "SHARED_GRID_ENABLED", "COLOR_INDEX_ENABLED",
+    "COVERAGE_INDEX_ENABLED", "GEOTIFF_LAYOUT", "GEOTIFF_COMPRESS",
+    "GEOTIFF_DBZ_STEP", "GRIB_DECODER", "METATILE_SIZE", "TILE_WARM_ENABLED",
+    "TILE_RENDER_WORKERS", "TILE_STORE",
+)
+
+
+def summarize(timings_ms: list) -> dict:
+    """Latency percentiles of a list of milliseconds."""
+    ordered = sorted(timings_ms)
+
+    def pct(p: float) -> float:
+        return round(ordered[min(int(len(ordered) * p), len(ordered) - 1)], 3)
+
+    return {
+        "count": len(ordered),
+        "mean": round(statistics.mean(ordered), 3),
+        "p50": pct(0.50),
+        "p90": pct(0.90),
+        "p95": pct(0.95),
+        "p99": pct(0.99),
+        "max": round(ordered[-1], 3),
+    }
+
+
+async def run_ingest(server: LocalMRMSServer, grib_path: Path, timeout: float):
+    """Start the app, let it fetch and ingest one frame, and time it."""
+    publish_frame(
+        server.directory / PRODUCT_DIRECTORY, grib_path, datetime.now(timezone.utc)
+    )
+
+    transport = httpx.ASGITransport(app=app_main.app)
+    lifespan = app_main.app.router.lifespan_context(app_main.app)
+    await lifespan.__aenter__()
+    start = time.perf_counter()
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        while True:
+            metadata = (await client.get("/api/metadata")).json()
+            if metadata["status"] == "ok":
+                break
+            if time.perf_counter() - start > timeout:
+                raise TimeoutError(f"Nothing published after {timeout:.0f}s")
+            await asyncio.sleep(0.05)
+    published = time.perf_counter() - start
+
+    warm = app_main.warmer.last_report if app_main.warmer else None
+    result = {
+        "time_to_publish": round(published, 3),
+        "fetch": app_main.fetchers["reflectivity"].last_fetch_stats,
+        "warm_elapsed": warm["elapsed"] if warm else None,
+        "warm_tiles": sum(z["rendered"] for z in warm["zooms"].values()) if warm else 0,
+        "geotiff_bytes": routes.tile_renderer.registry.current.size,
+    }
+    return lifespan, metadata, result
+
+
+def run_tiles(sessions: list) -> dict:
+    """Replay every session twice on a fresh renderer: cold, then warm."""
+    renderer = TileRenderer(store=None)
+    trace = [tile for session in sessions for viewport in session for tile in viewport]
+    renderer.get_tile(*trace[0])
+    renderer._tile_cache.clear()
+
+    results = {}
+    for phase in ("cold", "warm"):
+        timings = []
+        start = time.perf_counter()
+        for z, x, y in trace:
+            tile_start = time.perf_counter()
+            renderer.get_tile(z, x, y)
+            timings.append((time.perf_counter() - tile_start) * 1000)
+        elapsed = time.perf_counter() - start
+        results[phase] = {
+            "tiles_per_second": round(len(trace) / elapsed, 1),
+            "latency_ms": summarize(timings),
+        }
+    results["cache"] = renderer.cache_stats()
+    renderer.close()
+    return results
+
+
+async def run_http(sessions: list, timestamp: int) -> dict:
+    """Concurrent clients replay their sessions against the app."""
+    transport = httpx.ASGITransport(app=app_main.app)
+
+    async def client_session(client: httpx.AsyncClient, session: list, log: list):
+        for viewport in session:
+
+            async def fetch(z: int, x: int, y: int):
+                start = time.perf_counter()
+                response = await client.get(f"/tiles/{timestamp}/{z}/{x}/{y}.png")
+                log.append(((time.perf_counter() - start) * 1000, response.status_code))
+
+            await asyncio.gather(*(fetch(*tile) for tile in viewport))
+
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for phase in ("cold", "warm"):
+            if phase == "cold":
+                with routes.tile_renderer._lock:
+                    routes.tile_renderer._tile_cache.clear()
+            log = []
+            start = time.perf_counter()
+            await asyncio.gather(
+                *(client_session(client, session, log) for session in sessions)
+            )
+            elapsed = time.perf_counter() - start
+
+            statuses = {}
+            for _, status in log:
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+            results[phase] = {
+                "requests_per_second": round(len(log) / elapsed, 1),
+                "latency_ms": summarize([ms for ms, _ in log]),
+                "status": statuses,
+            }
+    return results
+
+
+def environment(args: argparse.Namespace) -> dict:
+    import rasterio
+
+    return {
+        "started": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "gdal": rasterio.__gdal_version__,
+        "cpus": os.cpu_count(),
+        "grid": [args.width, args.height],
+        "clients": args.clients,
+        "settings": {name: os.getenv(name) for name in RECORDED_SETTINGS},
+    }
+
+
+def flatten(results: dict, prefix: str = "") -> dict:
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{prefix}{key}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[f"{prefix}{key}"] = value
+    return flat
+
+
+def compare(results: dict, baseline: dict):
+    """Print every numeric metric next to the baseline's."""
+    current, previous = flatten(results["scenarios"]), flatten(baseline["scenarios"])
+    for key in sorted(current.keys() & previous.keys()):
+        old, new = previous[key], current[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"  {key:<45} {old:>12} -> {new:<12} {change}")
+
+
+async def run(args: argparse.Namespace) -> dict:
+    mirror = WORK_DIR / "mirror"
+    (mirror / PRODUCT_DIRECTORY).mkdir(parents=True)
+    server = LocalMRMSServer(mirror, SERVER_PORT)
+    await server.start()
+
+    grib_path = WORK_DIR / "synthetic.grib2"
+    write_grib2(grib_path, make_reflectivity_grid(args.width, args.height), CONUS_BOUNDS)
+
+    sessions = [pan_zoom_session(seed=i, steps=args.steps) for i in range(args.clients)]
+    lifespan = None
+    try:
+        lifespan, metadata, ingest = await run_ingest(server, grib_path, args.timeout)
+        print(
+            f"ingest: published in {ingest['time_to_publish']:.2f}s "
+            f"(warm-up {ingest['warm_elapsed']}s, {ingest['warm_tiles']} tiles)"
+        )
+
+        tiles = await asyncio.to_thread(run_tiles, sessions)
+        for phase in ("cold", "warm"):
+            r = tiles[phase]
+            print(
+                f"tiles {phase}: {r['tiles_per_second']} tiles/s, "
+                f"p50 {r['latency_ms']['p50']} ms, p99 {r['latency_ms']['p99']} ms"
+            )
+
+        http = await run_http(sessions, metadata["timestamp_unix"])
+        for phase in ("cold", "warm"):
+            r = http[phase]
+            print(
+                f"http {phase}: {r['requests_per_second']} req/s, "
+                f"p50 {r['latency_ms']['p50']} ms, p99 {r['latency_ms']['p99']} ms, "
+                f"status {r['status']}"
+            )
+    finally:
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        await server.stop()
+
+    return {
+        "environment": environment(args),
+        "scenarios": {"ingest": ingest, "tiles": tiles, "http": http},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--width", type=int, default=CONUS_WIDTH)
+    parser.add_argument("--height", type=int, default=CONUS_HEIGHT)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--steps", type=int, default=30, help="viewports per session")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", type=Path, help="write results as JSON")
+    parser.add_argument("--baseline", type=Path, help="JSON results to compare with")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+
+    if args.output:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Results written to {args.output}")
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        print(f"Compared with {args.baseline}:")
+        compare(results, json.loads(args.baseline.read_text()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""Synthetic MRMS-like reflectivity grids for offline benchmarks."""
+from typing import Tuple
+
+import numpy as np
+
+# MRMS CONUS grid: 0.01 degree spacing, pixel centres 54.995N..20.005N, 130W..60W
+CONUS_WIDTH = 7000
+CONUS_HEIGHT = 3500
+CONUS_BOUNDS = (-129.995, 20.005, -60.005, 54.995)
+
+NODATA = -999.0
+
+
+def make_reflectivity_grid(
+    width: int = CONUS_WIDTH,
+    height: int = CONUS_HEIGHT,
+    storms: int = 60,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Build a north-up float32 dBZ grid with clear-air noise and storm cells.
+
+    Each storm is an elliptical cell with a convective core, so coverage above
+    the 10 dBZ display threshold is a few percent of the grid, similar to a
+    typical active day. A margin along the west and east edges is set to
+    NODATA to mimic areas outside radar coverage.
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.uniform(-10.0, 5.0, size=(height, width)).astype(np.float32)
+
+    scale = width / CONUS_WIDTH
+    for _ in range(storms):
+        radius = rng.uniform(20, 150) * scale
+        cy = rng.uniform(0.1, 0.9) * height
+        cx = rng.uniform(0.1, 0.9) * width
+        peak = rng.uniform(30, 70)
+        aspect = rng.uniform(1.0, 3.0)
+
+        y0, y1 = int(max(cy - 2 * radius, 0)), int(min(cy + 2 * radius, height))
+        x0 = int(max(cx - 2 * radius * aspect, 0))
+        x1 = int(min(cx + 2 * radius * aspect, width))
+        yy, xx = np.mgrid[y0:y1, x0:x1]
+        dist = np.sqrt(((yy - cy) / radius) ** 2 + ((xx - cx) / (radius * aspect)) ** 2)
+        cell = peak * np.exp(-(dist**2)) + rng.normal(0, 2, size=dist.shape)
+        np.maximum(data[y0:y1, x0:x1], cell.astype(np.float32), out=data[y0:y1, x0:x1])
+
+    margin = max(width // 50, 1)
+    data[:, :margin] = NODATA
+    data[:, -margin:] = NODATA
+    return data
+
+
+def tile_trace(
+    bounds: Tuple[float, float, float, float] = CONUS_BOUNDS,
+    zooms: Tuple[int, ...] = (4, 5, 6, 7, 8),
+    seed: int = 0,
+    per_zoom: int = 64,
+) -> list:
+    """Return (z, x, y) tiles sampled from within bounds at each zoom."""
+    import morecantile
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    rng = np.random.default_rng(seed)
+    trace = []
+    for z in zooms:
+        tiles = list(tms.tiles(*bounds, zooms=[z]))
+        picks = rng.choice(len(tiles), size=min(per_zoom, len(tiles)), replace=False)
+        trace.extend((z, tiles[i].x, tiles[i].y) for i in sorted(picks))
+    return trace
+
+
+def pan_zoom_session(
+    bounds: Tuple[float, float, float, float] = CONUS_BOUNDS,
+    seed: int = 0,
+    steps: int = 30,
+    viewport: Tuple[int, int] = (6, 4),
+    zoom_range: Tuple[int, int] = (4, 9),
+) -> list:
+    """
+    Return one map session as a list of viewports, each a list of (z, x, y).
+
+    The session starts at the lowest zoom over a random point within bounds,
+    then pans by a tile or two, zooms in (more often) or out, in random
+    order. Consecutive viewports overlap like a real slippy map's requests.
+    """
+    import morecantile
+
+    tms = morecantile.tms.get("WebMercatorQuad")
+    rng = np.random.default_rng(seed)
+    west, south, east, north = bounds
+    lon = rng.uniform(west + 0.2 * (east - west), east - 0.2 * (east - west))
+    lat = rng.uniform(south + 0.2 * (north - south), north - 0.2 * (north - south))
+
+    z = zoom_range[0]
+    tile = tms.tile(lon, lat, z)
+    cx, cy = float(tile.x), float(tile.y)
+    width, height = viewport
+
+    session = []
+    for _ in range(steps):
+        x0, y0 = int(cx - width / 2), int(cy - height / 2)
+        session.append(
+            [
+                (z, x % 2**z, y)
+                for y in range(max(y0, 0), min(y0 + height, 2**z))
+                for x in range(x0, x0 + width)
+            ]
+        )
+
+        action = rng.choice(["pan", "zoom_in", "zoom_out"], p=[0.6, 0.25, 0.15])
+        if action == "zoom_in" and z < zoom_range[1]:
+            z, cx, cy = z + 1, cx * 2, cy * 2
+        elif action == "zoom_out" and z > zoom_range[0]:
+            z, cx, cy = z - 1, cx / 2, cy / 2
+        else:
+            cx += rng.integers(-2, 3)
+            cy += rng.integers(-1, 2)
+    return session
+
+
+def write_grib2(
+    path,
+    data: np.ndarray,
+    bounds: Tuple[float, float, float, float] = CONUS_BOUNDS,
+    bits_per_value: int = 16,
+):
+    """
+    Encode a north-up grid as a single-message regular_ll GRIB2 file.
+
+    Longitudes are written in 0-360 like MRMS. bounds are pixel centres.
+    """
+    import eccodes
+
+    height, width = data.shape
+    west, south, east, north = bounds
+    gid = eccodes.codes_grib_new_from_samples("regular_ll_sfc_grib2")
+    try:
+        for key, value in (
+            ("Ni", width),
+            ("Nj", height),
+            ("latitudeOfFirstGridPointInDegrees", north),
+            ("longitudeOfFirstGridPointInDegrees", west % 360),
+            ("latitudeOfLastGridPointInDegrees", south),
+            ("longitudeOfLastGridPointInDegrees", east % 360),
+            ("iDirectionIncrementInDegrees", (east - west) / (width - 1)),
+            ("jDirectionIncrementInDegrees", (north - south) / (height - 1)),
+            ("jScansPositively", 0),
+            ("bitsPerValue", bits_per_value),
+        ):
+            eccodes.codes_set(gid, key, value)
+        eccodes.codes_set_values(gid, data.ravel().astype(np.float64))
+        with open(path, "wb") as f:
+            eccodes.codes_write(gid, f)
+    finally:
+        eccodes.codes_release(gid)
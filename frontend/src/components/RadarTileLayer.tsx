@@ -10,7 +10,8 @@ export function RadarTileLayer({ timestamp }: RadarTileLayerProps) {
 
   // Using key={timestamp} forces React to unmount and remount the TileLayer
   // when timestamp changes. This clears Leaflet's internal tile cache and
-  // forces fresh tile requests. The ?t= parameter also busts browser cache.
+  // forces fresh tile requests. The timestamp in the tile URL versions the
+  // browser cache, so tiles of a given timestamp are fetched only once.
   //
   // Note: This causes a brief blink (~200-500ms) during refresh.
   // For a smoother experience, could implement double-buffered layers.
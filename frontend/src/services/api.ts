@@ -14,11 +14,10 @@ export async function fetchMetadata(): Promise<RadarMetadata> {
 }
 
 export function getTileUrl(timestamp: number | null): string {
-  const base = `${API_BASE}/tiles/{z}/{x}/{y}.png`;
-
+  // Versioned tiles are immutable, so browsers and CDNs can cache them forever
   if (timestamp) {
-    return `${base}?t=${timestamp}`;
+    return `${API_BASE}/tiles/${timestamp}/{z}/{x}/{y}.png`;
   }
 
-  return base;
+  return `${API_BASE}/tiles/{z}/{x}/{y}.png`;
 }
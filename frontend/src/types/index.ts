@@ -1,3 +1,8 @@
+export interface RadarFrame {
+  timestamp: string;
+  timestamp_unix: number;
+}
+
 export interface RadarMetadata {
   timestamp: string | null;
   timestamp_unix: number | null;
@@ -9,4 +14,6 @@ export interface RadarMetadata {
     east: number;
     north: number;
   };
+  // Animation frames, oldest first, each served at getTileUrl(timestamp_unix)
+  frames: RadarFrame[];
 }